@@ -2,14 +2,19 @@ from datetime import datetime
 from string import Template
 import sys
 import re
+import time
+import threading
+import Queue
 
 from sdetools.sdelib.commons import abc
 abstractmethod = abc.abstractmethod
 
 from sdetools.sdelib.commons import Error
 from sdetools.sdelib.commons import UsageError
+from sdetools.sdelib.commons import json
 from sdetools.sdelib.restclient import APIError
 from sdetools.sdelib.interactive_plugin import PlugInExperience
+from sdetools.alm_integration import sync_state
 
 from sdetools.sdelib import log_mgr
 logger = log_mgr.mods.add_mod(__name__)
@@ -17,8 +22,11 @@ logger = log_mgr.mods.add_mod(__name__)
 RE_CODE_DOWNLOAD = re.compile(r'\{\{ USE_MEDIA_URL \}\}([^\)]+\))\{@class=code-download\}')
 RE_TASK_IDS = re.compile('^[^\d]+\d+$')
 RE_MAP_RANGE_KEY = re.compile('^([1-9]|10)(-([1-9]|10))?$')
+RE_TITLE_TASK_ID = re.compile(r'\b([^\W\d]+\d+):')
 PUBLIC_TASK_CONTENT = ('Visit us at http://www.sdelements.com/ to find out how you can easily add project-specific '
                        'software security requirements to your existing development processes.')
+# ALM items changed shortly before the last sync started are reported again, to allow for clock skew
+SYNC_MARGIN_SECONDS = 5 * 60
 
 
 class AlmException(Error):
@@ -75,6 +83,16 @@ class AlmConnector(object):
     DEFAULT_TITLE_FORMAT = '${task_id} ${title}'
     default_priority_map = None
     feature_custom_lookup = False  # Assume the connector does not support custom lookups
+    feature_changed_tasks = False  # Assume the connector cannot tell which ALM items changed (alm_get_changed_tasks)
+    # Maximum number of concurrent calls against each system when alm_sync_workers > 1
+    # (None means as many as there are workers). Connectors whose API client is not
+    # thread-safe should set alm_max_concurrency to 1
+    alm_max_concurrency = None
+    sde_max_concurrency = None
+    # Options that change how tasks are matched or reconciled. The sync state of an
+    # incremental sync is discarded when any of them changes
+    SYNC_STATE_OPTIONS = ['alm_title_format', 'alm_context', 'conflict_policy', 'alm_standard_workflow',
+                          'sde_statuses_in_scope', 'selected_tasks']
 
     # This is an abstract base class
     __metaclass__ = abc.ABCMeta
@@ -90,6 +108,8 @@ class AlmConnector(object):
         self.ignored_tasks = []
         self.sde_plugin = PlugInExperience(self.config)
         self.alm_plugin = alm_plugin
+        self.sync_state = None
+        self._added_alm_tasks = {}
         self._add_alm_config_options()
         self.emit = self.config.emit
 
@@ -131,6 +151,16 @@ class AlmConnector(object):
                 default='')
         self.config.opts.add('alm_standard_workflow', 'Standard workflow in ALM?',
                 default='True')
+        self.config.opts.add('alm_sync_workers', 'Number of tasks to reconcile in parallel',
+                default='1')
+        self.config.opts.add('incremental_sync', 'Only synchronize tasks that changed in SD Elements '
+                'or %s since the last sync' % self.alm_name,
+                default='False')
+        self.config.opts.add('alm_remember_ids', 'Remember the %s item of each task between syncs and '
+                'fetch it directly instead of searching for it' % self.alm_name,
+                default='False')
+        self.config.opts.add('sync_state_dir', 'Directory for the state kept between syncs',
+                default=sync_state.DEFAULT_STATE_DIR)
         self.config.opts.add('alm_custom_fields', 
                 'Customized fields to include when creating a task in %s '
                 '(JSON encoded dictionary of strings)' % self.alm_name,
@@ -201,11 +231,25 @@ class AlmConnector(object):
         else:
             self.config['sde_min_priority'] = 1
 
+        try:
+            self.config['alm_sync_workers'] = int(self.config['alm_sync_workers'])
+        except (TypeError, ValueError):
+            raise AlmException('Incorrect alm_sync_workers specified in configuration. Valid values are > 0')
+        if self.config['alm_sync_workers'] < 1:
+            raise AlmException('Incorrect alm_sync_workers specified in configuration. Valid values are > 0')
+
         if self.config['test_alm'] and self.config['test_alm'] not in AlmConnector.TEST_OPTIONS:
             raise AlmException('Incorrect test_alm configuration setting. '
                                'Valid values are: %s' % ','.join(AlmConnector.TEST_OPTIONS))
 
         self.config.process_boolean_config('start_fresh')
+        self.config.process_boolean_config('incremental_sync')
+        self.config.process_boolean_config('alm_remember_ids')
+        if self.config['incremental_sync'] and not self.feature_changed_tasks:
+            logger.warning('Incremental sync is not supported for %s, synchronizing all tasks' % self.alm_name)
+            self.config['incremental_sync'] = False
+        if (self.config['incremental_sync'] or self.config['alm_remember_ids']) and not self.config['sync_state_dir']:
+            raise AlmException('Missing sync_state_dir in configuration')
         self.config.process_boolean_config('show_progress')
         self.config.process_boolean_config('how_tos_in_scope')
         self.config.process_boolean_config('alm_standard_workflow')
@@ -337,13 +381,105 @@ class AlmConnector(object):
         """
         pass
 
+    def alm_get_task_by_id(self, task, alm_id):
+        """ Returns the ALM task for the item with alm_id, remembered from a previous sync.
+
+        Returns None if the item no longer exists or is no longer the item
+        of the task, or if the connector cannot fetch items by id. The task
+        is then searched for as usual.
+
+        Raises an AlmException on encountering an error
+
+        Keyword arguments:
+        task   -- An SDE task (with ALM titles)
+        alm_id -- The id returned by get_alm_id() for the task in a previous sync
+        """
+        return None
+
+    def alm_get_remembered_task(self, task):
+        """ Fast path for alm_get_task: fetches the ALM item remembered for the task
+        by a previous sync, if any, instead of searching for it.
+
+        Returns None if nothing is remembered for the task or the remembered
+        item is gone, in which case the connector should search for it.
+        """
+        alm_id = self._get_remembered_alm_id(task)
+        if alm_id is None:
+            return None
+        alm_task = self.alm_get_task_by_id(task, alm_id)
+        if alm_task is None:
+            logger.debug('Remembered %s item %s no longer matches task %s' % (self.alm_name, alm_id, task['id']))
+        return alm_task
+
+    def _get_remembered_alm_id(self, task):
+        if not self.sync_state or not self.config['alm_remember_ids']:
+            return None
+        record = self.sync_state.get_task(task['id'])
+        if not record:
+            return None
+        return record['alm_id']
+
+    def alm_get_changed_tasks(self, tasks, since):
+        """ Returns the tasks whose ALM item changed after since, for an incremental sync.
+
+        Returns None if the connector cannot tell without looking up every
+        task, in which case all tasks are reconciled.
+
+        Raises an AlmException on encountering an error
+
+        Keyword arguments:
+        tasks -- The SDE tasks (with ALM titles) unchanged in SD Elements since the last sync
+        since -- The time the last sync started, in seconds since the epoch
+        """
+        return None
+
+    def alm_search_task(self, task):
+        """ Optionally searches the ALM for the item of a task that alm_get_task did not
+        find in its bulk-loaded index, e.g. an item whose label was removed.
+
+        alm_get_task treats the index as complete for the tasks it covers, so this is
+        only called for the tasks about to be added. Returns None if there is no item
+
+        Raises an AlmException on encountering an error
+
+        Keyword arguments:
+        task -- An SDE task (with ALM titles) that alm_get_task found no item for
+        """
+        return None
+
+    def alm_prefetch_tasks(self, tasks):
+        """ Optionally bulk-loads the ALM items for the tasks about to be synchronized,
+        so that alm_get_task can be served without a lookup per task.
+
+        Connectors overriding this usually keep an AlmTaskIndex
+
+        Raises an AlmException on encountering an error
+
+        Keyword arguments:
+        tasks -- The filtered list of SDE tasks (with ALM titles)
+        """
+        pass
+
+    def get_task_batches(self, tasks):
+        """ Splits the tasks into batches that are reconciled one after the other.
+
+        Tasks in a batch may be reconciled in parallel (see alm_sync_workers), but
+        every task of a batch is reconciled before the next batch starts. Connectors
+        that need some tasks synchronized before others override this
+
+        Keyword arguments:
+        tasks -- The list of SDE tasks to reconcile, in the order of filter_tasks
+        """
+        return [tasks]
+
     @abstractmethod
     def alm_add_task(self, task):
         """ Adds SD Elements task to the ALM tool.
 
         Returns a string representing the task in the ALM tool,
         or None if that's not possible. This string will be
-        added to a note for the task.
+        added to a note for the task. Connectors that know the
+        item they created should pass it to _record_added_task.
 
         Raises an AlmException on encountering an error.
 
@@ -352,6 +488,13 @@ class AlmConnector(object):
         """
         pass
 
+    def _record_added_task(self, task, alm_task):
+        """ Records the ALM item alm_add_task created for the task, so that its id
+        is remembered without looking the new item up
+        """
+        if self.sync_state:
+            self._added_alm_tasks[task['id']] = alm_task
+
     def alm_supports_delete(self):
         """ Returns True if Task Delete is supported by the ALM
         """
@@ -670,6 +813,11 @@ class AlmConnector(object):
           ALM is later removed in the same SDE project, then the task is
           effectively orphaned. The task must be removed manually from the
           ALM tool
+        - with incremental_sync, only the tasks that changed in SDE or
+          (as far as the connector can tell) in the ALM since the last
+          successful sync are reviewed
+        - with alm_remember_ids, the ALM item matched to a task in the
+          previous sync is fetched by its id before searching for it
 
         Raises an AlmException on encountering an error
         """
@@ -701,67 +849,44 @@ class AlmConnector(object):
 
             logger.info('Filtered tasks')
 
+            all_tasks = tasks
+            if self.config['incremental_sync'] or self.config['alm_remember_ids']:
+                sync_time = time.time()
+                self._load_sync_state()
+
+            prefetch_tasks = tasks
+            if self.config['incremental_sync'] and not self.config['start_fresh']:
+                tasks = self._get_changed_tasks(tasks)
+                # Only a few tasks are expected to change, so remembered items are fetched one by one
+                prefetch_tasks = [task for task in tasks if self._get_remembered_alm_id(task) is None]
+
+            if prefetch_tasks:
+                self.alm_prefetch_tasks(prefetch_tasks)
+
             if self.config['start_fresh']:
                 total_work = progress + len(tasks) * 2
             else:
                 total_work = progress + len(tasks)
 
-            if self.config['start_fresh']:
-                for task in tasks:
-                    alm_task = self.alm_get_task(task)
-                    if alm_task:
-                        self.alm_remove_task(alm_task)
-                    progress += 1
-                    self.output_progress(100*progress/total_work)
+            progress_state = {'done': progress}
 
-            for task in tasks:
-                tid = self._extract_task_id(task['id'])
-                progress += 1
-                self.output_progress(100*progress/total_work)
+            def task_done(messages):
+                for message in messages:
+                    self.emit.info(message)
+                progress_state['done'] += 1
+                self.output_progress(100*progress_state['done']/total_work)
 
-                alm_task = self.alm_get_task(task)
-                if alm_task:
-                    if not self.config['alm_standard_workflow']:
-                        continue
+            if self.config['start_fresh']:
+                self._run_tasks(tasks, self._remove_alm_task, task_done)
 
-                    # Exists in both SDE & ALM
-                    if not self.status_match(alm_task.get_status(), task['status']):
-                        # What takes precedence in case of a conflict of
-                        # status. Start with ALM
-                        precedence = 'alm'
-                        updated_system = 'SD Elements'
-
-                        if self.config['conflict_policy'] == 'sde':
-                            precedence = 'sde'
-                        elif self.config['conflict_policy'] == 'timestamp':
-                            sde_time = datetime.fromtimestamp(task['timestamp'])
-                            alm_time = alm_task.get_timestamp()
-                            logger.debug('Comparing timestamps for task %s - SDE: %s, ALM: %s' %
-                                          (task['id'], str(sde_time), str(alm_time)))
-                            if sde_time > alm_time:
-                                precedence = 'sde'
-
-                        status = alm_task.get_status()
-                        if precedence == 'alm':
-                            self.sde_update_task_status(task, alm_task.get_status())
-                        else:
-                            self.alm_update_task_status(alm_task, task['status'])
-                            status = task['status']
-                            updated_system = self.alm_name
-                        self.emit.info('Updated status of task %s in %s to %s' % (tid, updated_system, status))
-                else:
-                    # Only exists in SD Elements
-                    # Skip if this task should not be added to ALM
-                    if ((not self.config['selected_tasks'] and task['status'] not in self.config['sde_statuses_in_scope']) or
-                            task['id'] in self.ignored_tasks):
-                        continue
-                    ref = self.alm_add_task(task)
-                    self.emit.info('Added task %s to %s' % (tid, self.alm_name))
-                    note_msg = 'Task synchronized in %s. Reference: %s' % (self.alm_name, ref)
-                    self._add_note(task['id'], note_msg, '', task['status'])
-                    logger.debug(note_msg)
+            for batch in self.get_task_batches(tasks):
+                self._run_tasks(batch, self._reconcile_task, task_done)
+
+            if self.sync_state:
+                self.sync_state.save(sync_time, [task['id'] for task in all_tasks])
 
             logger.info('Synchronization complete')
+            self._log_connection_stats()
 
             self.alm_disconnect()
 
@@ -769,6 +894,252 @@ class AlmConnector(object):
             self.alm_disconnect()
             raise
 
+    def _load_sync_state(self):
+        key_parts = [self.config['sde_server'], self.sde_plugin.prj_id, self.alm_name,
+                     self.config.get('alm_server'), self.config['alm_project']]
+        fingerprint = json.dumps([self.config[option] for option in self.SYNC_STATE_OPTIONS])
+
+        self.sync_state = sync_state.SyncState(sync_state.get_state_path(self.config['sync_state_dir'], key_parts),
+                                               fingerprint)
+        self.sync_state.load()
+
+    def _get_changed_tasks(self, tasks):
+        """ Returns the tasks that changed in SD Elements or the ALM since the last sync """
+        if self.sync_state.last_sync is None:
+            logger.info('No previous sync state, synchronizing all tasks')
+            return tasks
+
+        changed_ids = set()
+        unchanged_tasks = []
+        for task in tasks:
+            record = self.sync_state.get_task(task['id'])
+            if (record and record['sde_timestamp'] == task['timestamp'] and
+                    record['sde_status'] == task['status'] and
+                    (record['alm_id'] is not None or not self._is_addable(task))):
+                # A task that was not added before is reconciled again once it would be added
+                unchanged_tasks.append(task)
+            else:
+                changed_ids.add(task['id'])
+
+        if unchanged_tasks:
+            alm_changed_tasks = self.alm_get_changed_tasks(unchanged_tasks, self.sync_state.last_sync)
+            if alm_changed_tasks is None:
+                logger.info('Unable to tell which issues changed in %s, synchronizing all tasks' % self.alm_name)
+                return tasks
+            changed_ids.update([task['id'] for task in alm_changed_tasks])
+
+        logger.info('Synchronizing %d of %d tasks changed since the last sync' % (len(changed_ids), len(tasks)))
+        return [task for task in tasks if task['id'] in changed_ids]
+
+    def _remember_task(self, task, alm_task, status=None):
+        """ Records the state of a reconciled task for the next incremental sync
+
+        status is the status both systems were left in, if the sync changed it
+        """
+        if not self.sync_state:
+            return
+        record = {
+            'sde_timestamp': task['timestamp'],
+            'sde_status': status or task['status'],
+            'alm_id': None,
+            'alm_status': None
+        }
+        if alm_task:
+            record['alm_id'] = alm_task.get_alm_id()
+            record['alm_status'] = status or alm_task.get_status()
+        self.sync_state.set_task(task['id'], record)
+
+    def _is_addable(self, task):
+        """ Returns True if the task is added to the ALM when it has no ALM item """
+        return bool(self.config['selected_tasks']) or task['status'] in self.config['sde_statuses_in_scope']
+
+    def _remove_alm_task(self, task):
+        """ Removes the ALM task matching the SDE task, if any """
+        self._alm_call_lock.acquire()
+        try:
+            alm_task = self.alm_get_task(task)
+            if alm_task:
+                self.alm_remove_task(alm_task)
+        finally:
+            self._alm_call_lock.release()
+        return []
+
+    def _reconcile_task(self, task):
+        """ Reconciles a single SDE task with the ALM
+
+        Returns the list of messages to emit for the task. This may run in a
+        worker thread: calls to each system are guarded by _alm_call_lock
+        and _sde_call_lock.
+        """
+        tid = self._extract_task_id(task['id'])
+
+        self._alm_call_lock.acquire()
+        try:
+            alm_task = self.alm_get_task(task)
+            if alm_task is None and self._is_addable(task) and task['id'] not in self.ignored_tasks:
+                # Make sure the task has no item the index missed before adding one
+                alm_task = self.alm_search_task(task)
+        finally:
+            self._alm_call_lock.release()
+        self._remember_task(task, alm_task)
+
+        if alm_task:
+            if not self.config['alm_standard_workflow']:
+                return []
+
+            # Exists in both SDE & ALM
+            if self.status_match(alm_task.get_status(), task['status']):
+                return []
+
+            # What takes precedence in case of a conflict of
+            # status. Start with ALM
+            precedence = 'alm'
+            updated_system = 'SD Elements'
+
+            if self.config['conflict_policy'] == 'sde':
+                precedence = 'sde'
+            elif self.config['conflict_policy'] == 'timestamp':
+                sde_time = datetime.fromtimestamp(task['timestamp'])
+                alm_time = alm_task.get_timestamp()
+                logger.debug('Comparing timestamps for task %s - SDE: %s, ALM: %s' %
+                              (task['id'], str(sde_time), str(alm_time)))
+                if sde_time > alm_time:
+                    precedence = 'sde'
+
+            status = alm_task.get_status()
+            if precedence == 'alm':
+                self._sde_call_lock.acquire()
+                try:
+                    self.sde_update_task_status(task, alm_task.get_status())
+                finally:
+                    self._sde_call_lock.release()
+            else:
+                self._alm_call_lock.acquire()
+                try:
+                    self.alm_update_task_status(alm_task, task['status'])
+                finally:
+                    self._alm_call_lock.release()
+                status = task['status']
+                updated_system = self.alm_name
+            self._remember_task(task, alm_task, status)
+            return ['Updated status of task %s in %s to %s' % (tid, updated_system, status)]
+
+        # Only exists in SD Elements
+        # Skip if this task should not be added to ALM
+        if not self._is_addable(task) or task['id'] in self.ignored_tasks:
+            return []
+
+        self._alm_call_lock.acquire()
+        try:
+            ref = self.alm_add_task(task)
+            alm_task = self._added_alm_tasks.pop(task['id'], None)
+            if self.sync_state and alm_task is None:
+                # The connector did not record the new item, so it is looked up to remember its id
+                alm_task = self.alm_get_task(task)
+        finally:
+            self._alm_call_lock.release()
+        if self.sync_state:
+            status = None
+            if self.config['alm_standard_workflow'] and task['status'] in ['DONE', 'NA']:
+                # The new item was moved to the status of the task
+                status = task['status']
+            self._remember_task(task, alm_task, status)
+        note_msg = 'Task synchronized in %s. Reference: %s' % (self.alm_name, ref)
+        self._sde_call_lock.acquire()
+        try:
+            self._add_note(task['id'], note_msg, '', task['status'])
+        finally:
+            self._sde_call_lock.release()
+        logger.debug(note_msg)
+        return ['Added task %s to %s' % (tid, self.alm_name)]
+
+    def _init_call_locks(self, workers):
+        alm_limit = self.alm_max_concurrency or workers
+        sde_limit = self.sde_max_concurrency or workers
+        self._alm_call_lock = threading.BoundedSemaphore(min(alm_limit, workers))
+        self._sde_call_lock = threading.BoundedSemaphore(min(sde_limit, workers))
+
+    def _run_tasks(self, tasks, task_func, task_done):
+        """ Applies task_func to every task, using alm_sync_workers threads
+
+        task_func returns a list of messages for the task. task_done is
+        called with these messages in the main thread, once per task and
+        in the original task order regardless of completion order. The first
+        error raised by task_func stops the run and is re-raised.
+        """
+        workers = min(self.config['alm_sync_workers'], len(tasks))
+        self._init_call_locks(max(workers, 1))
+
+        if workers <= 1:
+            for task in tasks:
+                task_done(task_func(task))
+            return
+
+        logger.info('Reconciling %d tasks using %d workers' % (len(tasks), workers))
+
+        pending = Queue.Queue()
+        for index in xrange(len(tasks)):
+            pending.put(index)
+
+        results = {}
+        errors = []
+        results_ready = threading.Condition()
+
+        def worker():
+            while not errors:
+                try:
+                    index = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    messages = task_func(tasks[index])
+                except:
+                    results_ready.acquire()
+                    errors.append(sys.exc_info())
+                    results_ready.notify()
+                    results_ready.release()
+                    return
+                results_ready.acquire()
+                results[index] = messages
+                results_ready.notify()
+                results_ready.release()
+
+        threads = []
+        for i in xrange(workers):
+            thread = threading.Thread(target=worker, name='alm-sync-%d' % i)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        next_index = 0
+        while next_index < len(tasks):
+            results_ready.acquire()
+            try:
+                while next_index not in results and not errors:
+                    results_ready.wait(1)
+                if errors:
+                    break
+                messages = results.pop(next_index)
+            finally:
+                results_ready.release()
+            task_done(messages)
+            next_index += 1
+
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            err_type, err_value, err_traceback = errors[0]
+            raise err_type, err_value, err_traceback
+
+    def _log_connection_stats(self):
+        for name, api in [('SD Elements', self.sde_plugin.api), (self.alm_name, self.alm_plugin)]:
+            if not hasattr(api, 'get_connection_stats'):
+                continue
+            stats = api.get_connection_stats()
+            if stats:
+                logger.debug('%s connection pool: %s' % (name, stats))
+
     def translate_priority(self, priority):
         """ Translates an SDE priority into a GitHub label """
         pmap = self.config[self.ALM_PRIORITY_MAP]
@@ -793,3 +1164,75 @@ class AlmConnector(object):
             else:
                 if int(key) == priority:
                     return pmap[key]
+
+
+class AlmTaskIndex(object):
+    """
+    In-memory index of bulk-fetched ALM items, keyed by the alm_fixed_title of
+    the SDE tasks being synchronized.
+
+    ALM items are matched to tasks by looking for the fixed title in the ALM
+    item title. A bulk fetch can miss items (e.g. ones whose label was
+    removed), so a task with no indexed item must still be looked up on its
+    own. A task can be invalidated (e.g. after it is changed in the ALM) so
+    that it is looked up again.
+    """
+
+    def __init__(self, tasks):
+        self._titles_by_task_id = {}
+        self._covered = set()
+        for task in tasks:
+            task_id = AlmConnector._extract_task_id(task['id'])
+            self._titles_by_task_id.setdefault(task_id, []).append(task['alm_fixed_title'])
+            self._covered.add(task['alm_fixed_title'])
+        self._items = {}
+        self._titles_by_alm_id = {}
+        # Tasks are reconciled by several workers when alm_sync_workers > 1
+        self._lock = threading.Lock()
+
+    def add(self, alm_title, item, alm_id=None):
+        """
+        Indexes an ALM item under every fixed title contained in alm_title.
+        The first item added for a fixed title is kept.
+        """
+        self._lock.acquire()
+        try:
+            for task_id in RE_TITLE_TASK_ID.findall(alm_title):
+                for fixed_title in self._titles_by_task_id.get(task_id, []):
+                    if fixed_title in self._items or fixed_title not in alm_title:
+                        continue
+                    self._items[fixed_title] = item
+                    if alm_id is not None:
+                        self._titles_by_alm_id[alm_id] = fixed_title
+        finally:
+            self._lock.release()
+
+    def covers(self, task):
+        """ Returns True if the index can answer a lookup for this task """
+        return task['alm_fixed_title'] in self._covered
+
+    def get(self, task):
+        """ Returns the indexed ALM item for task, or None if none was fetched """
+        return self._items.get(task['alm_fixed_title'])
+
+    def invalidate(self, task):
+        fixed_title = task['alm_fixed_title']
+        self._lock.acquire()
+        try:
+            self._covered.discard(fixed_title)
+            self._items.pop(fixed_title, None)
+        finally:
+            self._lock.release()
+
+    def invalidate_alm_id(self, alm_id):
+        self._lock.acquire()
+        try:
+            fixed_title = self._titles_by_alm_id.pop(alm_id, None)
+            if fixed_title is not None:
+                self._covered.discard(fixed_title)
+                self._items.pop(fixed_title, None)
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,102 @@
+"""
+State kept between ALM synchronizations.
+
+An incremental sync only looks at the tasks that changed since the previous
+sync. To tell which ones did, the state of every synchronized task (its SD
+Elements timestamp and status, and the ALM id and status it was matched to)
+is stored in a JSON file per SD Elements project and ALM project, together
+with the time the last successful sync started.
+
+The state also carries a fingerprint of the configuration that affects how
+tasks are matched and reconciled, and is ignored if that has changed.
+"""
+import os
+import threading
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from sdetools.sdelib.commons import json, atomic_write
+
+from sdetools.sdelib import log_mgr
+logger = log_mgr.mods.add_mod(__name__)
+
+STATE_VERSION = 1
+DEFAULT_STATE_DIR = os.path.join('~', '.sdetools_cache', 'sync_state')
+
+
+def get_state_path(state_dir, key_parts):
+    """ Returns the state file in state_dir for the (SD Elements, ALM) project identified by key_parts """
+    state_key = '|'.join([str(part) for part in key_parts])
+    return os.path.join(os.path.expanduser(state_dir), '%s.json' % sha1(state_key).hexdigest())
+
+
+class SyncState(object):
+    """ The state of the tasks synchronized between an SD Elements project and an ALM project """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.last_sync = None
+        self.tasks = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads the state from disk. A missing, unreadable or outdated state file
+        leaves the state empty, so that every task is synchronized.
+        """
+        try:
+            fp = open(self.path, 'r')
+        except IOError:
+            return False
+        try:
+            try:
+                state = json.load(fp)
+            except ValueError, e:
+                logger.debug('Ignoring unreadable sync state %s: %s' % (self.path, e))
+                return False
+        finally:
+            fp.close()
+
+        if state.get('version') != STATE_VERSION or state.get('fingerprint') != self.fingerprint:
+            logger.info('Sync state %s does not match the current configuration, ignoring it' % self.path)
+            return False
+
+        self.last_sync = state['last_sync']
+        self.tasks = state['tasks']
+        return True
+
+    def get_task(self, task_id):
+        return self.tasks.get(task_id)
+
+    def set_task(self, task_id, record):
+        self._lock.acquire()
+        try:
+            self.tasks[task_id] = record
+        finally:
+            self._lock.release()
+
+    def save(self, sync_time, task_ids):
+        """
+        Writes the state of the tasks in task_ids, with sync_time (seconds since
+        the epoch) as the new checkpoint. Returns False if it could not be written.
+        """
+        state = {
+            'version': STATE_VERSION,
+            'fingerprint': self.fingerprint,
+            'last_sync': sync_time,
+            'tasks': dict((task_id, self.tasks[task_id]) for task_id in task_ids if task_id in self.tasks)
+        }
+        state_dir = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(state_dir):
+                os.makedirs(state_dir)
+            atomic_write(self.path, json.dumps(state))
+        except (IOError, OSError), e:
+            logger.warning('Unable to write sync state %s: %s' % (self.path, e))
+            return False
+
+        self.last_sync = sync_time
+        return True
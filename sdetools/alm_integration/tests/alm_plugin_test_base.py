@@ -1,5 +1,7 @@
 import re
 import os
+import shutil
+import tempfile
 
 from datetime import datetime
 from sdetools.sdelib.mod_mgr import ReturnChannel, load_modules
@@ -81,6 +83,18 @@ class AlmPluginTestBase(object):
         self.mock_alm_response.teardown()
         self.mock_sde_response.teardown()
 
+    def count_api_calls(self):
+        """ Records the target of every later ALM API call in the returned list """
+        api_calls = []
+        call_api = self.connector.alm_plugin.call_api
+
+        def counting_call_api(target, *args, **kwargs):
+            api_calls.append(target)
+            return call_api(target, *args, **kwargs)
+
+        self.connector.alm_plugin.call_api = counting_call_api
+        return api_calls
+
     def test_parsing_alm_task(self):
         # Verify that none of the abstract methods inherited from AlmTask will break.
         # This test can be extended to verify the contents of task.
@@ -570,6 +584,187 @@ class AlmPluginTestBase(object):
         # Verify no exceptions are thrown
         self.connector.synchronize()
 
+    def test_synchronize_with_workers(self):
+        self.connector.config['alm_sync_workers'] = '4'
+        self.connector.config['alm_phases'] = ['requirements', 'testing', 'development']
+        self.connector.initialize()
+        self.mock_sde_response.clear_tasks()
+        test_tasks = []
+        for i in xrange(6):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+
+        class EmitRecorder(object):
+            def __init__(self):
+                self.messages = []
+
+            def info(self, msg):
+                self.messages.append(msg)
+
+        self.connector.emit = EmitRecorder()
+        self.connector.synchronize()
+
+        emitted_ids = [re.search('task (\S+)', msg).group(1) for msg in self.connector.emit.messages]
+        task_ids = [AlmConnector._extract_task_id(task['id'])
+                    for task in self.connector.filter_tasks(self.connector.sde_get_tasks())]
+        self.assertEqual([tid for tid in task_ids if tid in emitted_ids], emitted_ids,
+                         'Messages emitted out of task order: %s' % self.connector.emit.messages)
+        for test_task in test_tasks:
+            self.assertNotNone(self.connector.alm_get_task(test_task), 'Expected task %s in ALM' % test_task['id'])
+
+    def test_incremental_sync(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        self.connector.config['incremental_sync'] = 'True'
+        self.connector.config['sync_state_dir'] = state_dir
+        # ALM changes are reported by the stubbed alm_get_changed_tasks
+        self.connector.feature_changed_tasks = True
+        self.connector.initialize()
+        test_task = self.mock_sde_response.generate_sde_task()
+        self.connector.synchronize()
+        self.assertEqual(len(os.listdir(state_dir)), 1, 'Expected one sync state file')
+
+        lookups = []
+        alm_get_task = self.connector.alm_get_task
+
+        def counting_alm_get_task(task):
+            lookups.append(task['id'])
+            return alm_get_task(task)
+
+        self.connector.alm_get_task = counting_alm_get_task
+        self.connector.alm_get_changed_tasks = lambda tasks, since: []
+        self.connector.synchronize()
+        self.assertEqual(lookups, [], 'Expected no lookups for unchanged tasks, got: %s' % lookups)
+
+        # A task changed in SD Elements
+        task_number = test_task['id'].split('-T')[1]
+        self.mock_sde_response.get_response_generator().generator_update_resource(
+            'task', task_number, {'timestamp': 'changed-%s' % test_task['timestamp']})
+        self.connector.synchronize()
+        self.assertEqual(set(lookups), set([test_task['id']]))
+
+        # A task changed in the ALM
+        del lookups[:]
+        self.connector.alm_get_changed_tasks = lambda tasks, since: [task for task in tasks
+                                                                     if task['id'] == test_task['id']]
+        self.connector.synchronize()
+        self.assertEqual(set(lookups), set([test_task['id']]))
+
+        # Without a way to tell what changed in the ALM every task is looked up
+        del lookups[:]
+        self.connector.alm_get_changed_tasks = lambda tasks, since: None
+        self.connector.synchronize()
+        self.assertEqual(len(lookups), len(self.connector.filter_tasks(self.connector.sde_get_tasks())))
+
+    def test_incremental_sync_unsupported(self):
+        self.connector.config['incremental_sync'] = 'True'
+        self.connector.feature_changed_tasks = False
+        self.connector.initialize()
+        self.assertFalse(self.connector.config['incremental_sync'],
+                         'Expected incremental sync to be turned off without alm_get_changed_tasks')
+
+    def test_incremental_sync_selected_tasks(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        self.connector.config['incremental_sync'] = 'True'
+        self.connector.config['sync_state_dir'] = state_dir
+        # ALM changes are reported by the stubbed alm_get_changed_tasks
+        self.connector.feature_changed_tasks = True
+        self.connector.initialize()
+        test_task = self.mock_sde_response.generate_sde_task(status='DONE')
+        test_task = AlmConnector.add_alm_title(self.config, test_task)
+        self.connector.synchronize()
+        self.assertEqual(self.connector.alm_get_task(test_task), None, 'Did not expect a DONE task in ALM')
+
+        # A task that was out of scope is added once it is selected
+        self.connector.config['selected_tasks'] = AlmConnector._extract_task_id(test_task['id'])
+        self.connector.initialize()
+        self.connector.alm_get_changed_tasks = lambda tasks, since: []
+        self.connector.synchronize()
+        self.assertNotNone(self.connector.alm_get_task(test_task), 'Expected the selected task in ALM')
+
+    def test_alm_get_task_by_id(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for i in xrange(2):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+            self.connector.alm_add_task(test_tasks[-1])
+        alm_task = self.connector.alm_get_task(test_tasks[0])
+
+        task_by_id = self.connector.alm_get_task_by_id(test_tasks[0], alm_task.get_alm_id())
+        self.assertNotNone(task_by_id, 'Expected to fetch item %s by id' % alm_task.get_alm_id())
+        self.assertEqual(task_by_id.get_alm_id(), alm_task.get_alm_id())
+        self.assertEqual(task_by_id.get_status(), alm_task.get_status())
+
+        # The item of another task is not taken
+        self.assertEqual(self.connector.alm_get_task_by_id(test_tasks[1], alm_task.get_alm_id()), None)
+
+    def test_remember_alm_ids(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        self.connector.config['alm_remember_ids'] = 'True'
+        self.connector.config['sync_state_dir'] = state_dir
+        self.connector.initialize()
+        test_task = self.mock_sde_response.generate_sde_task()
+        test_task = AlmConnector.add_alm_title(self.config, test_task)
+
+        # Without pre-fetched items every lookup goes through alm_get_task
+        self.connector.alm_prefetch_tasks = lambda tasks: None
+        self.connector.synchronize()
+        alm_id = self.connector.sync_state.get_task(test_task['id'])['alm_id']
+        self.assertNotNone(alm_id, 'Expected the id of the added item to be remembered')
+
+        requested_ids = []
+        alm_get_task_by_id = self.connector.alm_get_task_by_id
+
+        def recording_alm_get_task_by_id(task, alm_id):
+            requested_ids.append(alm_id)
+            return alm_get_task_by_id(task, alm_id)
+
+        self.connector.alm_get_task_by_id = recording_alm_get_task_by_id
+        self.connector.alm_connect()
+        alm_task = self.connector.alm_get_task(test_task)
+        self.assertEqual(requested_ids, [alm_id])
+        self.assertEqual(alm_task.get_alm_id(), alm_id)
+
+    def test_remember_added_alm_ids(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        self.connector.config['alm_remember_ids'] = 'True'
+        self.connector.config['sync_state_dir'] = state_dir
+        self.connector.initialize()
+        test_task = self.mock_sde_response.generate_sde_task()
+        test_task = AlmConnector.add_alm_title(self.config, test_task)
+
+        calls = []
+        alm_add_task = self.connector.alm_add_task
+        alm_get_task = self.connector.alm_get_task
+
+        def recording_alm_add_task(task):
+            ref = alm_add_task(task)
+            calls.append(('add', task['id']))
+            return ref
+
+        def recording_alm_get_task(task):
+            calls.append(('get', task['id']))
+            return alm_get_task(task)
+
+        self.connector.alm_add_task = recording_alm_add_task
+        self.connector.alm_get_task = recording_alm_get_task
+        self.connector.synchronize()
+
+        # The added item is remembered without looking it up again
+        added_index = calls.index(('add', test_task['id']))
+        self.assertFalse(('get', test_task['id']) in calls[added_index:])
+        alm_id = self.connector.sync_state.get_task(test_task['id'])['alm_id']
+        self.assertEqual(alm_id, alm_get_task(test_task).get_alm_id())
+
+    def test_invalid_sync_workers(self):
+        self.connector.config['alm_sync_workers'] = '0'
+        exception_msg = 'Incorrect alm_sync_workers specified in configuration'
+        self.assert_exception(AlmException, '', exception_msg, self.connector.initialize)
+
     def test_api_exceptions_are_handled(self):
         # Check that all api exceptions are properly handled
         for api_target, mock_flag in self.response_generator.rest_api_targets.iteritems():
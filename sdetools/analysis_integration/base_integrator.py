@@ -1,17 +1,25 @@
 #!/usr/bin/python
-import collections
 import re
 import xml
 import os
+import copy
 import glob
+import time
 import zipfile
 from datetime import datetime
 from xml.sax.handler import ContentHandler
-from sdetools.extlib.defusedxml import minidom, sax
+from sdetools.extlib.defusedxml import sax
 
 from sdetools.sdelib.commons import Error, abc, UsageError
 from sdetools.sdelib.restclient import APIError
 from sdetools.sdelib.interactive_plugin import PlugInExperience
+from sdetools.analysis_integration import mapping_cache
+
+try:
+    import multiprocessing
+except ImportError:
+    # Python 2.5 and prior can only parse reports one at a time
+    multiprocessing = None
 
 abstractmethod = abc.abstractmethod
 
@@ -19,10 +27,75 @@ from sdetools.sdelib import log_mgr
 logger = log_mgr.mods.add_mod(__name__)
 
 
+# Number of bytes read from the start of a report to detect its type
+SNIFF_SIZE = 8 * 1024
+
+
 class IntegrationError(Error):
     pass
 
 
+class _RootElementFound(Exception):
+    pass
+
+
+class _RootElementSniffer(ContentHandler):
+
+    def __init__(self):
+        ContentHandler.__init__(self)
+        self.root = None
+
+    def startElement(self, name, attrs):
+        self.root = name
+        raise _RootElementFound()
+
+
+def sniff_xml_root(header):
+    """
+    Returns the name of the root element of the XML document starting with header,
+    or None if the root element does not begin within header
+    """
+    sniffer = _RootElementSniffer()
+    parser = sax.make_parser()
+    parser.setContentHandler(sniffer)
+    try:
+        parser.feed(header)
+    except _RootElementFound:
+        return sniffer.root
+    except (xml.sax.SAXException, xml.sax.SAXParseException), se:
+        raise IntegrationError("Could not parse xml source %s" % se)
+    return None
+
+
+def _parse_report_worker(job):
+    """ Parses a single report file in a parse_workers process """
+    importer, report_file = job
+    start_time = time.time()
+    importer.parse(report_file)
+    return importer.findings, importer.id, time.time() - start_time
+
+
+def read_report_header(report_file):
+    """ Returns the first SNIFF_SIZE bytes of a report file name or file object """
+    if isinstance(report_file, basestring):
+        try:
+            fp = open(report_file, 'rb')
+        except IOError, ioe:
+            raise IntegrationError("Could not open file '%s': %s" % (report_file, ioe))
+        try:
+            return fp.read(SNIFF_SIZE)
+        finally:
+            fp.close()
+
+    try:
+        report_file.seek(0)
+        header = report_file.read(SNIFF_SIZE)
+        report_file.seek(0)
+    except (IOError, ValueError), e:
+        raise IntegrationError("Could not read file '%s': %s" % (report_file, e))
+    return header
+
+
 class IntegrationResult(object):
     def __init__(self, import_start_datetime, import_finish_datetime, affected_tasks, noflaw_tasks,
             error_count, error_weaknesses_unmapped):
@@ -34,6 +107,74 @@ class IntegrationResult(object):
         self.error_weaknesses_unmapped = error_weaknesses_unmapped
 
 
+class FindingCounter(object):
+    """
+    Aggregates findings as they are reported. Findings with the same weakness id and
+    description are merged into a single finding whose count is the sum of their
+    counts, so memory is proportional to the number of distinct weaknesses rather
+    than the number of instances. The first finding seen for a weakness is kept as
+    its representative. instance_count is the number of instances reported, which
+    is the sum of the counts of the findings.
+    """
+
+    def __init__(self, id_key='weakness_id', description_key='description'):
+        self.id_key = id_key
+        self.description_key = description_key
+        self.entries = {}
+        self.instance_count = 0
+
+    def append(self, finding):
+        key = (finding[self.id_key], finding.get(self.description_key))
+        count = finding.get('count', 1)
+        if key in self.entries:
+            self.entries[key]['count'] += count
+        else:
+            entry = dict(finding)
+            entry['count'] = count
+            self.entries[key] = entry
+        self.instance_count += count
+
+    def extend(self, findings):
+        for finding in findings:
+            self.append(finding)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        keys = self.entries.keys()
+        keys.sort()
+        for key in keys:
+            yield self.entries[key]
+
+
+class ProjectTaskIndex(object):
+    """
+    Index of the tasks of a project by task number (e.g. '36' for task '1-T36'),
+    built once from the task list so that lookups do not rescan the project tasks
+    """
+    TASK_ID_RE = re.compile(r'^(\d+)-T(\d+)$')
+
+    def __init__(self, project_tasks):
+        self.tasks = []  # (task number, phase) in project task order
+        self.phases = {}
+        for task in project_tasks:
+            task_search = self.TASK_ID_RE.match(task['id'])
+            if task_search:
+                task_id = task_search.group(2)
+                self.tasks.append((task_id, task['phase']))
+                self.phases[task_id] = task['phase']
+
+    def __contains__(self, task_id):
+        return task_id in self.phases
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def get_phase(self, task_id):
+        return self.phases.get(task_id)
+
+
 class BaseImporter(object):
 
     findings = []
@@ -54,6 +195,13 @@ class BaseImporter(object):
     def can_parse_file(self):
         return False
 
+    def sniff(self, header):
+        """
+        Returns True or False if the header (first bytes of a report) tells whether this
+        importer can parse the report, or None if a full parse is needed to tell
+        """
+        return None
+
 
 class BaseContentHandler(ContentHandler, BaseImporter):
 
@@ -95,38 +243,86 @@ class BaseZIPImporter(BaseImporter):
     def detect_req_importer(self, report_file):
         """
         Examine all available importers scoped for this ZIP importer:
-            - iterate over all zipped files
+            - sniff the head of the zipped files matching each importer's pattern
+            - fall back to processing the archive when an importer can not tell
+              from the head of the file
             - return the first importer that can open report_file
+
+        The detected importer is left registered so that parse only processes
+        the archive once.
         """
-        req_importer = None
+        try:
+            results_archive = zipfile.ZipFile(report_file, "r")
+        except (zipfile.BadZipfile, zipfile.LargeZipFile):
+            return None
+
+        req_item = None
         for item in self.available_importers:
-            if req_importer:
+            logger.debug("Trying to import file using %s" % item['importer'])
+
+            detected = self._sniff_archive(results_archive, item)
+            if detected is None:
+                detected = self._parse_archive(report_file, item)
+            if detected:
+                req_item = item
                 break
+        results_archive.close()
 
-            logger.debug("Trying to import file using %s" % item['importer'])
+        self.clear()
+        if req_item:
+            self.register_importer_for_pattern(req_item['pattern'], req_item['importer'])
+            self.detected_req_importer = req_item['importer']
+        return self.detected_req_importer
 
-            self.clear()
-            self.register_importer_for_pattern(item['pattern'], item['importer'])
-            try:
-                self.process_archive(report_file)
-            except IntegrationError:
-                # This is not the importer we're looking for
+    def _sniff_archive(self, results_archive, item):
+        detected = False
+        for file_name in results_archive.namelist():
+            if not re.match(item['pattern'], file_name):
                 continue
+            header = self._read_archived_header(results_archive, file_name)
+            if header is None:
+                file_detected = None
+            else:
+                try:
+                    file_detected = item['importer'].sniff(header)
+                except IntegrationError:
+                    file_detected = False
+            if file_detected:
+                return True
+            elif file_detected is None:
+                detected = None
+        return detected
 
-            for file_name, importer in self.IMPORTERS.items():
-                if not req_importer and importer.get_parse_was_successful():
-                    req_importer = importer
-                importer.clear()
+    def _read_archived_header(self, archive, file_name):
+        if hasattr(archive, 'open'):
+            archived_file = archive.open(file_name)
+            try:
+                return archived_file.read(SNIFF_SIZE)
+            finally:
+                archived_file.close()
 
-        self.detected_req_importer = req_importer
-        return self.detected_req_importer
+        # Python 2.5 and prior must read the whole file into memory
+        if archive.getinfo(file_name).file_size > self.MAX_MEMORY_SIZE_IN_MB * 1024 * 1024:
+            return None
+        return archive.read(file_name)[:SNIFF_SIZE]
 
-    def can_parse_file(self, report_file):
+    def _parse_archive(self, report_file, item):
+        self.clear()
+        self.register_importer_for_pattern(item['pattern'], item['importer'])
         try:
-            results_archive = zipfile.ZipFile(report_file, "r")
-        except zipfile.BadZipfile, zipfile.LargeZipFile:
+            self.process_archive(report_file)
+        except IntegrationError:
+            # This is not the importer we're looking for
             return False
 
+        detected = False
+        for file_name, importer in self.IMPORTERS.items():
+            if importer.get_parse_was_successful():
+                detected = True
+            importer.clear()
+        return detected
+
+    def can_parse_file(self, report_file):
         return self.detect_req_importer(report_file) is not None
 
     def process_archive(self, zip_archive):
@@ -204,6 +400,7 @@ class BaseZIPImporter(BaseImporter):
         self.IMPORTERS[file_name] = importer
 
     def parse(self, zip_file):
+        self.findings = []
         self.process_archive(zip_file)
         build_ids = []
         for file_name in self.IMPORTERS.keys():
@@ -214,6 +411,7 @@ class BaseZIPImporter(BaseImporter):
 
 
 class BaseXMLImporter(BaseImporter):
+    ROOT_ELEMENTS = []  # Root element names of the reports handled, if known
 
     def __init__(self):
         super(BaseXMLImporter, self).__init__()
@@ -277,7 +475,22 @@ class BaseXMLImporter(BaseImporter):
     def get_parse_was_successful(self):
         return self.last_parse_indicator
 
+    def sniff(self, header):
+        if not self.ROOT_ELEMENTS:
+            return None
+        root = sniff_xml_root(header)
+        if root is None:
+            return None
+        return root in self.ROOT_ELEMENTS
+
     def can_parse_file(self, xml_file):
+        try:
+            detected = self.sniff(read_report_header(xml_file))
+        except IntegrationError:
+            return False
+        if detected is not None:
+            return detected
+
         try:
             self.parse(xml_file)
         except IntegrationError:
@@ -300,6 +513,7 @@ class BaseIntegrator(object):
         self.findings = []
         self.phase_exceptions = ['testing']
         self.mapping = {}
+        self.mapped_task_ids = None
         self.report_id = "Not specified"
         self.config = config
         self.emit = self.config.emit
@@ -310,6 +524,7 @@ class BaseIntegrator(object):
         self.taskstatuses = {}
         self.plugin = PlugInExperience(self.config)
         self.supported_file_types = supported_file_types
+        self.detected_importers = {}
 
         if supported_file_types:
             self.config.opts.add(
@@ -320,10 +535,18 @@ class BaseIntegrator(object):
                     "report_type",
                     "%s Report Type: %s|auto" % (tool_name.capitalize(), ', '.join(supported_file_types)),
                     default="auto")
+            self.config.opts.add(
+                    "parse_workers",
+                    "Number of report files to parse in parallel processes",
+                    default="1")
         self.config.opts.add(
                 "mapping_file",
                 "Task ID -> Tool Weakness mapping in XML format",
                 "m", default_mapping_file)
+        self.config.opts.add(
+                "mapping_cache_dir",
+                "Directory for compiled mapping files (leave blank to always parse the mapping XML)",
+                default=mapping_cache.DEFAULT_CACHE_DIR)
         self.config.opts.add(
                 "import_behaviour",
                 "One of the following: %s" % ', '.join(BaseIntegrator.VALID_IMPORT_BEHAVIOUR),
@@ -378,6 +601,13 @@ class BaseIntegrator(object):
             elif self.config['report_type'] != 'auto':
                 raise UsageError('Invalid report_type %s' % self.config['report_type'])
 
+            try:
+                self.config['parse_workers'] = int(self.config['parse_workers'])
+            except (TypeError, ValueError):
+                raise UsageError('Incorrect parse_workers specified in configuration. Valid values are > 0')
+            if self.config['parse_workers'] < 1:
+                raise UsageError('Incorrect parse_workers specified in configuration. Valid values are > 0')
+
             self.process_report_file_config()
 
     def _setup_taskstatuses(self):
@@ -386,28 +616,54 @@ class BaseIntegrator(object):
             self.taskstatuses[status['slug']] = status
 
     def detect_importer(self, report_file):
+        cache_key = self._get_detection_key(report_file)
+        if cache_key is not None and cache_key in self.detected_importers:
+            return self.detected_importers[cache_key]
+
+        detected_importer = None
         for item in self.AVAILABLE_IMPORTERS:
             if item['importer'].can_parse_file(report_file):
-                return item['importer']
-        return None
+                detected_importer = item['importer']
+                break
+
+        if cache_key is not None:
+            self.detected_importers[cache_key] = detected_importer
+        return detected_importer
+
+    @staticmethod
+    def _get_detection_key(report_file):
+        """ Report files are identified by path, size and mtime. File objects are not cached """
+        if not isinstance(report_file, basestring):
+            return None
+        try:
+            stat = os.stat(report_file)
+        except OSError:
+            return None
+        return (os.path.abspath(report_file), stat.st_size, stat.st_mtime)
 
     @staticmethod
     def _get_file_extension(file_path):
         return os.path.splitext(file_path)[1][1:]
 
-    @abstractmethod
+    def get_importer(self, report_file, report_type):
+        """
+        Returns the importer for a single report file. It is always called in this
+        process, so that parse_workers processes only run the importer's parse
+        """
+        raise UsageError("Unsupported file type (%s)" % report_type)
+
     def parse_report_file(self, report_file, report_type):
         """ Returns the raw findings and the report id for a single report file """
+        importer = self.get_importer(report_file, report_type)
+        importer.parse(report_file)
 
-        return [], None
+        return importer.findings, importer.id
 
     def set_tool_name(self, tool_name):
         self.TOOL_NAME = tool_name
 
     def parse(self):
-        _raw_findings = []
-        _report_ids = []
-
+        reports = []
         for report_file in self.config['report_file']:
             if self.config['report_type'] == 'auto':
                 if not isinstance(report_file, basestring):
@@ -415,9 +671,23 @@ class BaseIntegrator(object):
                 report_type = self._get_file_extension(report_file)
             else:
                 report_type = self.config['report_type']
+            reports.append((report_file, report_type))
 
-            raw_findings, report_id = self.parse_report_file(report_file, report_type)
+        parse_workers = self.config['parse_workers']
+        if parse_workers > 1 and len(reports) > 1 and multiprocessing is None:
+            logger.warning('Parallel parsing is not available. Parsing report files one at a time')
+            parse_workers = 1
 
+        if parse_workers > 1 and len(reports) > 1:
+            results = self._parse_report_files_in_pool(reports, parse_workers)
+        else:
+            results = [self._parse_timed_report_file(report_file, report_type)
+                       for report_file, report_type in reports]
+
+        # Results are in the same order as the report files regardless of the parse mode
+        _raw_findings = []
+        _report_ids = []
+        for raw_findings, report_id in results:
             _raw_findings.extend(raw_findings)
 
             if report_id:
@@ -431,6 +701,48 @@ class BaseIntegrator(object):
             self.report_id = "Not specified"
             self.emit.info("Report ID not found in report: Using default.")
 
+    def _parse_timed_report_file(self, report_file, report_type):
+        start_time = time.time()
+        raw_findings, report_id = self.parse_report_file(report_file, report_type)
+        self._log_parse_time(report_file, raw_findings, time.time() - start_time)
+        return raw_findings, report_id
+
+    @staticmethod
+    def _log_parse_time(report_file, raw_findings, elapsed):
+        logger.info("Parsed %s in %.2f seconds (%d findings)" % (report_file, elapsed, len(raw_findings)))
+
+    def _parse_report_files_in_pool(self, reports, parse_workers):
+        """
+        Parses report files with a pool of parse_workers processes. File objects
+        can not be handed to another process and are parsed in this one.
+        """
+        results = [None] * len(reports)
+        jobs = []
+        job_indexes = []
+        for index, (report_file, report_type) in enumerate(reports):
+            if not isinstance(report_file, basestring):
+                results[index] = self._parse_timed_report_file(report_file, report_type)
+                continue
+            # Importers may be shared between report files, so each job gets its own copy
+            jobs.append((copy.deepcopy(self.get_importer(report_file, report_type)), report_file))
+            job_indexes.append(index)
+
+        if jobs:
+            logger.info("Parsing %d report files with %d workers" % (len(jobs), parse_workers))
+            pool = multiprocessing.Pool(min(parse_workers, len(jobs)))
+            try:
+                job_results = pool.map(_parse_report_worker, jobs)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+
+            for index, (raw_findings, report_id, elapsed) in zip(job_indexes, job_results):
+                self._log_parse_time(reports[index][0], raw_findings, elapsed)
+                results[index] = (raw_findings, report_id)
+
+        return results
+
     def process_report_file_config(self):
         """
         If report files contains a directory path, find all possible files in that folder
@@ -473,29 +785,27 @@ class BaseIntegrator(object):
 
     def load_mapping_from_xml(self):
         try:
-            base = minidom.parse(self.config['mapping_file'])
+            mapping_file = self.config['mapping_file']
         except KeyError:
             raise IntegrationError("Missing configuration option 'mapping_file'")
+
+        try:
+            cache_dir = self.config['mapping_cache_dir']
+        except KeyError:
+            cache_dir = ''
+
+        try:
+            index = mapping_cache.load_mapping(mapping_file, self.weakness_map_identifier, cache_dir)
         except Exception, e:
-            raise IntegrationError("An error occurred opening mapping file '%s': %s" % (self.config['mapping_file'], e))
+            raise IntegrationError("An error occurred opening mapping file '%s': %s" % (mapping_file, e))
 
-        weakness_mapping = collections.defaultdict(list)
-        self.weakness_title = {}
-        self.confidence = {}
-        self.weakness_type = {}
-        for task in base.getElementsByTagName('task'):
-            if task.attributes.has_key('confidence'):
-                self.confidence[task.attributes['id'].value] = task.attributes['confidence'].value
-
-            for weakness in task.getElementsByTagName('weakness'):
-                weakness_id = weakness.attributes[self.weakness_map_identifier].value
-                weakness_mapping[weakness_id].append(task.attributes['id'].value)
-                self.weakness_type[weakness_id] = weakness.attributes['type'].value
-                self.weakness_title[weakness_id] = weakness.attributes['title'].value
-
-        self.mapping = weakness_mapping
+        self.weakness_title = index.weakness_title
+        self.confidence = index.confidence
+        self.weakness_type = index.weakness_type
+        self.mapping = index.mapping
+        self.mapped_task_ids = None
         if not self.mapping:
-            raise IntegrationError("No mapping was found in file '%s'" % self.config['mapping_file'])
+            raise IntegrationError("No mapping was found in file '%s'" % mapping_file)
 
     def generate_findings(self):
         return []
@@ -505,21 +815,25 @@ class BaseIntegrator(object):
         Return a map (task_id=> *flaw) based on list of findings (weakness)
 
         Where flaw is defined as:
-            flaw[weaknesses]
+            flaw[weaknesses] - a FindingCounter of the findings mapped to the task
             flaw[related_tasks]
+
+        The 'nomap' entry maps each weakness that maps to no task to its number of findings
         """
-        unique_findings = {'nomap': []}
+        unique_findings = {'nomap': {}}
         for finding in self.generate_findings():
             weakness_id = finding['weakness_id']
             mapped_tasks = self.lookup_task(weakness_id)
             if not mapped_tasks:
-                unique_findings['nomap'].append(weakness_id)
+                # Findings merged by the importer stand for count instances
+                unmapped_counts = unique_findings['nomap']
+                unmapped_counts[weakness_id] = unmapped_counts.get(weakness_id, 0) + finding.get('count', 1)
                 continue
             for mapped_task_id in mapped_tasks:
                 if unique_findings.has_key(mapped_task_id):
                     flaws = unique_findings[mapped_task_id]
                 else:
-                    flaws = {'weaknesses': []}
+                    flaws = {'weaknesses': FindingCounter()}
                 flaws['weaknesses'].append(finding)
                 flaws['related_tasks'] = mapped_tasks
                 unique_findings[mapped_task_id] = flaws
@@ -534,24 +848,23 @@ class BaseIntegrator(object):
 
     def task_exists_in_project_tasks(self, task_id, project_tasks):
         """
-        Return True if task_id is present in the array of project_tasks, False otherwise
+        Return True if task_id is present in project_tasks, False otherwise
 
-        task_id is an integer
-        project_tasks is an array of maps. Each map contains a key 'id' with a corresponding integer value
+        task_id is a task number string (e.g. '36')
+        project_tasks is a ProjectTaskIndex, or an array of maps each containing a key 'id'
+        (e.g. '1-T36'). Pass an index when checking many tasks against the same project
         """
-        for task in project_tasks:
-            task_search = re.search('^(\d+)-T(\d+)$', task['id'])
-            if task_search:
-                project_task_id = task_search.group(2)
-                if project_task_id == task_id:
-                    return True
-        return False
+        if not isinstance(project_tasks, ProjectTaskIndex):
+            project_tasks = ProjectTaskIndex(project_tasks)
+        return task_id in project_tasks
 
     def mapping_contains_task(self, needle_task_id):
-        for task_id in self.mapping.values():
-            if needle_task_id == task_id:
-                return True
-        return False
+        if self.mapped_task_ids is None:
+            self.mapped_task_ids = {}
+            for task_ids in self.mapping.itervalues():
+                for task_id in task_ids:
+                    self.mapped_task_ids[task_id] = True
+        return needle_task_id in self.mapped_task_ids
 
     def import_findings(self):
         stats_failures_added = 0
@@ -574,6 +887,7 @@ class BaseIntegrator(object):
         task_list = self.plugin.get_task_list()
         logger.debug("Retrieved %d tasks from %s/%s" %
             (len(task_list), self.config['sde_application'], self.config['sde_project']))
+        task_index = ProjectTaskIndex(task_list)
 
         unique_findings = self.unique_findings()
         missing_weakness_map = unique_findings['nomap']
@@ -584,7 +898,7 @@ class BaseIntegrator(object):
         for task_id in task_ids:
             finding = unique_findings[task_id]
 
-            if not self.task_exists_in_project_tasks(task_id, task_list):
+            if task_id not in task_index:
                 logger.debug("Task %s not found in project tasks" % task_id)
                 mapped_tasks = self.lookup_task("*")
                 if mapped_tasks:
@@ -595,8 +909,7 @@ class BaseIntegrator(object):
                         if not unique_findings.has_key(new_task_id):
                             unique_findings[new_task_id] = finding
                         else:
-                            for weakness in finding['weaknesses']:
-                                unique_findings[new_task_id]['weaknesses'].append(weakness)
+                            unique_findings[new_task_id]['weaknesses'].extend(finding['weaknesses'])
                         del unique_findings[task_id]
 
         task_ids = sorted(unique_findings.iterkeys())
@@ -604,13 +917,13 @@ class BaseIntegrator(object):
         for task_id in task_ids:
             finding = unique_findings[task_id]
 
-            stats_total_flaws_found += len(finding['weaknesses'])
+            stats_total_flaws_found += finding['weaknesses'].instance_count
 
-            if not self.task_exists_in_project_tasks(task_id, task_list):
+            if task_id not in task_index:
                 logger.error("Task %s was not found in the project, skipping %d findings." %
-                             (task_id, len(finding['weaknesses'])))
+                             (task_id, finding['weaknesses'].instance_count))
                 stats_total_skips += 1
-                stats_total_skips_findings += len(finding['weaknesses'])
+                stats_total_skips_findings += finding['weaknesses'].instance_count
                 continue
 
             task_name = "T%s" % task_id
@@ -619,7 +932,7 @@ class BaseIntegrator(object):
             last_weakness = None
             weakness_finding = {}
 
-            for weakness in sorted(finding['weaknesses']):
+            for weakness in finding['weaknesses']:
 
                 if 'description' in weakness:
                     weakness_description = weakness['description']
@@ -643,10 +956,7 @@ class BaseIntegrator(object):
 
                     last_weakness = weakness_description
 
-                if 'count' in weakness:
-                    weakness_finding['count'] += weakness['count']
-                else:
-                    weakness_finding['count'] += 1
+                weakness_finding['count'] += weakness['count']
             if len(finding.items()) > 0:
                 analysis_findings.append(weakness_finding)
 
@@ -666,21 +976,16 @@ class BaseIntegrator(object):
                 stats_api_errors += 1
 
         stats_passes_added = 0
-        stats_test_tasks = 0
 
         affected_tasks = []
         noflaw_tasks = []
-        for task in task_list:
-            if task['phase'] in self.phase_exceptions:
-                stats_test_tasks += 1
+        for task_id, phase in task_index.tasks:
+            if phase in self.phase_exceptions:
                 continue
-            task_search = re.search('^(\d+)-T(\d+)$', task['id'])
-            if task_search:
-                task_id = task_search.group(2)
-                if unique_findings.has_key(task_id):
-                    affected_tasks.append(task_id)
-                    continue
-                noflaw_tasks.append(task_id)
+            if unique_findings.has_key(task_id):
+                affected_tasks.append(task_id)
+                continue
+            noflaw_tasks.append(task_id)
 
         if not self.config['flaws_only']:
             for task_id in noflaw_tasks:
@@ -708,10 +1013,11 @@ class BaseIntegrator(object):
                     self.emit.error("API Error: Unable to mark %s as PASS. Skipping ..." % (task_name))
                     stats_api_errors += 1
 
+        unmapped_flaw_count = sum(missing_weakness_map.itervalues())
         if missing_weakness_map:
-            self.emit.error("Could not map %s flaws" % (len(missing_weakness_map)),
+            self.emit.error("Could not map %s flaws" % unmapped_flaw_count,
                 err_type='unmapped_weakness',
-                weakness_list=missing_weakness_map)
+                weakness_list=sorted(missing_weakness_map.iterkeys()))
         else:
             self.emit.info("All flaws successfully mapped to tasks.")
 
@@ -733,6 +1039,6 @@ class BaseIntegrator(object):
                                  affected_tasks=affected_tasks,
                                  noflaw_tasks=noflaw_tasks,
                                  error_count=stats_api_errors,
-                                 error_weaknesses_unmapped=len(missing_weakness_map))
+                                 error_weaknesses_unmapped=unmapped_flaw_count)
 
 
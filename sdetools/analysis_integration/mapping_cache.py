@@ -0,0 +1,144 @@
+"""
+Compiled weakness mapping store.
+
+Parsing the shipped mapping XML with minidom is slow for the larger maps, so
+the parsed index (weakness -> tasks, titles, types and confidence) is stored
+as JSON in a cache directory. A compiled entry is keyed by the absolute path of the
+mapping file and the weakness identifier used, and is only used as long as the
+mtime and size of the mapping file still match.
+"""
+import os
+import collections
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from sdetools.extlib.defusedxml import minidom
+
+from sdetools.sdelib.commons import json, atomic_write
+from sdetools.sdelib import log_mgr
+logger = log_mgr.mods.add_mod(__name__)
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join('~', '.sdetools_cache', 'mappings')
+
+
+class MappingIndex(object):
+    """ The compiled content of a mapping file """
+
+    def __init__(self, mapping, weakness_title, weakness_type, confidence):
+        self.mapping = mapping
+        self.weakness_title = weakness_title
+        self.weakness_type = weakness_type
+        self.confidence = confidence
+
+
+def parse_mapping(mapping_file, weakness_map_identifier='id'):
+    """
+    Parse the mapping XML and return a MappingIndex. Errors while opening or
+    parsing the file are left for the caller to handle.
+    """
+    base = minidom.parse(mapping_file)
+
+    weakness_mapping = collections.defaultdict(list)
+    weakness_title = {}
+    weakness_type = {}
+    confidence = {}
+    for task in base.getElementsByTagName('task'):
+        if task.attributes.has_key('confidence'):
+            confidence[task.attributes['id'].value] = task.attributes['confidence'].value
+
+        for weakness in task.getElementsByTagName('weakness'):
+            weakness_id = weakness.attributes[weakness_map_identifier].value
+            weakness_mapping[weakness_id].append(task.attributes['id'].value)
+            weakness_type[weakness_id] = weakness.attributes['type'].value
+            weakness_title[weakness_id] = weakness.attributes['title'].value
+
+    return MappingIndex(weakness_mapping, weakness_title, weakness_type, confidence)
+
+
+def _get_signature(mapping_file, weakness_map_identifier):
+    stat = os.stat(mapping_file)
+    return (CACHE_VERSION, os.path.abspath(mapping_file), weakness_map_identifier,
+            int(stat.st_mtime), stat.st_size)
+
+
+def get_cache_path(cache_dir, mapping_file, weakness_map_identifier='id'):
+    cache_key = '%s:%s' % (os.path.abspath(mapping_file), weakness_map_identifier)
+    file_name = '%s-%s.idx' % (os.path.splitext(os.path.basename(mapping_file))[0],
+                               sha1(cache_key).hexdigest()[:16])
+    return os.path.join(os.path.expanduser(cache_dir), file_name)
+
+
+def _read_cache(cache_path, signature):
+    try:
+        fp = open(cache_path, 'rb')
+    except IOError:
+        return None
+    try:
+        try:
+            cached = json.load(fp)
+            if cached['signature'] != repr(signature):
+                return None
+            return MappingIndex(cached['mapping'], cached['weakness_title'], cached['weakness_type'],
+                                cached['confidence'])
+        except Exception, e:
+            logger.debug('Ignoring unreadable mapping cache %s: %s' % (cache_path, e))
+            return None
+    finally:
+        fp.close()
+
+
+def _write_cache(cache_path, signature, index):
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        atomic_write(cache_path, json.dumps({
+            'signature': repr(signature),
+            'mapping': index.mapping,
+            'weakness_title': index.weakness_title,
+            'weakness_type': index.weakness_type,
+            'confidence': index.confidence,
+        }))
+    except (IOError, OSError), e:
+        logger.warning('Unable to write mapping cache %s: %s' % (cache_path, e))
+        return False
+    return True
+
+
+def build_mapping(mapping_file, weakness_map_identifier='id', cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Parse the mapping file and store the compiled index in cache_dir regardless
+    of any existing entry. Returns the path of the compiled file, or None if it
+    could not be written.
+    """
+    signature = _get_signature(mapping_file, weakness_map_identifier)
+    index = parse_mapping(mapping_file, weakness_map_identifier)
+    cache_path = get_cache_path(cache_dir, mapping_file, weakness_map_identifier)
+    if not _write_cache(cache_path, signature, index):
+        return None
+    return cache_path
+
+
+def load_mapping(mapping_file, weakness_map_identifier='id', cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Return the MappingIndex for mapping_file, using the compiled copy in
+    cache_dir when it is still current. An empty cache_dir disables the cache.
+    """
+    if not cache_dir:
+        return parse_mapping(mapping_file, weakness_map_identifier)
+
+    signature = _get_signature(mapping_file, weakness_map_identifier)
+    cache_path = get_cache_path(cache_dir, mapping_file, weakness_map_identifier)
+
+    index = _read_cache(cache_path, signature)
+    if index is not None:
+        logger.debug('Loaded compiled mapping %s for %s' % (cache_path, mapping_file))
+        return index
+
+    index = parse_mapping(mapping_file, weakness_map_identifier)
+    if _write_cache(cache_path, signature, index):
+        logger.debug('Compiled mapping %s into %s' % (mapping_file, cache_path))
+    return index
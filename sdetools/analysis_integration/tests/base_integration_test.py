@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 import StringIO
 import zipfile
 
@@ -6,7 +8,8 @@ from sdetools.sdelib import conf_mgr
 from sdetools.sdelib.mod_mgr import ReturnChannel, load_modules
 from sdetools.sdelib.testlib.mock_response import MOCK_SDE_RESPONSE
 from sdetools.sdelib.commons import abc, Error, UsageError, get_directory_of_current_module
-from sdetools.analysis_integration.base_integrator import BaseIntegrator
+from sdetools.analysis_integration.base_integrator import BaseIntegrator, IntegrationError
+from sdetools.analysis_integration import mapping_cache
 
 abstractmethod = abc.abstractmethod
 TEST_FILES_DIR = 'files'
@@ -58,6 +61,7 @@ class BaseIntegrationTest(object):
         self.integrator = self.integrator_cls(self.config)
         self.config.import_custom_options()
         self.integrator.config['mapping_file'] = os.path.join(self.test_file_dir, self.mapping_file)
+        self.integrator.config['mapping_cache_dir'] = ''
         self.integrator.config['report_file'] = os.path.join(self.test_file_dir, self.report_file)
         self.num_reports = 1
 
@@ -82,6 +86,24 @@ class BaseIntegrationTest(object):
 
         self.test_import_findings_assert_failed_tasks()
 
+    def test_import_with_parse_workers(self):
+        report_file = os.path.join(self.test_file_dir, self.report_file)
+        self.integrator.config['report_file'] = ','.join([report_file] * 3)
+        self.init_data()
+        expected_findings = self.integrator.generate_findings()
+        expected_report_id = self.integrator.report_id
+
+        self.init_integrator()
+        self.integrator.config['report_file'] = ','.join([report_file] * 3)
+        self.integrator.config['parse_workers'] = '2'
+        self.init_data()
+        self.assertEqual(self.integrator.generate_findings(), expected_findings)
+        self.assertEqual(self.integrator.report_id, expected_report_id)
+
+    def test_invalid_parse_workers(self):
+        self.integrator.config['parse_workers'] = '0'
+        self.assert_exception(UsageError, 'Incorrect parse_workers', self.init_data)
+
     def _test_import_with_zip(self):
         buf = StringIO.StringIO()
 
@@ -187,6 +209,21 @@ class BaseIntegrationTest(object):
         self.assertEqual(len(findings), self.expected_number_of_findings(), 'Expected %s findings, got %s' %
                         (self.expected_number_of_findings(), len(findings)))
 
+    def test_total_flaws_found(self):
+        self.init_data()
+        # Each finding is reported twice, so the findings of every task are merged
+        findings = list(self.integrator.generate_findings()) * 2
+        self.integrator.generate_findings = lambda: findings
+        queued = {}
+        self.integrator.emit.queue = lambda **kwargs: queued.update(kwargs)
+        self.integrator.import_findings()
+
+        # Every instance of a finding counts once for each task it maps to
+        mapped_findings = 0
+        for finding in findings:
+            mapped_findings += finding.get('count', 1) * len(self.integrator.lookup_task(finding['weakness_id']) or [])
+        self.assertEqual(queued['results']['total_flaws_found'][0], mapped_findings)
+
     def test_all_tasks_sanity_check(self):
         self.init_data()
         task_list = self.integrator.plugin.get_task_list()
@@ -226,6 +263,33 @@ class BaseIntegrationTest(object):
         self.assertTrue('36' in result.affected_tasks, 'Expected to find task 36 in affected tasks')
         self.check_analysis_note('36', 'failed', 'high', 1)
 
+    def test_compiled_mapping_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            mapping_file = os.path.join(cache_dir, os.path.basename(self.mapping_file))
+            shutil.copy(os.path.join(self.test_file_dir, self.mapping_file), mapping_file)
+            identifier = self.integrator.weakness_map_identifier
+            expected_mapping = dict(mapping_cache.parse_mapping(mapping_file, identifier).mapping)
+
+            self.integrator.config['mapping_file'] = mapping_file
+            self.integrator.config['mapping_cache_dir'] = cache_dir
+            self.integrator.load_mapping_from_xml()
+            self.assertTrue(os.path.exists(mapping_cache.get_cache_path(cache_dir, mapping_file, identifier)),
+                            'Expected a compiled mapping in %s' % cache_dir)
+            self.assertEqual(dict(self.integrator.mapping), expected_mapping)
+
+            # The compiled mapping is used as long as the mapping file is unchanged
+            self.integrator.load_mapping_from_xml()
+            self.assertEqual(dict(self.integrator.mapping), expected_mapping)
+
+            # A compiled mapping must not be used once the mapping file changes
+            fp = open(mapping_file, 'w')
+            fp.write('<mapping></mapping>')
+            fp.close()
+            self.assert_exception(IntegrationError, 'No mapping was found', self.integrator.load_mapping_from_xml)
+        finally:
+            shutil.rmtree(cache_dir)
+
     def test_reportid_exists(self):
         self.init_data()
         self.assertTrue(self.integrator.report_id, 'Expected a report_id value')
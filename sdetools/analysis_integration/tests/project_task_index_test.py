@@ -0,0 +1,59 @@
+import re
+import unittest
+
+from mock import patch
+
+from sdetools.analysis_integration.base_integrator import ProjectTaskIndex
+
+NUM_PROJECT_TASKS = 2000
+PHASES = ['requirements', 'architecture-design', 'development', 'testing']
+
+
+def linear_task_exists(task_id, project_tasks):
+    """ The per-lookup scan of the project tasks that ProjectTaskIndex replaces """
+    for task in project_tasks:
+        task_search = re.search('^(\d+)-T(\d+)$', task['id'])
+        if task_search and task_search.group(2) == task_id:
+            return True
+    return False
+
+
+class TestProjectTaskIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.project_tasks = [{'id': '1-T%d' % (number * 2), 'phase': PHASES[number % len(PHASES)]}
+                              for number in range(NUM_PROJECT_TASKS)]
+        # Half of the looked up tasks are not in the project
+        self.task_ids = [str(number) for number in range(0, NUM_PROJECT_TASKS, 4)]
+
+    def test_index_lookups(self):
+        task_index = ProjectTaskIndex(self.project_tasks + [{'id': 'malformed', 'phase': 'testing'}])
+
+        self.assertEqual(len(task_index), NUM_PROJECT_TASKS)
+        self.assertTrue('2' in task_index)
+        self.assertFalse('3' in task_index)
+        self.assertEqual(task_index.get_phase('2'), PHASES[1])
+        self.assertEqual(task_index.get_phase('3'), None)
+        self.assertEqual(task_index.tasks[:2], [('0', PHASES[0]), ('2', PHASES[1])])
+
+    def test_index_matches_linear_scan(self):
+        parsed_ids = []
+        task_id_re = ProjectTaskIndex.TASK_ID_RE
+
+        class RecordingRegex(object):
+            def match(self, text):
+                parsed_ids.append(text)
+                return task_id_re.match(text)
+
+        regex_patch = patch.object(ProjectTaskIndex, 'TASK_ID_RE', RecordingRegex())
+        regex_patch.start()
+        try:
+            task_index = ProjectTaskIndex(self.project_tasks)
+            found = [task_id in task_index for task_id in self.task_ids]
+        finally:
+            regex_patch.stop()
+
+        expected = [linear_task_exists(task_id, self.project_tasks) for task_id in self.task_ids]
+        self.assertEqual(found, expected)
+        # Each task id is parsed once, however many lookups are made
+        self.assertEqual(len(parsed_ids), NUM_PROJECT_TASKS)
@@ -2,9 +2,15 @@ import httplib
 import re
 import os
 import socket
+import errno
+import select
 import urllib2
 import tempfile
 import atexit
+import time
+import threading
+import urllib
+from StringIO import StringIO
 
 try:
     import ssl
@@ -37,6 +43,15 @@ DEFAULT_CUSTOM_CA_FILE = os.path.join(CERT_PATH_NAME, CUSTOM_ROOT_BUNDLE)
 
 custom_ca_file = DEFAULT_CUSTOM_CA_FILE
 
+# Keep-alive pool defaults: connections kept per host and seconds before
+# an idle connection is discarded
+DEFAULT_POOL_SIZE = 4
+DEFAULT_POOL_IDLE_TIMEOUT = 60
+# Requests that can be sent again on a new connection if a pooled one was stale
+RETRY_METHODS = ['GET', 'HEAD', 'PUT', 'DELETE']
+# Socket errors for a pooled connection that the server had already closed
+STALE_CONNECTION_ERRNOS = [errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE]
+
 
 def compile_certs():
     global CA_CERTS_FILE
@@ -218,10 +233,222 @@ class VerifiedHTTPSHandler(urllib2.HTTPSHandler):
     https_request = urllib2.HTTPSHandler.do_request_
 
 
-def get_http_handler(mode, debuglevel=0):
+class ConnectionPool(object):
+    """
+    A bounded pool of idle HTTP(S) connections, keyed by host (and the tunnel
+    host when going through a proxy). Connections are checked out exclusively
+    and returned once their response has been fully read.
+    """
+
+    def __init__(self, max_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns an idle connection for key, or None if there is none available
+        """
+        self._lock.acquire()
+        try:
+            now = time.time()
+            conns = self._idle.get(key, [])
+            while conns:
+                conn, last_used = conns.pop()
+                if now - last_used > self.idle_timeout or self._is_dropped(conn):
+                    self.evictions += 1
+                    conn.close()
+                    continue
+                self.hits += 1
+                return conn
+            self.misses += 1
+            return None
+        finally:
+            self._lock.release()
+
+    def _is_dropped(self, conn):
+        """
+        Returns True if the server has closed an idle connection. Nothing is
+        expected on an idle connection, so a readable socket means it was closed.
+        """
+        sock = getattr(conn, 'sock', None)
+        if sock is None:
+            return False
+        try:
+            readable = select.select([sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return True
+        return bool(readable)
+
+    def put(self, key, conn):
+        """
+        Returns a connection to the pool. It is closed instead if the pool for
+        this host is already full.
+        """
+        self._lock.acquire()
+        try:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) >= self.max_size:
+                self.evictions += 1
+                conn.close()
+                return
+            conns.append((conn, time.time()))
+        finally:
+            self._lock.release()
+
+    def close_all(self):
+        self._lock.acquire()
+        try:
+            for conns in self._idle.values():
+                for conn, last_used in conns:
+                    conn.close()
+            self._idle = {}
+        finally:
+            self._lock.release()
+
+    def get_stats(self):
+        self._lock.acquire()
+        try:
+            idle = 0
+            for conns in self._idle.values():
+                idle += len(conns)
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'idle': idle,
+            }
+        finally:
+            self._lock.release()
+
+
+class KeepAliveHandlerMixin:
+    """
+    Replacement for AbstractHTTPHandler.do_open that keeps HTTP/1.1
+    connections open between requests using a ConnectionPool.
+
+    The response body is read in full before the connection goes back into
+    the pool, so callers receive a buffered file-like response.
+    """
+
+    def _init_pool(self, pool):
+        if pool is None:
+            pool = ConnectionPool()
+        self.connection_pool = pool
+
+    def _new_connection(self, http_class, req, tunnel_headers):
+        conn = http_class(req.get_host(), timeout=req.timeout)
+        conn.set_debuglevel(self._debuglevel)
+        if req._tunnel_host:
+            conn.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+        return conn
+
+    def _send_request(self, conn, req, headers):
+        conn.request(req.get_method(), req.get_selector(), req.data, headers)
+        return conn.getresponse()
+
+    def _can_retry(self, req, err):
+        """
+        A request is only sent again if it is idempotent and the pooled
+        connection failed before any response was read, as it does when the
+        server closed it while idle.
+        """
+        if req.get_method() not in RETRY_METHODS:
+            return False
+        if isinstance(err, httplib.BadStatusLine):
+            return True
+        if isinstance(err, socket.timeout):
+            return False
+        return isinstance(err, socket.error) and err.errno in STALE_CONNECTION_ERRNOS
+
+    def do_keep_alive_open(self, http_class, req):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items() if k not in headers))
+        headers = dict((name.title(), val) for name, val in headers.items())
+        headers['Connection'] = 'keep-alive'
+
+        tunnel_headers = {}
+        if req._tunnel_host and 'Proxy-Authorization' in headers:
+            tunnel_headers['Proxy-Authorization'] = headers.pop('Proxy-Authorization')
+
+        key = (host, req._tunnel_host)
+        conn = self.connection_pool.get(key)
+        response = None
+        if conn is not None:
+            # The server may have dropped an idle connection: retry once on a new one
+            try:
+                response = self._send_request(conn, req, headers)
+            except (socket.error, httplib.HTTPException), err:
+                conn.close()
+                if not self._can_retry(req, err):
+                    if isinstance(err, socket.error):
+                        raise urllib2.URLError(err)
+                    raise
+                conn = None
+
+        if conn is None:
+            conn = self._new_connection(http_class, req, tunnel_headers)
+            try:
+                response = self._send_request(conn, req, headers)
+            except socket.error, err:
+                conn.close()
+                raise urllib2.URLError(err)
+
+        body = response.read()
+        if response.will_close:
+            conn.close()
+        else:
+            self.connection_pool.put(key, conn)
+
+        resp = urllib.addinfourl(StringIO(body), response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+
+class KeepAliveHTTPHandler(KeepAliveHandlerMixin, urllib2.HTTPHandler):
+    def __init__(self, debuglevel=0, pool=None):
+        urllib2.HTTPHandler.__init__(self, debuglevel)
+        self._init_pool(pool)
+
+    def http_open(self, req):
+        return self.do_keep_alive_open(httplib.HTTPConnection, req)
+
+
+class KeepAliveHTTPSHandler(KeepAliveHandlerMixin, VerifiedHTTPSHandler):
+    def __init__(self, debuglevel=0, pool=None, **kwargs):
+        VerifiedHTTPSHandler.__init__(self, debuglevel, **kwargs)
+        self._init_pool(pool)
+
+    def https_open(self, req):
+        def https_class_wrapper(host, **kwargs):
+            full_kwargs = dict(self._connection_args)
+            full_kwargs.update(kwargs)
+            return CertValidatingHTTPSConnection(host, **full_kwargs)
+
+        try:
+            return self.do_keep_alive_open(https_class_wrapper, req)
+        except urllib2.URLError, e:
+            if type(e.reason) is ssl.SSLError:
+                raise InvalidCertificateException(req.host, '',
+                                                  e.reason.args[1])
+            raise
+
+
+def get_http_handler(mode, debuglevel=0, keep_alive=False):
     global ssl_warned
 
     if mode == 'http':
+        if keep_alive:
+            return KeepAliveHTTPHandler(debuglevel=debuglevel)
         return urllib2.HTTPHandler(debuglevel=debuglevel)
     elif mode == 'https':
         if not ssl_lib_found:
@@ -230,19 +457,28 @@ def get_http_handler(mode, debuglevel=0):
                     ' NOT be validated\n (use python 2.6 or install ssl for python)')
                 ssl_warned = True
             return urllib2.HTTPSHandler(debuglevel=debuglevel)
+        elif keep_alive:
+            return KeepAliveHTTPSHandler(debuglevel=debuglevel, ca_certs=CA_CERTS_FILE)
         else:
             return VerifiedHTTPSHandler(debuglevel=debuglevel, ca_certs=CA_CERTS_FILE)
     raise KeyError, mode
 
 
-def get_opener(method, server, proxy=None, debuglevel=0):
-    handler = [get_http_handler(method, debuglevel)]
+def get_opener(method, server, proxy=None, debuglevel=0, keep_alive=False):
+    """
+    Builds a urllib2 opener for server. A proxy can be specified using the
+    <server>|<proxy> syntax. With keep_alive, connections are pooled and the
+    pool is available as opener.connection_pool (None otherwise).
+    """
+    http_handler = get_http_handler(method, debuglevel, keep_alive)
+    handler = [http_handler]
     if '|' in server:
         server, http_proxy = server.split('|', 1)
         handler.append(urllib2.ProxyHandler({method: http_proxy}))
     handler.append(ExtendedMethodHTTPRedirectHandler)
     opener = urllib2.build_opener(*handler)
     opener.server = server
+    opener.connection_pool = getattr(http_handler, 'connection_pool', None)
     return opener
 
 compile_certs()
@@ -22,4 +22,5 @@ __all__ = [
     'add_ssl_cert',
     'fetch_config',
     'modify_notes',
+    'build_mapping_cache',
 ]
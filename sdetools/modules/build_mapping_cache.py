@@ -0,0 +1,49 @@
+import os
+import glob
+
+from sdetools.sdelib.cmd import BaseCommand
+from sdetools.sdelib import commons
+from sdetools.analysis_integration import mapping_cache
+
+
+class Command(BaseCommand):
+    help = 'Compiles weakness mapping files so that analysis imports can skip parsing the XML.'
+    conf_syntax = '[mapping_file ...]'
+    conf_help = 'mapping_file: [optional] Mapping files to compile (omit to compile all shipped mappings)'
+
+    def configure(self):
+        self.config.opts.add(
+                "mapping_cache_dir",
+                "Directory for compiled mapping files",
+                default=mapping_cache.DEFAULT_CACHE_DIR)
+        self.config.opts.add(
+                "weakness_identifiers",
+                "Comma separated list of weakness attributes to index the mappings by",
+                default="id,title")
+
+    def handle(self):
+        if not self.config['mapping_cache_dir']:
+            raise commons.UsageError('Missing configuration option mapping_cache_dir')
+
+        self.config.process_list_config('weakness_identifiers')
+        if not self.config['weakness_identifiers']:
+            raise commons.UsageError('Missing configuration option weakness_identifiers')
+
+        mapping_files = self.args
+        if not mapping_files:
+            mapping_files = glob.glob(os.path.join(commons.media_path, '*', 'sde_*_map.xml'))
+            mapping_files.sort()
+
+        for mapping_file in mapping_files:
+            for identifier in self.config['weakness_identifiers']:
+                try:
+                    cache_path = mapping_cache.build_mapping(mapping_file, identifier,
+                                                             self.config['mapping_cache_dir'])
+                except Exception, e:
+                    raise commons.Error("Unable to compile mapping file '%s': %s" % (mapping_file, e))
+                if not cache_path:
+                    raise commons.Error("Unable to write compiled mapping for '%s' to %s" %
+                                        (mapping_file, self.config['mapping_cache_dir']))
+                self.emit.info('Compiled %s (%s) into %s' % (mapping_file, identifier, cache_path))
+
+        return True
@@ -54,6 +54,7 @@ class AppScanEnterpriseXMLContent(BaseContentHandler):
 
 
 class AppScanEnterpriseXMLImporter(BaseXMLImporter):
+    ROOT_ELEMENTS = ['report']
 
     def __init__(self):
         super(AppScanEnterpriseXMLImporter, self).__init__()
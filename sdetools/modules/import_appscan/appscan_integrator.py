@@ -44,7 +44,7 @@ class AppScanIntegrator(BaseIntegrator):
         if self.config['edition'] not in AppScanIntegrator.VALID_PRODUCT_EDITIONS:
             raise UsageError("Unsupported AppScan edition: %s" % self.config['edition'])
 
-    def parse_report_file(self, report_file, report_type):
+    def get_importer(self, report_file, report_type):
 
         if report_type == 'xml' and self.config['edition'] == 'standard':
             importer = AppScanStandardXMLImporter()
@@ -66,12 +66,7 @@ class AppScanIntegrator(BaseIntegrator):
         # load the task -> weakness mapping
         self.load_mapping_from_xml()
 
-        importer.parse(report_file)
-
-        self.findings = importer.findings
-        self.report_id = importer.id
-
-        return importer.findings, importer.id
+        return importer
 
     def _make_finding(self, item):
         return {'weakness_id': item['id'], 'description': item['description'], 'count': item['count']}
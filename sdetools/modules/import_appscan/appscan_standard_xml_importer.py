@@ -72,6 +72,7 @@ class AppScanStandardXMLContent(BaseContentHandler):
 
 
 class AppScanStandardXMLImporter(BaseXMLImporter):
+    ROOT_ELEMENTS = ['XmlReport']
 
     def __init__(self):
         super(AppScanStandardXMLImporter, self).__init__()
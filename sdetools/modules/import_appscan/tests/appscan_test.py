@@ -1,8 +1,12 @@
+import os
 import unittest
+import zipfile
+import StringIO
 
 from sdetools.sdelib.commons import UsageError
 from sdetools.analysis_integration.tests.base_integration_test import BaseIntegrationTest
 from sdetools.modules.import_appscan.appscan_integrator import AppScanIntegrator
+from sdetools.modules.import_appscan.appscan_zip_importer import AppScanZIPImporter
 
 
 class TestAppScanIntegration(BaseIntegrationTest, unittest.TestCase):
@@ -39,3 +43,45 @@ class TestAppScanIntegration(BaseIntegrationTest, unittest.TestCase):
             self.assertTrue(False, 'Unsupported AppScan edition: %s' % self.config['edition'])
         except UsageError:
             pass
+
+    def _track_full_parses(self):
+        parsed_files = []
+        for item in self.integrator.AVAILABLE_IMPORTERS:
+            if isinstance(item['importer'], AppScanZIPImporter):
+                importers = [zipped['importer'] for zipped in item['importer'].available_importers]
+            else:
+                importers = [item['importer']]
+            for importer in importers:
+                def parse_file(xml_file, _parse_file=importer.parse_file):
+                    parsed_files.append(xml_file)
+                    return _parse_file(xml_file)
+                importer.parse_file = parse_file
+        return parsed_files
+
+    def test_detect_importer_without_parsing(self):
+        parsed_files = self._track_full_parses()
+
+        for report_file, edition in [('appscan.xml', 'standard'), ('appscan_enterprise.xml', 'enterprise')]:
+            importer = self.integrator.detect_importer(os.path.join(self.test_file_dir, report_file))
+            self.assertEqual(importer.get_edition(), edition)
+
+        buf = StringIO.StringIO()
+        zip_archive = zipfile.ZipFile(buf, mode='w')
+        zip_archive.write(os.path.join(self.test_file_dir, 'appscan_enterprise.xml'), 'appscan_enterprise.xml')
+        zip_archive.close()
+        importer = self.integrator.detect_importer(buf)
+        self.assertTrue(isinstance(importer, AppScanZIPImporter))
+        self.assertEqual(importer.get_edition(), 'enterprise')
+        self.assertEqual(parsed_files, [], 'Expected detection to read only the head of the reports')
+
+        importer.parse(buf)
+        self.assertEqual(len(parsed_files), 1, 'Expected the archive to be parsed once')
+        self.assertTrue(importer.findings, 'Expected findings from the archive')
+
+    def test_detect_importer_cache(self):
+        report_file = os.path.join(self.test_file_dir, self.report_file)
+        importer = self.integrator.detect_importer(report_file)
+
+        for item in self.integrator.AVAILABLE_IMPORTERS:
+            item['importer'].can_parse_file = lambda report_file: self.fail('Expected a cached detection')
+        self.assertTrue(self.integrator.detect_importer(report_file) is importer)
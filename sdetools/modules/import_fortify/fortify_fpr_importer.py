@@ -10,7 +10,8 @@ class FortifyFPRImporter(BaseZIPImporter):
     def __init__(self, blacklist=[]):
         super(FortifyFPRImporter, self).__init__()
         self.register_importer('audit.xml', FortifyAuditImporter())
-        self.register_importer('audit.fvdl', FortifyFVDLImporter())
+        # Instance ids are needed to filter out blacklisted issues
+        self.register_importer('audit.fvdl', FortifyFVDLImporter(aggregate=not blacklist))
         self.ANALYSIS_BLACKLIST = blacklist
 
     def parse(self, fpr_file):
@@ -1,9 +1,9 @@
-from sdetools.analysis_integration.base_integrator import BaseXMLImporter, BaseContentHandler
+from sdetools.analysis_integration.base_integrator import BaseXMLImporter, BaseContentHandler, FindingCounter
 
 
 class FVDLXMLContent(BaseContentHandler):
 
-    def __init__(self):
+    def __init__(self, aggregate=False):
         self.saw_fvdl_node = False
         self.saw_build_node = False
         self.in_build_node = False
@@ -13,7 +13,11 @@ class FVDLXMLContent(BaseContentHandler):
         self.in_vuln_class_info_type_node = False
         self.in_vuln_instance_info_node = False
         self.in_vuln_instance_info_instance_id_node = False
-        self.findings = []
+        self.aggregate = aggregate
+        if aggregate:
+            self.findings = FindingCounter(id_key='id')
+        else:
+            self.findings = []
         self.id = ""
         self.entry = {}
 
@@ -49,7 +53,8 @@ class FVDLXMLContent(BaseContentHandler):
             self.entry['count'] = 1
             self.entry['description'] = data
         elif self.in_vuln_instance_info_instance_id_node:
-            self.entry['instance_id'] = data
+            if not self.aggregate:
+                self.entry['instance_id'] = data
             self.findings.append(self.entry)
         elif self.in_build_build_id_node:
             self.id = data
@@ -72,6 +77,12 @@ class FVDLXMLContent(BaseContentHandler):
 
 
 class FortifyFVDLImporter(BaseXMLImporter):
+    ROOT_ELEMENTS = ['FVDL']
+
+    def __init__(self, aggregate=True):
+        super(FortifyFVDLImporter, self).__init__()
+        # Aggregated findings are counted per vulnerability type and lose their instance ids
+        self.aggregate = aggregate
 
     def _get_content_handler(self):
-        return FVDLXMLContent()
+        return FVDLXMLContent(self.aggregate)
@@ -26,7 +26,7 @@ class FortifyIntegrator(BaseIntegrator):
         super(FortifyIntegrator, self).initialize()
         self.config.process_list_config('import_blacklist')
 
-    def parse_report_file(self, report_file, report_type):
+    def get_importer(self, report_file, report_type):
         if report_type == 'xml':
             importer = FortifyReportImporter()
         elif report_type == 'fpr':
@@ -36,12 +36,7 @@ class FortifyIntegrator(BaseIntegrator):
         else:
             raise FortifyIntegrationError("Unsupported file type (%s)" % report_type)
 
-        importer.parse(report_file)
-
-        self.findings = importer.findings
-        self.report_id = importer.id
-
-        return importer.findings, importer.id
+        return importer
 
     def _make_finding(self, item):
         return {'weakness_id': item['id'], 'description': item['description'], 'count': item['count']}
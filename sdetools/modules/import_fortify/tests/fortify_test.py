@@ -1,9 +1,12 @@
 import unittest
 import os
+import zipfile
+import StringIO
 
 from sdetools.analysis_integration.tests.base_integration_test import BaseIntegrationTest
 from sdetools.modules.import_fortify.fortify_integrator import FortifyIntegrator
 from sdetools.analysis_integration.base_integrator import IntegrationError
+from sdetools.modules.import_fortify.fortify_fvdl_importer import FortifyFVDLImporter
 
 class TestFortifyIntegration(BaseIntegrationTest, unittest.TestCase):
     @classmethod
@@ -39,4 +42,32 @@ class TestFortifyIntegration(BaseIntegrationTest, unittest.TestCase):
 
         findings = self.integrator.generate_findings()
         self.assertTrue(self.integrator.report_id, 'Expected a report_id value')
-        self.assertTrue(len(findings), 'Expected to process some findings')
\ No newline at end of file
+        self.assertTrue(len(findings), 'Expected to process some findings')
+
+    def test_fvdl_aggregated_findings(self):
+        fpr = zipfile.ZipFile(os.path.join(self.test_file_dir, 'results.fpr'))
+        fvdl = fpr.read('audit.fvdl')
+        fpr.close()
+
+        importer = FortifyFVDLImporter(aggregate=False)
+        importer.parse(StringIO.StringIO(fvdl))
+        self.assertEqual(len(importer.findings), 3)
+
+        importer = FortifyFVDLImporter()
+        importer.parse(StringIO.StringIO(fvdl))
+        counts = dict([(finding['id'], finding['count']) for finding in importer.findings])
+        self.assertEqual(counts, {'Cross-Site Scripting': 2, 'Unknown Weakness': 1})
+        for finding in importer.findings:
+            self.assertFalse('instance_id' in finding, 'Expected aggregated findings without instance ids')
+
+    def test_fvdl_detected_without_parsing(self):
+        fpr = zipfile.ZipFile(os.path.join(self.test_file_dir, 'results.fpr'))
+        fvdl = fpr.read('audit.fvdl')
+        audit_xml = fpr.read('audit.xml')
+        fpr.close()
+
+        importer = FortifyFVDLImporter()
+        importer.parse_file = lambda xml_file: self.fail('Expected detection to read only the head of the report')
+        self.assertTrue(importer.can_parse_file(StringIO.StringIO(fvdl)))
+        self.assertFalse(importer.can_parse_file(StringIO.StringIO(audit_xml)))
+
@@ -1,7 +1,20 @@
 import unittest
+import StringIO
 
 from sdetools.analysis_integration.tests.base_integration_test import BaseIntegrationTest
 from sdetools.modules.import_veracode.veracode_integrator import VeracodeIntegrator
+from sdetools.modules.import_veracode.veracode_integration_error import VeracodeIntegrationError
+from sdetools.modules.import_veracode.veracode_xml_importer import VeracodeXMLImporter
+
+REPORT_TEMPLATE = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<detailedreport app_name="WebGoat" app_id="39624" build_id="60062">
+  <severity level="3"><category><cwe><staticflaws>
+%s
+  </staticflaws></cwe></category></severity>
+</detailedreport>
+"""
+FLAW_TEMPLATE = '<flaw issueid="%d" cweid="80" categoryid="20" categoryname="XSS" description="Flaw" severity="3" ' \
+                'module="WebGoat-5.4.war" sourcefilepath="org/owasp/" line="%d" remediation_status="%s"/>'
 
 
 class TestVeracodeIntegration(BaseIntegrationTest, unittest.TestCase):
@@ -16,3 +29,18 @@ class TestVeracodeIntegration(BaseIntegrationTest, unittest.TestCase):
     def expected_number_of_findings(self):
         return 2
 
+    def test_fixed_flaws_skipped(self):
+        flaws = [FLAW_TEMPLATE % (issue_id, issue_id, status)
+                 for issue_id, status in enumerate(['New', 'Fixed', 'Open', 'Fixed', 'Reopened'])]
+        importer = VeracodeXMLImporter()
+        importer.parse(StringIO.StringIO(REPORT_TEMPLATE % '\n'.join(flaws)))
+
+        self.assertEqual(importer.id, 'WebGoat (39624-b60062)')
+        self.assertEqual([flaw['issueid'] for flaw in importer.findings], ['0', '2', '4'])
+        self.assertEqual(importer.findings[0]['line'], '0')
+
+    def test_flaw_missing_attribute(self):
+        flaw = (FLAW_TEMPLATE % (1, 1, 'New')).replace('cweid="80" ', '')
+        importer = VeracodeXMLImporter()
+        self.assert_exception(VeracodeIntegrationError, 'Required attribute cweid missing', importer.parse,
+                              StringIO.StringIO(REPORT_TEMPLATE % flaw))
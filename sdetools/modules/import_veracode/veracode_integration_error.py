@@ -0,0 +1,5 @@
+from sdetools.analysis_integration.base_integrator import IntegrationError
+
+
+class VeracodeIntegrationError(IntegrationError):
+    pass
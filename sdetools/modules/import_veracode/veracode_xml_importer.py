@@ -0,0 +1,51 @@
+from sdetools.analysis_integration.base_integrator import BaseXMLImporter, BaseContentHandler
+from sdetools.modules.import_veracode.veracode_integration_error import VeracodeIntegrationError
+
+REQUIRED_ATTRIBS = ['issueid', 'cweid', 'categoryid', 'categoryname', 'description', 'severity', 'module',
+                    'remediation_status']
+LOCATION_ATTRIBS = ['sourcefilepath', 'sourcefile', 'line', 'location']
+
+
+class VeracodeXMLContent(BaseContentHandler):
+
+    def __init__(self):
+        self.detailed_report_count = 0
+        self.findings = []
+        self.id = ""
+
+    def valid_content_detected(self):
+        return self.detailed_report_count == 1
+
+    def processingInstruction(self, target, data):
+        pass
+
+    def startElement(self, name, attrs):
+        if name == 'detailedreport':
+            self.detailed_report_count += 1
+            self.id = "%s (%s-b%s)" % (attrs.get('app_name'), attrs.get('app_id'), attrs.get('build_id'))
+        elif name == 'flaw':
+            # Veracode tracks 'fixed' flaws - skip them
+            if attrs.get('remediation_status') == 'Fixed':
+                return
+            self.findings.append(self._make_raw_finding(attrs))
+
+    def _make_raw_finding(self, attrs):
+        """
+        Extract finding information from the attributes of a flaw node.
+        """
+        entry = {}
+        for attr in REQUIRED_ATTRIBS:
+            if attr not in attrs:
+                raise VeracodeIntegrationError('Required attribute %s missing' % (attr))
+            entry[attr] = attrs[attr]
+        for attr in LOCATION_ATTRIBS:
+            if attr in attrs:
+                entry[attr] = attrs[attr]
+        return entry
+
+
+class VeracodeXMLImporter(BaseXMLImporter):
+    ROOT_ELEMENTS = ['detailedreport']
+
+    def _get_content_handler(self):
+        return VeracodeXMLContent()
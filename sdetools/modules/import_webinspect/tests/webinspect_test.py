@@ -1,7 +1,9 @@
+import os
 import unittest
 
 from sdetools.analysis_integration.tests.base_integration_test import BaseIntegrationTest
 from sdetools.modules.import_webinspect.webinspect_integrator import WebInspectIntegrator
+from sdetools.modules.import_webinspect.webinspect_xml_importer import WebInspectXMLImporter
 
 
 class TestWebInspectIntegration(BaseIntegrationTest, unittest.TestCase):
@@ -19,5 +21,28 @@ class TestWebInspectIntegration(BaseIntegrationTest, unittest.TestCase):
     def test_import_with_zip(self):
         self._test_import_with_zip()
 
+    def test_repeated_instances(self):
+        self.integrator.config['report_file'] = os.path.join(self.test_file_dir, 'repeated_instances.xml')
+        self.init_data()
+        queued = {}
+        self.integrator.emit.queue = lambda **kwargs: queued.update(kwargs)
+        errors = []
+        self.integrator.emit.error = lambda msg, **kwargs: errors.append((msg, kwargs))
+        result = self.integrator.import_findings()
+
+        # Five instances of 5649 are merged into one finding but still count five times
+        self.assertEqual(queued['results']['total_flaws_found'][0], 5)
+        self.assertEqual(result.error_weaknesses_unmapped, 2)
+
+        # Unmapped instances are counted but their weakness is listed once
+        self.assertEqual(errors[0][0], 'Could not map 2 flaws')
+        self.assertEqual(len(errors[0][1]['weakness_list']), 1)
+
+    def test_detected_without_parsing(self):
+        importer = WebInspectXMLImporter()
+        importer.parse_file = lambda xml_file: self.fail('Expected detection to read only the head of the report')
+        self.assertTrue(importer.can_parse_file(os.path.join(self.test_file_dir, self.report_file)))
+        self.assertFalse(importer.can_parse_file(os.path.join(self.test_file_dir, self.mapping_file)))
+
 if __name__ == "__main__":
     unittest.main()
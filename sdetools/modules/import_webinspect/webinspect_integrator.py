@@ -21,7 +21,7 @@ class WebInspectIntegrator(BaseIntegrator):
         supported_file_types = ['xml', 'fpr', 'zip']
         super(WebInspectIntegrator, self).__init__(config, self.TOOL_NAME, supported_file_types, DEFAULT_MAPPING_FILE)
 
-    def parse_report_file(self, report_file, report_type):
+    def get_importer(self, report_file, report_type):
         if report_type == 'xml':
             importer = WebInspectXMLImporter()
         elif report_type in ['fpr', 'zip']:
@@ -29,15 +29,11 @@ class WebInspectIntegrator(BaseIntegrator):
         else:
             raise UsageError("Unsupported file type (%s)" % report_type)
 
-        importer.parse(report_file)
-
-        self.findings = importer.findings
-        self.report_id = importer.id
-
-        return importer.findings, importer.id
+        return importer
 
     def _make_finding(self, item):
-        return {'weakness_id': item['id'], 'description': item['description'], 'type': item['type']}
+        return {'weakness_id': item['id'], 'description': item['description'], 'type': item['type'],
+                'count': item['count']}
 
     def generate_findings(self):
         return [self._make_finding(item) for item in self.findings]
@@ -1,4 +1,4 @@
-from sdetools.analysis_integration.base_integrator import BaseXMLImporter, BaseContentHandler
+from sdetools.analysis_integration.base_integrator import BaseXMLImporter, BaseContentHandler, FindingCounter
 
 
 class WebInspectXMLContent(BaseContentHandler):
@@ -9,7 +9,7 @@ class WebInspectXMLContent(BaseContentHandler):
         self.in_issue_name_node = False
         self.in_session_node = False
         self.in_url_node = False
-        self.findings = []
+        self.findings = FindingCounter(id_key='id')
         self.report_id = ""
         self.check_id = 0
         self.check_name_found = False
@@ -63,6 +63,7 @@ class WebInspectXMLContent(BaseContentHandler):
             self.in_url_node = False
     
 class WebInspectXMLImporter(BaseXMLImporter):
+    ROOT_ELEMENTS = ['Sessions']
 
     def __init__(self):
         super(WebInspectXMLImporter, self).__init__()
@@ -1,14 +1,18 @@
 # Copyright SDElements Inc
 # Extensible two way integration with GitHub
 
+import os
+import re
 import json
+import urllib
 from datetime import datetime
 
+from sdetools.sdelib import http_cache
 from sdetools.sdelib.commons import urlencode_str
 from sdetools.sdelib.restclient import RESTBase
 from sdetools.sdelib.restclient import URLRequest, APIError
-from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector, PUBLIC_TASK_CONTENT
-from sdetools.alm_integration.alm_plugin_base import AlmException
+from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector, AlmTaskIndex, PUBLIC_TASK_CONTENT
+from sdetools.alm_integration.alm_plugin_base import AlmException, SYNC_MARGIN_SECONDS
 
 from sdetools.sdelib import log_mgr
 
@@ -21,6 +25,9 @@ GITHUB_DEFAULT_PRIORITY_MAP = {
 }
 GITHUB_NEW_STATUS = 'open'
 GITHUB_DONE_STATUS = 'closed'
+GITHUB_ISSUES_PER_PAGE = 100
+GITHUB_DEFAULT_CACHE_DIR = os.path.join('~', '.sdetools_cache', 'github')
+RE_LINK_NEXT = re.compile(r'<([^>]+)>;\s*rel="next"')
 
 
 class GitHubAPI(RESTBase):
@@ -29,6 +36,7 @@ class GitHubAPI(RESTBase):
     def __init__(self, config):
         extra_conf_opts = [('alm_api_token', 'GitHub API Token', '')]
         super(GitHubAPI, self).__init__('alm', 'GitHub', config, extra_conf_opts=extra_conf_opts)
+        self.response_headers = {}
 
     def post_conf_init(self):
         if self._get_conf('api_token'):
@@ -38,6 +46,22 @@ class GitHubAPI(RESTBase):
 
         super(GitHubAPI, self).post_conf_init()
 
+    def parse_response(self, result, headers):
+        # Keep the headers around for pagination (Link) and conditional requests (ETag)
+        self.response_headers = dict([(name.lower(), value) for name, value in headers.items()])
+        return super(GitHubAPI, self).parse_response(result, headers)
+
+    def get_next_page_target(self):
+        """ Returns the API target of the next page of the last response, or None """
+        match = RE_LINK_NEXT.search(self.response_headers.get('link', ''))
+        if not match:
+            return None
+        next_url = match.group(1)
+        if not next_url.startswith('%s/' % self.base_uri):
+            logger.warning('Unexpected GitHub pagination URL: %s' % next_url)
+            return None
+        return next_url[len(self.base_uri) + 1:]
+
     def parse_error(self, result):
         result = json.loads(result)
         error_msg = result.get('message')
@@ -102,12 +126,16 @@ class GitHubTask(AlmTask):
 
 class GitHubConnector(AlmConnector):
     alm_name = 'GitHub'
+    # The API keeps the headers of the last response for paging
+    alm_max_concurrency = 1
     GITHUB_ISSUE_LABEL = 'github_issue_label'
     GITHUB_DUPLICATE_LABEL = 'github_duplicate_label'
     ALM_PROJECT_VERSION = 'alm_project_version'
     GITHUB_REPO_OWNER = 'github_repo_owner'
     GITHUB_GROUP_LABEL = 'alm_group_label'
+    GITHUB_CACHE_DIR = 'github_cache_dir'
     default_priority_map = GITHUB_DEFAULT_PRIORITY_MAP
+    feature_changed_tasks = True
 
     def __init__(self, config, alm_plugin):
         """ Initializes connection to GitHub """
@@ -121,7 +149,10 @@ class GitHubConnector(AlmConnector):
         config.opts.add(self.GITHUB_REPO_OWNER, 'GitHub repository owner', default=None)
         config.opts.add(self.GITHUB_GROUP_LABEL, 'GitHub label for issues generated by SDElements',
                                  default='SD Elements')
+        config.opts.add(self.GITHUB_CACHE_DIR, 'Directory to keep GitHub issue pages in between runs, '
+                                               'revalidated by their ETags (leave empty to disable)', default=GITHUB_DEFAULT_CACHE_DIR)
         self.sync_titles_only = True
+        self.issue_index = None
 
     def initialize(self):
         super(GitHubConnector, self).initialize()
@@ -131,6 +162,12 @@ class GitHubConnector(AlmConnector):
             if not self.config[item]:
                 raise AlmException('Missing %s in configuration' % item)
 
+        self.config.process_boolean_config('no_cache')
+        if self.config['no_cache'] or not self.config[self.GITHUB_CACHE_DIR]:
+            self.alm_plugin.response_cache = None
+        else:
+            self.alm_plugin.response_cache = http_cache.ResponseCache(self.config[self.GITHUB_CACHE_DIR])
+
     def alm_connect_server(self):
         """ Verifies that GitHub connection works """
         # Check if user can successfully authenticate and retrieve user profile
@@ -179,11 +216,137 @@ class GitHubConnector(AlmConnector):
 
         raise AlmException('Unable to find milestone %s from GitHub' % milestone_name)
 
+    def _get_issue_filter_label(self):
+        """ Every issue added by the sync carries the issue label, or the group label if there is none """
+        return self.config[self.GITHUB_ISSUE_LABEL] or self.config[self.GITHUB_GROUP_LABEL]
+
+    @staticmethod
+    def _get_label_names(issue):
+        return [isinstance(label, dict) and label['name'] or label for label in issue['labels']]
+
+    def _get_issue_page(self, target):
+        """
+        Returns a page of the issue list as a dict of its issues and next target.
+        A page that has not changed since it was cached is answered with a 304, which
+        is free against the rate limit
+        """
+        result = self.alm_plugin.call_api(target, cache_ttl=0)
+
+        issues = []
+        for issue in result:
+            # The issues API lists pull requests as well
+            if 'pull_request' in issue:
+                continue
+            issues.append({
+                'number': issue['number'],
+                'title': issue['title'],
+                'state': issue['state'],
+                'updated_at': issue['updated_at'],
+                'labels': self._get_label_names(issue),
+            })
+        return {
+            'issues': issues,
+            'next': self.alm_plugin.get_next_page_target(),
+        }
+
+    def _get_issues(self, tasks, **extra_args):
+        """ Pages through the issues of the repo matching extra_args and indexes them by title """
+        args = {
+            'state': 'all',
+            'sort': 'created',
+            'direction': 'asc',
+            'per_page': GITHUB_ISSUES_PER_PAGE,
+        }
+        args.update(extra_args)
+        filter_label = self._get_issue_filter_label()
+        if filter_label:
+            args['labels'] = filter_label
+        target = 'repos/%s/issues?%s' % (self.project_uri, urllib.urlencode(sorted(args.items())))
+
+        seen_targets = set()
+        issue_index = AlmTaskIndex(tasks)
+        duplicate_label = self.config[self.GITHUB_DUPLICATE_LABEL]
+        try:
+            while target:
+                if target in seen_targets:
+                    raise AlmException('GitHub issue pages link back to %s' % target)
+                seen_targets.add(target)
+                issue_page = self._get_issue_page(target)
+
+                for issue in issue_page['issues']:
+                    # Prune issues labeled as duplicate
+                    if duplicate_label in issue['labels']:
+                        continue
+                    issue_index.add(issue['title'], issue, issue['number'])
+                target = issue_page['next']
+        except APIError, err:
+            raise AlmException('Unable to get issues from GitHub. Reason: %s' % str(err))
+
+        return issue_index
+
+    def alm_get_changed_tasks(self, tasks, since):
+        since = datetime.utcfromtimestamp(since - SYNC_MARGIN_SECONDS).strftime('%Y-%m-%dT%H:%M:%SZ')
+        issue_index = self._get_issues(tasks, since=since)
+        return [task for task in tasks if issue_index.get(task)]
+
+    def alm_prefetch_tasks(self, tasks):
+        """
+        Pages through the issues of the repo once and indexes them by title, instead of
+        searching open and closed issues for every task
+        """
+        self.issue_index = None
+        if not tasks:
+            return
+
+        issue_index = self._get_issues(tasks)
+        logger.debug('Indexed %d GitHub issues for %d tasks' % (len(issue_index), len(tasks)))
+        self.issue_index = issue_index
+
+    def alm_get_task_by_id(self, task, alm_id):
+        task_id = self._extract_task_id(task['id'])
+        try:
+            issue = self.alm_plugin.call_api('repos/%s/issues/%s' % (self.project_uri, alm_id))
+        except APIError, err:
+            # Deleted issues are reported as gone
+            if getattr(err, 'code', None) in [404, 410]:
+                return None
+            raise AlmException('Unable to get task %s from GitHub. Reason: %s' % (task_id, str(err)))
+
+        if (task['alm_fixed_title'] not in issue['title'] or 'pull_request' in issue or
+                self.config[self.GITHUB_DUPLICATE_LABEL] in self._get_label_names(issue)):
+            return None
+        return GitHubTask(task_id, issue['number'], issue['state'], issue['updated_at'])
+
     def alm_get_task(self, task):
         task_id = self._extract_task_id(task['id'])
         if not task_id:
             return None
 
+        if self.issue_index is not None and self.issue_index.covers(task):
+            issue = self.issue_index.get(task)
+            if issue:
+                logger.info('Found task: %s', task_id)
+                return GitHubTask(task_id, issue['number'], issue['state'], issue['updated_at'])
+
+        # Issues whose label was removed are only found by their remembered number or title
+        github_task = self.alm_get_remembered_task(task)
+        if github_task:
+            logger.info('Found task: %s', task_id)
+            return github_task
+
+        if self.issue_index is not None and self.issue_index.covers(task):
+            # The index is complete, the title search is left to alm_search_task
+            return None
+        return self._search_task_by_title(task, task_id)
+
+    def alm_search_task(self, task):
+        task_id = self._extract_task_id(task['id'])
+        if not task_id or self.issue_index is None or not self.issue_index.covers(task):
+            # alm_get_task already searched for it
+            return None
+        return self._search_task_by_title(task, task_id)
+
+    def _search_task_by_title(self, task, task_id):
         try:
             # We need to perform 2 API calls to search open and closed issues
             open_issues = self.alm_plugin.call_api('legacy/issues/search/%s/%s/%s' %
@@ -269,9 +432,14 @@ class GitHubConnector(AlmConnector):
                               new_issue['state'],
                               new_issue['updated_at'])
 
+        if self.issue_index is not None:
+            self.issue_index.invalidate(task)
+
         if self.config['alm_standard_workflow'] and (task['status'] == 'DONE' or task['status'] == 'NA'):
             self.alm_update_task_status(alm_task, task['status'])
 
+        self._record_added_task(task, alm_task)
+
         return 'Repository: %s, Issue: %s' % (self.config['alm_project'], alm_task.get_alm_id())
 
     def alm_update_task_status(self, task, status):
@@ -297,6 +465,9 @@ class GitHubConnector(AlmConnector):
             raise AlmException('Unable to update task status to %s for GitHub issue %s. Reason: %s' %
                                (status, task.get_alm_id(), str(err)))
 
+        if self.issue_index is not None:
+            self.issue_index.invalidate_alm_id(task.get_alm_id())
+
         logger.debug('Status changed to %s for task %s in GitHub' % (status, task.get_alm_id()))
 
     def alm_disconnect(self):
@@ -1,10 +1,14 @@
 # NOTE: Before running ensure that the options are set properly in the
 #       configuration file
+import shutil
+import tempfile
+import time
 import unittest
 
 from github_response_generator import GitHubResponseGenerator
 from sdetools.alm_integration.tests.alm_plugin_test_base import AlmPluginTestBase
 from sdetools.alm_integration.alm_plugin_base import AlmConnector
+from sdetools.modules.sync_github import github_plugin
 from sdetools.modules.sync_github.github_plugin import GitHubConnector, GitHubAPI, AlmException
 
 
@@ -72,3 +76,110 @@ class TestGitHubCase(AlmPluginTestBase, unittest.TestCase):
                         'Additional Info - The field "title" is required for the resource "Issue"' % test_task['id']
 
         self.assert_exception(AlmException, '', exception_msg, self.connector.alm_add_task, test_task)
+
+    def test_search_exceptions_are_handled(self):
+        self.connector.alm_connect()
+        test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+        self.mock_alm_response.set_response_flags({'get_issue': 'fail'})
+        self.assertRaises(AlmException, self.connector.alm_get_task, test_task)
+
+    def test_prefetch_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for index in range(5):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        for test_task in test_tasks[:4]:
+            self.connector.alm_add_task(test_task)
+        self.response_generator.generator_update_resource('issue', test_tasks[1]['id'].split('T')[1],
+                                                          {'labels': ['task', 'duplicate']})
+        self.response_generator.generator_update_resource('issue', test_tasks[3]['id'].split('T')[1],
+                                                          {'labels': []})
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.connector.config['github_cache_dir'] = cache_dir
+        self.connector.initialize()
+        self.patch_per_page(2)
+
+        api_calls = self.count_api_calls()
+        self.connector.alm_prefetch_tasks(test_tasks)
+        self.assertEqual(len(api_calls), 2, 'Expected two pages of issues, got calls: %s' % api_calls)
+
+        del api_calls[:]
+        alm_id = test_tasks[0]['id'].split('T')[1]
+        self.assertEqual(self.connector.alm_get_task(test_tasks[0]).get_alm_id(), alm_id)
+        self.assertEqual(api_calls, [], 'Expected a lookup from the issue index, got calls: %s' % api_calls)
+
+        self.assertEqual(self.connector.alm_get_task(test_tasks[1]), None)
+        self.assertEqual(self.connector.alm_get_task(test_tasks[3]), None)
+        self.assertEqual(self.connector.alm_get_task(test_tasks[4]), None)
+        self.assertEqual(api_calls, [], 'Expected misses from the issue index, got calls: %s' % api_calls)
+
+        # Issues missing from the index are searched by title before they are added
+        self.assertEqual(self.connector.alm_search_task(test_tasks[1]), None)
+        alm_id = test_tasks[3]['id'].split('T')[1]
+        self.assertEqual(self.connector.alm_search_task(test_tasks[3]).get_alm_id(), alm_id)
+        self.assertEqual(self.connector.alm_search_task(test_tasks[4]), None)
+        self.assertEqual(len(api_calls), 6, 'Expected two searches per task, got calls: %s' % api_calls)
+        alm_id = test_tasks[0]['id'].split('T')[1]
+
+        # Unchanged pages are answered from the cache
+        self.connector.alm_prefetch_tasks(test_tasks)
+        self.assertEqual(self.connector.alm_get_task(test_tasks[0]).get_alm_id(), alm_id)
+        self.assertEqual(self.connector.alm_get_task(test_tasks[2]).get_status(), 'TODO')
+
+        # Status changes are looked up in GitHub again
+        alm_task = self.connector.alm_get_task(test_tasks[2])
+        self.connector.alm_update_task_status(alm_task, 'DONE')
+        self.assertEqual(self.connector.alm_get_task(test_tasks[2]).get_status(), 'DONE')
+
+    def test_get_changed_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for index in range(3):
+            test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+            self.connector.alm_add_task(test_task)
+            test_tasks.append(test_task)
+        self.response_generator.generator_update_resource('issue', test_tasks[1]['id'].split('T')[1],
+                                                          {'updated_at': '2011-04-22T13:33:48Z'})
+
+        changed_tasks = self.connector.alm_get_changed_tasks(test_tasks, time.time())
+        self.assertEqual([task['id'] for task in changed_tasks], [test_tasks[0]['id'], test_tasks[2]['id']])
+
+    def test_prefetch_tasks_not_modified(self):
+        self.connector.alm_connect()
+        test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+        self.connector.alm_add_task(test_task)
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.connector.config['github_cache_dir'] = cache_dir
+        self.connector.initialize()
+        self.connector.alm_prefetch_tasks([test_task])
+
+        revalidated = []
+        response_cache = self.connector.alm_plugin.response_cache
+        revalidate = response_cache.revalidate
+
+        def tracking_revalidate(key, response):
+            revalidated.append(key)
+            return revalidate(key, response)
+
+        response_cache.revalidate = tracking_revalidate
+        self.connector.alm_prefetch_tasks([test_task])
+        self.assertEqual(len(revalidated), 1)
+        self.assertNotNone(self.connector.alm_get_task(test_task))
+
+        # Without a cache directory every page is fetched in full
+        self.connector.config['github_cache_dir'] = ''
+        self.connector.initialize()
+        self.assertEqual(self.connector.alm_plugin.response_cache, None)
+
+    def patch_per_page(self, per_page):
+        issues_per_page = github_plugin.GITHUB_ISSUES_PER_PAGE
+        github_plugin.GITHUB_ISSUES_PER_PAGE = per_page
+
+        def restore():
+            github_plugin.GITHUB_ISSUES_PER_PAGE = issues_per_page
+        self.addCleanup(restore)
@@ -1,3 +1,5 @@
+from hashlib import sha1
+
 from sdetools.sdelib.testlib.response_generator import ResponseGenerator, RESPONSE_HEADERS
 from sdetools.sdelib.commons import urlencode_str
 
@@ -8,12 +10,15 @@ class GitHubResponseGenerator(ResponseGenerator):
         self.project_milestone = config['alm_project_version']
         self.username = config['alm_user']
         self.alm_project = config['alm_project']
+        self.alm_server = config['alm_server']
+        self.request_headers = {}
         resource_templates = ['user.json', 'issue.json', 'repo.json', 'milestone.json']
         rest_api_targets = {
             '/user': 'get_user',
             '/repos/%s$' % project_uri: 'get_repo',
             '/repos/%s/milestones' % project_uri: 'get_milestones',
             '/legacy/issues/search/%s' % project_uri: 'get_issue',
+            '/repos/%s/issues\?' % project_uri: 'get_issues',
             '/repos/%s/issues$' % project_uri: 'post_issue',
             '/repos/%s/issues/[0-9]*$' % project_uri: 'update_status'
         }
@@ -51,6 +56,10 @@ class GitHubResponseGenerator(ResponseGenerator):
                 }
         super(GitHubResponseGenerator, self).raise_error(error_code, message)
 
+    def get_response(self, target, flags, data, method, headers=None):
+        self.request_headers = dict([(name.lower(), value) for name, value in headers or []])
+        return super(GitHubResponseGenerator, self).get_response(target, flags, data, method, headers)
+
     """
        Response functions 
     """
@@ -91,12 +100,41 @@ class GitHubResponseGenerator(ResponseGenerator):
             "issues": self.generator_get_filtered_resource('issue', {'number': task_number, 'state': state})
         }
 
+    def get_issues(self, target, flag, data, method):
+        if flag:
+            self.raise_error('401')
+
+        params = self.get_url_parameters(target)
+        per_page = int(params['per_page'][0])
+        page = int(params.get('page', ['1'])[0])
+        issues = self.generator_get_all_resource('issue')
+        if 'labels' in params:
+            issues = [issue for issue in issues if params['labels'][0] in
+                      [isinstance(label, dict) and label['name'] or label for label in issue['labels']]]
+        if 'since' in params:
+            issues = [issue for issue in issues if issue['updated_at'] >= params['since'][0]]
+        issues.sort(key=lambda issue: int(issue['number']))
+        has_next_page = page * per_page < len(issues)
+        issues = issues[(page - 1) * per_page:page * per_page]
+
+        etag = '"%s"' % sha1(repr(issues)).hexdigest()
+        if self.request_headers.get('if-none-match') == etag:
+            # Integer code, as urllib2 reports it for the Not Modified check
+            self.raise_error(304, '')
+
+        headers = RESPONSE_HEADERS + [('ETag', etag)]
+        if has_next_page:
+            next_url = 'https://%s%s&page=%d' % (self.alm_server, target.split('&page=')[0], page + 1)
+            headers.append(('Link', '<%s>; rel="next"' % next_url))
+        return headers, issues
+
     def post_issue(self, target, flag, data, method):
         if not flag:
             task_number = self.extract_task_number_from_title(data['title'])
             data['state'] = 'open'
             data['number'] = task_number
             data['id'] = task_number
+            data['updated_at'] = self.get_current_utc_timestamp()
             self.generator_add_resource('issue', task_number, data)
 
             return RESPONSE_HEADERS, self.generate_resource_from_template('issue', data)
@@ -108,9 +146,14 @@ class GitHubResponseGenerator(ResponseGenerator):
     def update_status(self, target, flag, data, method):
         task_number = target.split('/')[-1]
 
-        if not flag:
+        if not flag and method == 'GET':
+            if not self.generator_resource_exists('issue', task_number):
+                self.raise_error(404)
+            return RESPONSE_HEADERS, self.generator_get_resource('issue', task_number)
+        elif not flag:
             if self.generator_resource_exists('issue', task_number) and self.is_data_valid(data, ['state']):
-                self.generator_update_resource('issue', task_number, {'state': data['state']})
+                self.generator_update_resource('issue', task_number, {'state': data['state'],
+                                                                      'updated_at': self.get_current_utc_timestamp()})
 
                 return RESPONSE_HEADERS, self.generator_get_resource('issue', task_number)
             else:
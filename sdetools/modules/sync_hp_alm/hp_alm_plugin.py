@@ -1,13 +1,14 @@
 # Copyright SDElements Inc
 # Extensible two way integration with HP Alm
 import re
+import threading
 
 from datetime import datetime
 from types import ListType
 from sdetools.sdelib.commons import json, urlencode_str
 from sdetools.sdelib.restclient import RESTBase, APIError
 from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector
-from sdetools.alm_integration.alm_plugin_base import AlmException
+from sdetools.alm_integration.alm_plugin_base import AlmException, SYNC_MARGIN_SECONDS
 from sdetools.extlib import markdown, http_req
 from sdetools.sdelib import log_mgr
 
@@ -20,6 +21,8 @@ HPALM_PRIORITY_MAP = {
     '3-4': '2-Medium',
     '1-2': '1-Low',
 }
+# HP Alm reports last-modified in the time zone of its server, so changes are asked for a day earlier
+HPALM_TIME_ZONE_MARGIN_SECONDS = 24 * 60 * 60
 
 
 class HPAlmAPIBase(RESTBase):
@@ -97,10 +100,75 @@ class HPAlmTask(AlmTask):
         return self.alm_task_type
 
 
+class HPAlmSnapshot(object):
+    """
+    Requirements, tests and requirement coverages of a project, fetched in bulk.
+
+    Requirements and tests are indexed by the task id prefix of their names
+    (e.g. T21 for 'T21- Title'). A task that is invalidated (e.g. after its
+    status is changed) is no longer covered and must be looked up in HP Alm.
+    """
+
+    def __init__(self):
+        self.entities = {'requirement': {}, 'test': {}}
+        self.coverages = {}
+        self.stale_task_ids = set()
+        # Tasks are reconciled by several workers when alm_sync_workers > 1
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_name_task_id(name):
+        if '-' not in name:
+            return None
+        return name[:name.find('-')]
+
+    def add_entity(self, entity):
+        task_id = self._get_name_task_id(entity['fields']['name'][0])
+        if task_id is None or entity['type'] not in self.entities:
+            return
+        self._lock.acquire()
+        try:
+            self.entities[entity['type']].setdefault(task_id, entity)
+            self.stale_task_ids.discard(task_id)
+        finally:
+            self._lock.release()
+
+    def covers(self, task_id):
+        return task_id not in self.stale_task_ids
+
+    def get_entity(self, entity_type, task_id):
+        return self.entities[entity_type].get(task_id)
+
+    def invalidate(self, task_id):
+        self._lock.acquire()
+        try:
+            for entities in self.entities.values():
+                entities.pop(task_id, None)
+            self.stale_task_ids.add(task_id)
+        finally:
+            self._lock.release()
+
+    def add_coverage(self, test_id, req_id):
+        self._lock.acquire()
+        try:
+            self.coverages.setdefault(test_id, set()).add(req_id)
+        finally:
+            self._lock.release()
+
+    def get_covered_requirements(self, test_id):
+        self._lock.acquire()
+        try:
+            return set(self.coverages.get(test_id, set()))
+        finally:
+            self._lock.release()
+
+
 class HPAlmConnector(AlmConnector):
     """Connects SD Elements to HP Alm"""
     alm_name = 'HP Alm'
     default_priority_map = HPALM_PRIORITY_MAP
+    feature_changed_tasks = True
+    SNAPSHOT_PAGE_SIZE = 500
 
     def __init__(self, config, alm_plugin):
         super(HPAlmConnector, self).__init__(config, alm_plugin)
@@ -140,6 +208,10 @@ class HPAlmConnector(AlmConnector):
         self.hp_alm_test_type_id = None
         #We will map requirements its associated tests based on the problem id
         self.requirement_to_test_mapping = {}
+        # Guards requirement_to_test_mapping and test_plan_folder_id when alm_sync_workers > 1
+        self._mapping_lock = threading.Lock()
+        # Filled in by alm_prefetch_tasks
+        self.snapshot = None
 
     def filter_tasks(self, tasks):
         """ We want to organize the tasks in a way such that we sync all non-test tasks first,
@@ -164,6 +236,17 @@ class HPAlmConnector(AlmConnector):
         else:
             return super(HPAlmConnector, self).filter_tasks(tasks)
 
+    def get_task_batches(self, tasks):
+        """ Every requirement must be synchronized before the test tasks, so that the
+        requirement coverages of the tests can be created
+        """
+        if 'testing' not in self.config['alm_phases']:
+            return [tasks]
+
+        dev_tasks = [task for task in tasks if task['phase'] != 'testing']
+        test_tasks = [task for task in tasks if task['phase'] == 'testing']
+        return [dev_tasks, test_tasks]
+
     def alm_connect_server(self):
         """ Verifies that HP Alm connection works """
         # We will authenticate via cookie
@@ -200,6 +283,66 @@ class HPAlmConnector(AlmConnector):
         else:
             return result
 
+    def _get_all_entities(self, collection, fields, query=None):
+        """ Pages through every entity in the project collection, or those matching query """
+        entities = []
+        while True:
+            query_args = {
+                'fields': fields,
+                'page-size': self.SNAPSHOT_PAGE_SIZE,
+                'start-index': len(entities) + 1
+            }
+            if query:
+                query_args['query'] = query
+            result = self._call_api_collection(collection, query_args)
+            if result is None or not result.get('entities'):
+                break
+            entities.extend(result['entities'])
+            if len(entities) >= result.get('TotalResults', 0):
+                break
+        return entities
+
+    def alm_get_changed_tasks(self, tasks, since):
+        since = datetime.utcfromtimestamp(since - SYNC_MARGIN_SECONDS - HPALM_TIME_ZONE_MARGIN_SECONDS)
+        query = "{last-modified[>'%s']}" % since.strftime('%Y-%m-%d %H:%M:%S')
+
+        entities = self._get_all_entities('requirements', 'id,name', query)
+        if [task for task in tasks if task['phase'] == 'testing']:
+            entities.extend(self._get_all_entities('tests', 'id,name', query))
+        changed_task_ids = set([HPAlmSnapshot._get_name_task_id(entity['fields']['name'][0]) for entity in entities])
+
+        return [task for task in tasks if self._extract_task_id(task['id']) in changed_task_ids]
+
+    def alm_prefetch_tasks(self, tasks):
+        if not tasks:
+            return
+
+        snapshot = HPAlmSnapshot()
+        for entity in self._get_all_entities('requirements', 'id,name,last-modified,status,req-priority'):
+            snapshot.add_entity(entity)
+        if [task for task in tasks if task['phase'] == 'testing']:
+            for entity in self._get_all_entities('tests', 'id,name,last-modified,exec-status'):
+                snapshot.add_entity(entity)
+            for coverage in self._get_all_entities('requirement-coverages', 'test-id,requirement-id'):
+                snapshot.add_coverage(coverage['fields']['test-id'][0], coverage['fields']['requirement-id'][0])
+        self.snapshot = snapshot
+
+        logger.info('Fetched %d requirements, %d tests and %d requirement coverages from HP Alm' %
+                    (len(snapshot.entities['requirement']), len(snapshot.entities['test']),
+                     sum([len(req_ids) for req_ids in snapshot.coverages.values()])))
+
+    def _get_task_entity(self, collection, task_id, query_args, use_snapshot=True):
+        """ Returns the requirement or test for a task, from the snapshot if it covers the task """
+        if use_snapshot and self.snapshot is not None and self.snapshot.covers(task_id):
+            if collection == 'tests':
+                return self.snapshot.get_entity('test', task_id)
+            return self.snapshot.get_entity('requirement', task_id)
+
+        result = self._call_api_collection(collection, query_args)
+        if result is None:
+            return None
+        return result['entities'][0]
+
     def alm_connect_project(self):
         # Connect to the project
         try:
@@ -236,11 +379,30 @@ class HPAlmConnector(AlmConnector):
             raise AlmException('Invalid hp_alm_done_statuses: %s. Expected one of %s' %
                                (difference_set, requirement_statuses))
 
+    def alm_get_task_by_id(self, task, alm_id):
+        task_id = self._extract_task_id(task['id'])
+        query_args = {
+            # The name condition makes sure the entity still belongs to the task
+            'query': "{id[%s];name['%s-*']}" % (alm_id, task_id),
+            'fields': 'id,name,last-modified'
+        }
+
+        if task['phase'] != 'testing':
+            return self._alm_call_requirement(task_id, query_args, task, use_snapshot=False)
+        else:
+            return self._alm_get_test_plan(task_id, query_args, task, use_snapshot=False)
+
     def alm_get_task(self, task):
         task_id = self._extract_task_id(task['id'])
 
         if not task_id:
             return None
+
+        if self.snapshot is None or not self.snapshot.covers(task_id):
+            alm_task = self.alm_get_remembered_task(task)
+            if alm_task:
+                return alm_task
+
         query_args = {
             'query': "{name['%s-*']}" % task_id,
             'fields': 'id,name,last-modified'
@@ -251,10 +413,10 @@ class HPAlmConnector(AlmConnector):
         else:
             return self._alm_get_test_plan(task_id, query_args, task)
 
-    def _alm_get_test_plan(self, task_id, query_args, task):
+    def _alm_get_test_plan(self, task_id, query_args, task, use_snapshot=True):
         query_args['fields'] += ',exec-status'
-        result = self._call_api_collection('tests', query_args)
-        req_ids = self.requirement_to_test_mapping.get(task['weakness']['id'])
+        result = self._get_task_entity('tests', task_id, query_args, use_snapshot)
+        req_ids = self._get_mapped_requirements(task)
 
         if result is None:
             # Check if an associated requirement is there.
@@ -264,7 +426,7 @@ class HPAlmConnector(AlmConnector):
                 self.ignored_tasks.append(task['id'])
             return None
         else:
-            field_data = result['entities'][0]['fields']
+            field_data = result['fields']
 
             if req_ids:
                 self._add_requirement_coverage(field_data['id'][0], field_data['name'][0], req_ids)
@@ -274,11 +436,23 @@ class HPAlmConnector(AlmConnector):
                              field_data['exec-status'][0],
                              field_data['last-modified'][0],
                              self.config['hp_alm_done_statuses'],
-                             result['entities'][0]['type'])
+                             result['type'])
 
-    def _alm_call_requirement(self, task_id, query_args, task, method=URLRequest.GET):
+    def _get_mapped_requirements(self, task):
+        """ Returns a copy of the requirement ids of the task weakness, or None if it has none """
+        self._mapping_lock.acquire()
+        try:
+            req_ids = self.requirement_to_test_mapping.get(task['weakness']['id'])
+            if req_ids is None:
+                return None
+            return list(req_ids)
+        finally:
+            self._mapping_lock.release()
+
+    def _alm_call_requirement(self, task_id, query_args, task, method=URLRequest.GET, use_snapshot=True):
         if method == URLRequest.GET:
             query_args['fields'] += ',status,req-priority'
+            result = self._get_task_entity('requirements', task_id, query_args, use_snapshot)
         else:
             query_args.extend([
                 ('type-id', self.issue_type),
@@ -286,14 +460,18 @@ class HPAlmConnector(AlmConnector):
                 ('req-priority', self.translate_priority(task['priority']))
             ])
             query_args = self._build_json_args(query_args, 'requirement')
-        result = self._call_api_collection('requirements', query_args, method)
+            result = self._call_api_collection('requirements', query_args, method)
+            if result is not None and self.snapshot is not None:
+                self.snapshot.add_entity(result)
 
         if result is None:
             return None
-        if result.get('entities'):
-            result = result['entities'][0]
-        if self.requirement_to_test_mapping:
-            self.requirement_to_test_mapping[task['weakness']['id']].append(result['fields']['id'][0])
+        self._mapping_lock.acquire()
+        try:
+            if self.requirement_to_test_mapping:
+                self.requirement_to_test_mapping[task['weakness']['id']].append(result['fields']['id'][0])
+        finally:
+            self._mapping_lock.release()
 
         return HPAlmTask(task_id,
                          result['fields']['id'][0],
@@ -303,9 +481,13 @@ class HPAlmConnector(AlmConnector):
                          result['type'])
 
     def _alm_add_test_plan(self, task_id, field_data, task):
-        if self.test_plan_folder_id is None:
-            _query = "{name['%s']}" % self.config['hp_alm_test_plan_folder']
-            self.test_plan_folder_id = self._fetch_test_plan_folder_id(_query) or self._create_test_plan_folder()
+        self._mapping_lock.acquire()
+        try:
+            if self.test_plan_folder_id is None:
+                _query = "{name['%s']}" % self.config['hp_alm_test_plan_folder']
+                self.test_plan_folder_id = self._fetch_test_plan_folder_id(_query) or self._create_test_plan_folder()
+        finally:
+            self._mapping_lock.release()
 
         field_data.extend([
             ('parent-id', self.test_plan_folder_id),
@@ -315,7 +497,9 @@ class HPAlmConnector(AlmConnector):
         ])
         json_data = self._build_json_args(field_data, 'test')
         result = self._call_api_collection('tests', json_data, URLRequest.POST)
-        req_ids = self.requirement_to_test_mapping.get(task['weakness']['id'])
+        if self.snapshot is not None:
+            self.snapshot.add_entity(result)
+        req_ids = self._get_mapped_requirements(task)
 
         if req_ids:
             self._add_requirement_coverage(result['fields']['id'][0], result['fields']['name'][0], req_ids)
@@ -350,9 +534,15 @@ class HPAlmConnector(AlmConnector):
         if self.config['alm_standard_workflow'] and (task['status'] == 'DONE' or task['status'] == 'NA'):
             self.alm_update_task_status(alm_task, task['status'])
 
+        self._record_added_task(task, alm_task)
+
         return "HP Alm %s ID: %s" % (task_type, alm_task.get_alm_id())
 
     def _get_uncovered_requirements(self, test_id, req_ids):
+        if self.snapshot is not None:
+            covered_req_ids = self.snapshot.get_covered_requirements(test_id)
+            return [r for r in req_ids if r not in covered_req_ids]
+
         query_args = {
             'query': "{test-id[%s]}" % test_id,
             'fields': 'requirement-id'
@@ -375,6 +565,8 @@ class HPAlmConnector(AlmConnector):
             ], 'requirement-coverage')
 
             self._call_api_collection('requirement-coverages', json_data, URLRequest.POST)
+            if self.snapshot is not None:
+                self.snapshot.add_coverage(test_id, req_id)
 
             logger.info('Added test %s as a requirement coverage for %s' % (test_id, req_id))
 
@@ -403,6 +595,9 @@ class HPAlmConnector(AlmConnector):
             raise AlmException('Unable to update task status to %s for requirement: %s in HP Alm because of %s' %
                                (status, task.get_alm_id(), err))
 
+        if self.snapshot is not None:
+            self.snapshot.invalidate(task.get_task_id())
+
         logger.debug('Status changed to %s for task %s in HP Alm', status, task.get_alm_id())
 
     def alm_disconnect(self):
@@ -1,5 +1,6 @@
 # NOTE: Before running ensure that the options are set properly in the
 #       configuration file
+import time
 import unittest
 
 from hp_alm_response_generator import HPAlmResponseGenerator
@@ -92,6 +93,78 @@ class TestHPAlmCase(AlmPluginTestBase, unittest.TestCase):
         self.assertTrue(hp_requirement_id not in uncovered_requirements, 'Expected to find a requirement coverage for '
                 'test id %s and requirement id %s' % (hp_test_id, hp_requirement_id))
 
+    def test_add_requirement_coverage_with_workers(self):
+        self.config['alm_sync_workers'] = '4'
+        self.config['alm_phases'] = ['requirements', 'testing']
+        self.connector.initialize()
+        self.mock_sde_response.clear_tasks()
+        test_tasks = []
+        requirement_tasks = []
+        for i in xrange(4):
+            test_task = self.mock_sde_response.generate_sde_task(phase='testing')
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        for i in xrange(4):
+            requirement_task = self.mock_sde_response.generate_sde_task(phase='requirements')
+            requirement_tasks.append(AlmConnector.add_alm_title(self.config, requirement_task))
+        self.connector.synchronize()
+
+        hp_requirement_ids = [self.connector.alm_get_task(task).get_alm_id() for task in requirement_tasks]
+        # Look the coverages up in HP Alm rather than in the snapshot of the sync
+        self.connector.snapshot = None
+        for test_task in test_tasks:
+            alm_task = self.connector.alm_get_task(test_task)
+            self.assertNotNone(alm_task, 'Expected test %s in HP Alm' % test_task['id'])
+            uncovered_requirements = self.connector._get_uncovered_requirements(alm_task.get_alm_id(),
+                                                                                hp_requirement_ids)
+            self.assertEqual(uncovered_requirements, [], 'Expected test %s to cover every requirement, missing %s' %
+                             (test_task['id'], uncovered_requirements))
+
+    def test_prefetch_tasks(self):
+        self.config['alm_phases'] = ['requirements', 'testing']
+        self.connector.alm_connect()
+        test_tasks = []
+        for phase in ['requirements', 'requirements', 'requirements', 'testing', 'testing']:
+            test_task = self.mock_sde_response.generate_sde_task(phase=phase)
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        for test_task in test_tasks[:2] + test_tasks[3:4]:
+            self.connector.alm_add_task(test_task)
+        hp_requirement_id = self.connector.alm_get_task(test_tasks[0]).get_alm_id()
+        hp_test_id = self.connector.alm_get_task(test_tasks[3]).get_alm_id()
+        self.connector._add_requirement_coverage(hp_test_id, 'Test', [hp_requirement_id])
+
+        # Use single-entity pages to exercise pagination
+        self.connector.SNAPSHOT_PAGE_SIZE = 1
+        self.connector.alm_prefetch_tasks(test_tasks)
+
+        api_calls = self.count_api_calls()
+        self.assertEqual(self.connector.alm_get_task(test_tasks[0]).get_alm_id(), hp_requirement_id)
+        self.assertNotNone(self.connector.alm_get_task(test_tasks[1]))
+        self.assertEqual(self.connector.alm_get_task(test_tasks[2]), None)
+        self.assertEqual(self.connector.alm_get_task(test_tasks[3]).get_alm_id(), hp_test_id)
+        self.assertEqual(self.connector.alm_get_task(test_tasks[4]), None)
+        self.assertEqual(self.connector._get_uncovered_requirements(hp_test_id, [hp_requirement_id, 'uncovered']),
+                         ['uncovered'])
+        self.assertEqual(api_calls, [], 'Expected lookups from the snapshot, got calls: %s' % api_calls)
+
+        # Status changes are looked up in HP Alm again
+        alm_task = self.connector.alm_get_task(test_tasks[0])
+        self.connector.alm_update_task_status(alm_task, 'DONE')
+        self.assertEqual(self.connector.alm_get_task(test_tasks[0]).get_status(), 'DONE')
+
+    def test_get_changed_tasks(self):
+        self.config['alm_phases'] = ['requirements', 'testing']
+        self.connector.alm_connect()
+        test_tasks = []
+        for phase in ['requirements', 'requirements', 'testing']:
+            test_task = self.mock_sde_response.generate_sde_task(phase=phase)
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+            self.connector.alm_add_task(test_tasks[-1])
+        self.response_generator.generator_update_resource('requirement', test_tasks[1]['id'].split('T')[1],
+                                                          {'last-modified': '2013-10-02T20:27:27Z'})
+
+        changed_tasks = self.connector.alm_get_changed_tasks(test_tasks, time.time())
+        self.assertEqual([task['id'] for task in changed_tasks], [test_tasks[0]['id'], test_tasks[2]['id']])
+
     def test_update_test_plan_status(self):
         self.connector.alm_connect()
         test_task = self.mock_sde_response.generate_sde_task(phase='testing')
@@ -1,6 +1,8 @@
 import json
 import re
+from datetime import datetime
 
+from urlparse import urlparse, parse_qs
 from cookielib import Cookie
 from sdetools.sdelib.commons import urlencode_str
 from sdetools.sdelib.testlib.response_generator import ResponseGenerator, RESPONSE_HEADERS
@@ -44,7 +46,7 @@ class HPAlmResponseGenerator(ResponseGenerator):
                 query, _ = self.get_url_parameters(target)
                 entities = self.generator_get_filtered_resource('requirement-coverage', query)
 
-                return RESPONSE_HEADERS, self.generate_collection_entity(entities)
+                return RESPONSE_HEADERS, self.get_page(target, entities)
             elif method == 'POST':
                 if not self.is_data_valid(data, ['test-id', 'requirement-id']):
                     self.raise_error('405')
@@ -70,8 +72,7 @@ class HPAlmResponseGenerator(ResponseGenerator):
             if method == 'GET':
                 query, fields = self.get_url_parameters(target)
 
-                return RESPONSE_HEADERS, self.generate_collection_entity(
-                    self.generator_get_filtered_resource('test', query))
+                return RESPONSE_HEADERS, self.get_page(target, self.get_filtered_entities('test', query))
             elif method == 'POST':
                 task_number = self.extract_task_number_from_title(data['name'].replace('-', ':'))
                 data['id'] = task_number
@@ -116,9 +117,9 @@ class HPAlmResponseGenerator(ResponseGenerator):
 
     def get_requirements(self, target, flag, data):
         queries, fields = self.get_url_parameters(target)
-        entities = self.generator_get_filtered_resource('requirement', queries)
+        entities = self.get_filtered_entities('requirement', queries)
 
-        return RESPONSE_HEADERS, self.generate_collection_entity(entities)
+        return RESPONSE_HEADERS, self.get_page(target, entities)
 
     def post_requirements(self, flag, data):
         if not flag:
@@ -139,7 +140,8 @@ class HPAlmResponseGenerator(ResponseGenerator):
         if not self.is_data_valid(data, ['id', 'status']):
             self.raise_error('405')
 
-        self.generator_update_resource('requirement', data['id'], {'status': data['status']})
+        self.generator_update_resource('requirement', data['id'], {'status': data['status'],
+                                                                   'last-modified': self.get_current_timestamp()})
         return RESPONSE_HEADERS, None
 
     def call_requirements(self, target, flag, data, method):
@@ -215,10 +217,19 @@ class HPAlmResponseGenerator(ResponseGenerator):
             return data
 
     def get_url_parameters(self, url):
-        query, fields = [q[0] for q in super(HPAlmResponseGenerator, self).get_url_parameters(url).values()]
+        # Parsed before unquoting, since ';' separates the conditions of a query
+        params = parse_qs(urlparse(url).query)
+        query = params.get('query', [''])[0]
+        fields = params.get('fields', [''])[0]
         queries = {}
 
         for q in query.split(';'):
+            if not q.strip('{}'):
+                continue
+            modified_since = re.match("last-modified\[>'([^']*)'\]", q.strip('{}'))
+            if modified_since:
+                queries['last-modified>'] = modified_since.group(1)
+                continue
             key, value = re.findall('[-\w ]+', q)
             if key == 'name':
                 value = value.replace(':', '-')
@@ -227,6 +238,31 @@ class HPAlmResponseGenerator(ResponseGenerator):
 
         return queries, fields
 
+    def get_filtered_entities(self, resource_type, queries):
+        """ Returns the resources matching queries, including a last-modified[>'date'] condition """
+        modified_since = queries.pop('last-modified>', None)
+        entities = self.generator_get_filtered_resource(resource_type, queries)
+        if modified_since is None:
+            return entities
+
+        modified_since = datetime.strptime(modified_since, '%Y-%m-%d %H:%M:%S')
+        changed_entities = []
+        for entity in entities:
+            fields = dict([(field['Name'], field['values'][0]['value']) for field in entity['Fields']])
+            if datetime.strptime(fields['last-modified'], '%Y-%m-%dT%H:%M:%SZ') > modified_since:
+                changed_entities.append(entity)
+        return changed_entities
+
+    def get_page(self, url, entities):
+        """ Applies the page-size and start-index parameters of a collection request """
+        params = super(HPAlmResponseGenerator, self).get_url_parameters(url)
+        collection = self.generate_collection_entity(entities)
+        if 'page-size' in params:
+            start_index = int(params.get('start-index', ['1'])[0])
+            page_size = int(params['page-size'][0])
+            collection['entities'] = entities[start_index - 1:start_index - 1 + page_size]
+        return collection
+
     @staticmethod
     def encode_response(response):
         """ Convert response into a string """
@@ -30,6 +30,8 @@ class Command(BaseCommand):
 
         if self.config.jira_api_ver == 4:
             self.jira.alm_plugin = JIRASoapAPI(self.config)
+            # The SOAP client can not be shared between threads
+            self.jira.alm_max_concurrency = 1
             
         self.jira.initialize()
         self.jira.synchronize()
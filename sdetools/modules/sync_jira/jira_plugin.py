@@ -1,8 +1,10 @@
 # Copyright SDElements Inc
 # Extensible two way integration with JIRA
+import time
 
 from sdetools.alm_integration.alm_plugin_base import AlmConnector, AlmException
 from sdetools.modules.sync_jira.jira_markdown import convert_markdown
+from sdetools.modules.sync_jira.jira_shared import JIRATask
 
 from sdetools.sdelib import log_mgr
 logger = log_mgr.mods.add_mod(__name__)
@@ -14,11 +16,14 @@ JIRA_DEFAULT_PRIORITY_MAP = {
     '3-4': 'Minor',
     '1-2': 'Trivial',
 }
+# Extra minutes searched for updated issues in an incremental sync, to allow for clock skew
+SYNC_MARGIN_MINUTES = 5
 
 
 class JIRAConnector(AlmConnector):
     alm_name = 'JIRA'
     feature_custom_lookup = True
+    feature_changed_tasks = True
     default_priority_map = JIRA_DEFAULT_PRIORITY_MAP
 
     def __init__(self, config, alm_plugin):
@@ -106,18 +111,51 @@ class JIRAConnector(AlmConnector):
         if missing_priorities:
             raise AlmException('Incorrect priority mapping values specified: %s' % ', '.join(missing_priorities))
 
+    def alm_prefetch_tasks(self, tasks):
+        # Only issues we created carry the label, and only if the issue type has labels
+        if not hasattr(self.alm_plugin, 'prefetch_tasks') or not self.alm_plugin.has_field('labels'):
+            return
+        task_index = self.alm_plugin.prefetch_tasks(tasks)
+        logger.info('Pre-fetched %d JIRA issues for %d tasks' % (len(task_index), len(tasks)))
+
+    def alm_get_changed_tasks(self, tasks, since):
+        # Only issues we created carry the label, and only if the issue type has labels
+        if not hasattr(self.alm_plugin, 'get_changed_tasks') or not self.alm_plugin.has_field('labels'):
+            return None
+        # JQL dates are in the time zone of the JIRA user, so ask relative to now instead
+        minutes = int((time.time() - since) / 60) + SYNC_MARGIN_MINUTES
+        return self.alm_plugin.get_changed_tasks(tasks, '-%dm' % minutes)
+
+    def alm_get_task_by_id(self, task, alm_id):
+        return self.alm_plugin.get_task_by_key(task, self._extract_task_id(task['id']), alm_id)
+
     def alm_get_task(self, task):
         task_id = self._extract_task_id(task['id'])
 
-        task = self.alm_plugin.get_task(task, task_id)
-        if task:
+        jira_task = None
+        task_index = self.alm_plugin.task_index
+        if task_index is None or not task_index.get(task):
+            jira_task = self.alm_get_remembered_task(task)
+        if jira_task is None:
+            jira_task = self.alm_plugin.get_task(task, task_id)
+        return self._assign_project_version(jira_task)
+
+    def alm_search_task(self, task):
+        task_index = self.alm_plugin.task_index
+        if task_index is None or not task_index.covers(task):
+            # alm_get_task already searched for it
+            return None
+        return self._assign_project_version(self.alm_plugin.search_task(task, self._extract_task_id(task['id'])))
+
+    def _assign_project_version(self, jira_task):
+        if jira_task:
             # Assign a project version
-            if self.config['alm_project_version'] and not (self.config['alm_project_version'] in task.versions):
+            if self.config['alm_project_version'] and not (self.config['alm_project_version'] in jira_task.versions):
                 # new version needed, re-open it and add it
-                self.alm_update_task_status(task, "TODO")
-                self.alm_set_version(task, self.config['alm_project_version'])
-            
-        return task
+                self.alm_update_task_status(jira_task, "TODO")
+                self.alm_set_version(jira_task, self.config['alm_project_version'])
+
+        return jira_task
 
     def alm_add_task(self, task):
         task['formatted_content'] = self.sde_get_task_content(task)
@@ -130,6 +168,11 @@ class JIRAConnector(AlmConnector):
             alm_task = self.alm_get_task(task)
             self.alm_update_task_status(alm_task, task['status'])
 
+        # Search results may not include the new issue yet, so it is recorded by its key
+        self._record_added_task(task, JIRATask(self._extract_task_id(task['id']), new_issue['key'],
+                                               task['alm_priority'], None, None, None,
+                                               self.config['jira_done_statuses'], []))
+
         url = self._get_issue_url(new_issue['key'])
 
         #Return a unique identifier to this task in JIRA
@@ -1,5 +1,5 @@
 from sdetools.sdelib.restclient import RESTBase, APIError
-from sdetools.alm_integration.alm_plugin_base import AlmException
+from sdetools.alm_integration.alm_plugin_base import AlmException, AlmTaskIndex
 from sdetools.modules.sync_jira.jira_shared import JIRATask
 from sdetools.sdelib.commons import json
 
@@ -9,6 +9,9 @@ class JIRARestAPI(RESTBase):
     # the fields we are ready to set, at a minimum
     BASE_FIELDS = ['project', 'summary', 'labels', 'priority', 'versions', 'parent',
                    'description', 'issuetype', 'reporter']
+    # the fields needed to build a JIRATask, and the page size used for bulk searches
+    SEARCH_FIELDS = ['summary', 'status', 'resolution', 'versions', 'priority', 'updated']
+    SEARCH_PAGE_SIZE = 100
 
     def __init__(self, config):
         super(JIRARestAPI, self).__init__('alm', 'JIRA', config, 'rest/api/2')
@@ -16,6 +19,7 @@ class JIRARestAPI(RESTBase):
         self.custom_fields = {}
         self.custom_lookup_fields = []
         self.fields = {}
+        self.task_index = None
 
     def parse_response(self, result, headers):
         if result == "":
@@ -153,11 +157,8 @@ class JIRARestAPI(RESTBase):
     def get_subtask_issue_types(self):
         return self.get_issue_types()
 
-    def get_task(self, task, task_id):
-
-        task_lookup = []
-        task_lookup.append('summary~"\\"%s\\""' % self.urlencode_str(task['alm_fixed_title']))
-
+    def _get_custom_lookup_conditions(self):
+        conditions = []
         for field_data in self.custom_lookup_fields:
 
             # clauseNames is a list of JQL field name aliases. We only need one
@@ -168,13 +169,91 @@ class JIRARestAPI(RESTBase):
             if isinstance(field_value, list):
                 for list_item in field_value:
                     condition = '%s=\'%s\'' % (field_clause, self.urlencode_str(list_item))
-                    task_lookup.append(condition)
+                    conditions.append(condition)
             else:
                 if field_meta['schema']['type'] == 'string':
                     condition = '%s~"\\"%s\\""' % (field_clause, self.urlencode_str(field_value))
                 else:
                     condition = '%s=\'%s\'' % (field_clause, self.urlencode_str(field_value))
-                task_lookup.append(condition)
+                conditions.append(condition)
+        return conditions
+
+    def _search_labelled_issues(self, conditions, fields):
+        """
+        Returns the issues in the project carrying the SD Elements label that also
+        match the JQL conditions, loading them a page at a time
+        """
+        task_lookup = ['labels%%3D\'%s\'' % self.urlencode_str(self.config['alm_issue_label'])]
+        task_lookup.extend(conditions)
+        task_lookup.extend(self._get_custom_lookup_conditions())
+
+        issues = []
+        start_at = 0
+        while True:
+            try:
+                url = 'search?jql=project%%3D\'%s\'%%20AND%%20%s&startAt=%d&maxResults=%d&fields=%s' % (
+                    self.config['alm_project'], '%20AND%20'.join(task_lookup), start_at,
+                    self.SEARCH_PAGE_SIZE, ','.join(fields))
+                result = self.call_api(url)
+            except APIError, error:
+                raise AlmException("Unable to search for tasks in JIRA. %s" % error)
+
+            issues.extend(result['issues'])
+
+            start_at += len(result['issues'])
+            if not result['issues'] or start_at >= result['total']:
+                break
+
+        return issues
+
+    def prefetch_tasks(self, tasks):
+        """
+        Loads all issues carrying the SD Elements label in the project and indexes
+        them by task so that get_task needs no further search
+        """
+        task_index = AlmTaskIndex(tasks)
+        for jtask in self._search_labelled_issues([], self.SEARCH_FIELDS):
+            task_index.add(jtask['fields']['summary'], jtask, jtask['key'])
+
+        self.task_index = task_index
+        return task_index
+
+    def get_changed_tasks(self, tasks, updated_since):
+        """ Returns the tasks whose issue was updated since the JQL date updated_since """
+        conditions = ['updated%%3E%%3D\'%s\'' % self.urlencode_str(updated_since)]
+        task_index = AlmTaskIndex(tasks)
+        for jtask in self._search_labelled_issues(conditions, ['summary']):
+            task_index.add(jtask['fields']['summary'], jtask, jtask['key'])
+
+        return [task for task in tasks if task_index.get(task)]
+
+    def get_task_by_key(self, task, task_id, alm_id):
+        """ Returns the issue with key alm_id if it is still the issue of the task """
+        try:
+            jtask = self.call_api('issue/%s?fields=%s' % (alm_id, ','.join(self.SEARCH_FIELDS)))
+        except APIError, error:
+            if getattr(error, 'code', None) == 404:
+                return None
+            raise AlmException("Unable to get task %s from JIRA. %s" % (task_id, error))
+
+        if task['alm_fixed_title'] not in jtask['fields']['summary']:
+            return None
+        return self._to_jira_task(jtask, task_id)
+
+    def get_task(self, task, task_id):
+        if self.task_index is not None and self.task_index.covers(task):
+            jtask = self.task_index.get(task)
+            if not jtask:
+                return None
+            return self._to_jira_task(jtask, task_id)
+
+        return self.search_task(task, task_id)
+
+    def search_task(self, task, task_id):
+        """ Searches for the issue of the task by title, which also finds issues whose label was removed """
+        task_lookup = []
+        task_lookup.append('summary~"\\"%s\\""' % self.urlencode_str(task['alm_fixed_title']))
+        task_lookup.extend(self._get_custom_lookup_conditions())
 
         try:
             url = 'search?jql=project%%3D\'%s\'%%20AND%%20%s' % (self.config['alm_project'],
@@ -188,8 +267,9 @@ class JIRARestAPI(RESTBase):
             return None
 
         # We will use the first result from the query
-        jtask = result['issues'][0]
+        return self._to_jira_task(result['issues'][0], task_id)
 
+    def _to_jira_task(self, jtask, task_id):
         task_resolution = None
         if 'resolution' in jtask['fields'] and jtask['fields']['resolution']:
             task_resolution = jtask['fields']['resolution']['name']
@@ -212,8 +292,13 @@ class JIRARestAPI(RESTBase):
                         self.config['jira_done_statuses'],
                         task_versions)
 
+    def _invalidate_task(self, alm_id):
+        if self.task_index is not None:
+            self.task_index.invalidate_alm_id(alm_id)
+
     def set_version(self, task, project_version):
         # REST allows us to add versions ad hoc
+        self._invalidate_task(task.get_alm_id())
         try:
             remote_url = 'issue/%s' % task.get_alm_id()
             version_update = {'update': {'versions': [{'add': {'name': project_version}}]}}
@@ -314,6 +399,9 @@ class JIRARestAPI(RESTBase):
         if len(unsupported_fields) > 0:
             raise AlmException('Unable to add issue due to unsupported fields: %s' % ', '.join(unsupported_fields))
 
+        if self.task_index is not None:
+            self.task_index.invalidate(task)
+
         # Create the issue in JIRA
         try:
             issue = self.call_api('issue', method=self.URLRequest.POST, args=args)
@@ -346,6 +434,7 @@ class JIRARestAPI(RESTBase):
 
     def remove_task(self, task):
         delete_url = 'issue/%s' % task.get_alm_id()
+        self._invalidate_task(task.get_alm_id())
         try:
             self.call_api(delete_url, method=self.URLRequest.DELETE)
         except self.APIFormatError:
@@ -358,6 +447,7 @@ class JIRARestAPI(RESTBase):
     def update_task_status(self, task_id, status_id):
         trans_url = 'issue/%s/transitions' % task_id
         trans_args = {'transition': {'id': status_id}}
+        self._invalidate_task(task_id)
         try:
             self.call_api(trans_url, args=trans_args, method=self.URLRequest.POST)
         except self.APIFormatError:
@@ -5,7 +5,7 @@ import urllib2
 from sdetools.extlib import SOAPpy
 from sdetools.extlib import http_req
 
-from sdetools.alm_integration.alm_plugin_base import AlmException
+from sdetools.alm_integration.alm_plugin_base import AlmException, AlmTaskIndex
 from sdetools.modules.sync_jira.jira_shared import JIRATask
 
 from sdetools.sdelib import log_mgr
@@ -38,10 +38,18 @@ class SOAPProxyWrap:
 
 
 class JIRASoapAPI:
+    # JIRA 4 SOAP searches cannot be paged, so the label search asks for everything up to this limit
+    SEARCH_MAX_RESULTS = 1000
+
     def __init__(self, config):
         self.config = config
         self.statuses = None
         self.priorities = None
+        self.status_names = {}
+        self.priority_names = {}
+        self.priority_ids = {}
+        self.task_index = None
+        self.task_index_truncated = False
         self.auth = None
         self.versions = None
         self.custom_fields = []
@@ -86,6 +94,9 @@ class JIRASoapAPI:
         # For JIRA 4 we need the ID-Name mapping for status and priority
         self.statuses = self.proxy.getStatuses(self.auth)
         self.priorities = self.proxy.getPriorities(self.auth)
+        self.status_names = dict((status['id'], status['name']) for status in self.statuses)
+        self.priority_names = dict((priority['id'], priority['name']) for priority in self.priorities)
+        self.priority_ids = dict((priority['name'], priority['id']) for priority in self.priorities)
 
     def connect_project(self):
         # Test for project existence
@@ -104,12 +115,7 @@ class JIRASoapAPI:
         """
         Check that the priority from the mapping exists in JIRA
         """
-        if not self.priorities:
-            return False
-        for priority in self.priorities:
-            if priority['name'] == priority_name:
-                return True
-        return False
+        return priority_name in self.priority_ids
 
     def get_issue_types(self):
         try:
@@ -123,7 +129,88 @@ class JIRASoapAPI:
         except SOAPpy.Types.faultType:
             raise AlmException('Unable to get subtask issuetypes from JIRA')
 
+    def prefetch_tasks(self, tasks):
+        """
+        Loads all issues carrying the SD Elements label in the project with a single
+        search and indexes them by task so that get_task needs no further search
+        """
+        try:
+            jql = 'project="%s" AND labels="%s"' % (self.config['alm_project'], self.config['alm_issue_label'])
+            issues = self.proxy.getIssuesFromJqlSearch(self.auth, jql,
+                                                       SOAPpy.Types.intType(self.SEARCH_MAX_RESULTS))
+        except SOAPpy.Types.faultType:
+            raise AlmException("Unable to search for tasks in JIRA")
+
+        if not issues:
+            issues = []
+
+        task_index = AlmTaskIndex(tasks)
+        for jtask in issues:
+            task_index.add(jtask['summary'], jtask, jtask['key'])
+
+        self.task_index_truncated = len(issues) >= self.SEARCH_MAX_RESULTS
+        if self.task_index_truncated:
+            # The result was cut off, the tasks we did not find are searched for by title
+            logger.warning('Label search returned %d or more issues, looking up the rest one by one' %
+                           self.SEARCH_MAX_RESULTS)
+
+        self.task_index = task_index
+        return task_index
+
+    def get_changed_tasks(self, tasks, updated_since):
+        """
+        Returns the tasks whose issue was updated since the JQL date updated_since,
+        or None if there are too many updated issues to tell
+        """
+        try:
+            jql = 'project="%s" AND labels="%s" AND updated>="%s"' % (self.config['alm_project'],
+                                                                      self.config['alm_issue_label'], updated_since)
+            issues = self.proxy.getIssuesFromJqlSearch(self.auth, jql,
+                                                       SOAPpy.Types.intType(self.SEARCH_MAX_RESULTS))
+        except SOAPpy.Types.faultType:
+            raise AlmException("Unable to search for updated tasks in JIRA")
+
+        if not issues:
+            return []
+        if len(issues) >= self.SEARCH_MAX_RESULTS:
+            return None
+
+        task_index = AlmTaskIndex(tasks)
+        for jtask in issues:
+            task_index.add(jtask['summary'], jtask, jtask['key'])
+
+        return [task for task in tasks if task_index.get(task)]
+
+    def get_task_by_key(self, task, task_id, alm_id):
+        """ Returns the issue with key alm_id if it is still the issue of the task """
+        try:
+            jtask = self.proxy.getIssue(self.auth, alm_id)
+        except SOAPpy.Types.faultType:
+            # A deleted issue is reported as a fault, the search that follows tells any other problem apart
+            return None
+
+        if not jtask or task['alm_fixed_title'] not in jtask['summary']:
+            return None
+        return self._to_jira_task(jtask, task_id)
+
     def get_task(self, task, task_id):
+        if self.task_index is not None and self.task_index.covers(task):
+            jtask = self.task_index.get(task)
+            if jtask:
+                return self._to_jira_task(jtask, task_id)
+            if not self.task_index_truncated:
+                return None
+
+        return self._search_task_by_title(task, task_id)
+
+    def search_task(self, task, task_id):
+        """ Searches for the issue of the task by title, which also finds issues whose label was removed """
+        if self.task_index_truncated:
+            # get_task already searched for the task by title
+            return None
+        return self._search_task_by_title(task, task_id)
+
+    def _search_task_by_title(self, task, task_id):
         try:
             jql = 'project="%s" AND summary~"\\"%s\\""' % (self.config['alm_project'], task['alm_fixed_title'])
             issues = self.proxy.getIssuesFromJqlSearch(self.auth, jql, SOAPpy.Types.intType(1))
@@ -136,8 +223,9 @@ class JIRASoapAPI:
             return None
 
         # We will use the first result from the query
-        jtask = issues[0]
+        return self._to_jira_task(issues[0], task_id)
 
+    def _to_jira_task(self, jtask, task_id):
         task_resolution = None
         task_status = None
         task_priority = None
@@ -146,15 +234,9 @@ class JIRASoapAPI:
         if hasattr(jtask, 'resolution') and jtask.resolution:
             task_resolution = jtask.resolution
         if jtask.status:
-            for status in self.statuses:
-                if status['id'] == jtask.status:
-                    task_status = status['name']
-                    break
+            task_status = self.status_names.get(jtask.status)
         if hasattr(jtask, 'priority'):
-            for priority in self.priorities:
-                if priority['id'] == jtask.priority:
-                    task_priority = priority['name']
-                    break
+            task_priority = self.priority_names.get(jtask.priority)
         if hasattr(jtask, 'affectsVersions') and jtask.affectsVersions:
             for version in jtask.affectsVersions:
                 task_versions.append(version['name'])
@@ -168,6 +250,10 @@ class JIRASoapAPI:
                         self.config['jira_done_statuses'],
                         task_versions)
 
+    def _invalidate_task(self, alm_id):
+        if self.task_index is not None:
+            self.task_index.invalidate_alm_id(alm_id)
+
     def get_version(self, version_name):
         for v in self.versions:
             if v['name'] == version_name:
@@ -236,6 +322,7 @@ class JIRASoapAPI:
 
     def set_version(self, task, project_version):
         update = [{'id': 'versions', 'values': self.get_affected_versions(task)}]
+        self._invalidate_task(task.get_alm_id())
         try:
             self.proxy.updateIssue(self.auth, task.get_alm_id(), update)
         except (SOAPpy.Types.faultType, AlmException):
@@ -245,11 +332,7 @@ class JIRASoapAPI:
 
     def add_task(self, task, issue_type_id, project_version):
         # Add task
-        selected_priority = None
-        for priority in self.priorities:
-            if priority['name'] == task['alm_priority']:
-                selected_priority = priority['id']
-                break
+        selected_priority = self.priority_ids.get(task['alm_priority'])
         if not selected_priority:
             raise AlmException('Unable to find priority %s' % task['alm_priority'])
 
@@ -261,6 +344,9 @@ class JIRASoapAPI:
                 
         if project_version:
             updates.append({'id': 'versions', 'values': [project_version['id']]})
+        if self.task_index is not None:
+            self.task_index.invalidate(task)
+
         args = {
             'project': self.config['alm_project'],
             'summary': task['alm_full_title'],
@@ -289,6 +375,7 @@ class JIRASoapAPI:
         return ref
 
     def remove_task(self, task):
+        self._invalidate_task(task.get_alm_id())
         try:
             self.proxy.deleteIssue(self.auth, task.get_alm_id())
         except SOAPpy.Types.faultType, err:
@@ -306,6 +393,7 @@ class JIRASoapAPI:
         return ret_trans
 
     def update_task_status(self, alm_id, status_id):
+        self._invalidate_task(alm_id)
         try:
             self.proxy.progressWorkflowAction(self.auth, alm_id, status_id)
         except SOAPpy.Types.faultType, err:
@@ -1,7 +1,10 @@
 # NOTE: Before running ensure that the options are set properly in the
 #       configuration file
+import time
 import unittest
 
+from datetime import datetime
+
 from mock import patch, MagicMock
 from functools import partial
 from jira_response_generator import JiraResponseGenerator
@@ -28,8 +31,15 @@ class JiraBaseCase(AlmPluginTestBase):
         api_ver = self.config['jira_version'][:1]
         self.config.jira_api_ver = int(api_ver)
 
+    def remove_issue_label(self, test_task):
+        task_number = self.response_generator.extract_task_number_from_title(test_task['id'])
+        issue = self.response_generator.generator_get_resource('issue', task_number, data_only=True)
+        fields = dict(issue.get('fields') or {}, labels=[])
+        self.response_generator.generator_update_resource('issue', task_number, {'fields': fields})
+
     def test_api_exceptions_are_handled(self):
-        self._test_api_exceptions_are_handled()
+        # Issues are only fetched by key when their key is remembered from a previous sync
+        self._test_api_exceptions_are_handled(['get_issue_by_key'])
 
     def _test_api_exceptions_are_handled(self, ignore_targets=[]):
         # Check that all api exceptions are properly handled. Some api targets will never be used in Soap calls,
@@ -89,6 +99,25 @@ class JiraBaseCase(AlmPluginTestBase):
 
         self.assertEqual(test_task_result.versions, ['1.0'])
 
+    def test_get_changed_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for i in xrange(2):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+            self.connector.alm_add_task(test_tasks[-1])
+
+        self.assertEqual(self.connector.alm_get_changed_tasks(test_tasks, time.time() - 3600), [])
+
+        alm_task = self.connector.alm_get_task(test_tasks[1])
+        task_number = alm_task.get_alm_id().split('-')[1]
+        issue = self.response_generator.generator_get_resource('issue', task_number, data_only=True)
+        fields = dict(issue['fields'], updated=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000+0000'))
+        self.response_generator.generator_update_resource('issue', task_number, {'fields': fields})
+
+        changed_tasks = self.connector.alm_get_changed_tasks(test_tasks, time.time() - 3600)
+        self.assertEqual([task['id'] for task in changed_tasks], [test_tasks[1]['id']])
+
     def test_invalid_issue_type(self):
         self.config['jira_issue_type'] = 'No such Issue Type'
         self.connector.initialize()
@@ -164,6 +193,47 @@ class TestJiraAPI6Case(JiraBaseCase, unittest.TestCase):
         }
         self.test_update_task_status_to_done()
 
+    def test_prefetch_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for i in xrange(4):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        self.connector.alm_add_task(test_tasks[0])
+        self.connector.alm_add_task(test_tasks[1])
+        self.connector.alm_add_task(test_tasks[3])
+        self.remove_issue_label(test_tasks[3])
+
+        # Use single-issue pages to exercise pagination
+        self.connector.alm_plugin.SEARCH_PAGE_SIZE = 1
+        self.connector.alm_prefetch_tasks(test_tasks)
+
+        api_calls = self.count_api_calls()
+        self.assertNotNone(self.connector.alm_get_task(test_tasks[0]))
+        self.assertNotNone(self.connector.alm_get_task(test_tasks[1]))
+        self.assertEqual(self.connector.alm_get_task(test_tasks[2]), None)
+        self.assertEqual(self.connector.alm_get_task(test_tasks[3]), None)
+        self.assertEqual(api_calls, [], 'Expected pre-fetched lookups, got calls: %s' % api_calls)
+
+        # Tasks without a labelled issue are searched for by title before they are added
+        self.assertEqual(self.connector.alm_search_task(test_tasks[2]), None)
+        self.assertNotNone(self.connector.alm_search_task(test_tasks[3]))
+        self.assertEqual(len(api_calls), 2, 'Expected two title searches, got calls: %s' % api_calls)
+
+    def test_get_task_by_key_errors(self):
+        self.connector.alm_connect()
+        test_task = self.mock_sde_response.generate_sde_task()
+        test_task = AlmConnector.add_alm_title(self.config, test_task)
+        self.connector.alm_add_task(test_task)
+        alm_task = self.connector.alm_get_task(test_task)
+
+        # A deleted issue is searched for instead
+        self.assertEqual(self.connector.alm_get_task_by_id(test_task, 'TEST-1'), None)
+
+        self.mock_alm_response.set_response_flags({'get_issue_by_key': 'fail'})
+        self.assert_exception(AlmException, '', 'Unable to get task', self.connector.alm_get_task_by_id,
+                              test_task, alm_task.get_alm_id())
+
     def assert_markdown(self, content, expected):
         converted_text = self.connector.convert_markdown_to_alm(content, None)
 
@@ -208,7 +278,7 @@ class TestJiraAPI4Case(JiraBaseCase, unittest.TestCase):
         patch('sdetools.modules.sync_jira.jira_soap.SOAPpy.WSDL.Proxy', mock_proxy).start()
 
     def test_api_exceptions_are_handled(self):
-        self._test_api_exceptions_are_handled(['post_remote_link', 'get_create_meta'])
+        self._test_api_exceptions_are_handled(['post_remote_link', 'get_create_meta', 'get_issue_by_key'])
 
     def test_bad_credentials(self):
         self.mock_alm_response.set_response_flags({'get_auth_token': '401'})
@@ -216,6 +286,77 @@ class TestJiraAPI4Case(JiraBaseCase, unittest.TestCase):
         self.assert_exception(AlmException, '', 'Unable to login to JIRA. Please check ID, password',
                               self.connector.alm_plugin.connect_server)
 
+    def count_proxy_calls(self):
+        proxy_calls = []
+        proxy = self.connector.alm_plugin.proxy
+
+        class CountingProxy(object):
+            def __getattr__(self, name):
+                proxy_calls.append(name)
+                return getattr(proxy, name)
+
+        self.connector.alm_plugin.proxy = CountingProxy()
+        return proxy_calls
+
+    def test_prefetch_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for i in xrange(4):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        self.connector.alm_add_task(test_tasks[0])
+        self.connector.alm_add_task(test_tasks[1])
+        self.connector.alm_add_task(test_tasks[3])
+        self.remove_issue_label(test_tasks[3])
+
+        proxy_calls = self.count_proxy_calls()
+        self.connector.alm_prefetch_tasks(test_tasks)
+        self.assertEqual(proxy_calls, ['getIssuesFromJqlSearch'])
+
+        del proxy_calls[:]
+        alm_task = self.connector.alm_get_task(test_tasks[0])
+        self.assertNotNone(alm_task)
+        self.assertEqual(alm_task.status, 'Open')
+        self.assertNotNone(self.connector.alm_get_task(test_tasks[1]))
+        self.assertEqual(self.connector.alm_get_task(test_tasks[2]), None)
+        self.assertEqual(self.connector.alm_get_task(test_tasks[3]), None)
+        self.assertEqual(proxy_calls, [], 'Expected pre-fetched lookups, got calls: %s' % proxy_calls)
+
+        # Tasks without a labelled issue are searched for by title before they are added
+        self.assertEqual(self.connector.alm_search_task(test_tasks[2]), None)
+        self.assertNotNone(self.connector.alm_search_task(test_tasks[3]))
+        self.assertEqual(proxy_calls, ['getIssuesFromJqlSearch'] * 2)
+
+        # A changed issue is searched for again
+        self.connector.alm_update_task_status(alm_task, 'DONE')
+        del proxy_calls[:]
+        self.connector.alm_get_task(test_tasks[0])
+        self.assertEqual(proxy_calls, ['getIssuesFromJqlSearch'])
+
+    def test_prefetch_tasks_truncated(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for i in xrange(3):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        self.connector.alm_add_task(test_tasks[0])
+        self.connector.alm_add_task(test_tasks[1])
+
+        self.connector.alm_plugin.SEARCH_MAX_RESULTS = 1
+        task_index = self.connector.alm_plugin.prefetch_tasks(test_tasks)
+        self.assertEqual(len(task_index), 1)
+
+        # Tasks missing from a cut off search are not assumed to be missing from JIRA
+        proxy_calls = self.count_proxy_calls()
+        self.assertNotNone(self.connector.alm_get_task(test_tasks[0]))
+        self.assertNotNone(self.connector.alm_get_task(test_tasks[1]))
+        self.assertEqual(self.connector.alm_get_task(test_tasks[2]), None)
+        self.assertEqual(proxy_calls, ['getIssuesFromJqlSearch'] * 2)
+
+        # Those tasks were already searched for by title
+        self.assertEqual(self.connector.alm_search_task(test_tasks[2]), None)
+        self.assertEqual(proxy_calls, ['getIssuesFromJqlSearch'] * 2)
+
     def test_custom_fields(self):
         self.connector.alm_connect()
         self.config['alm_custom_fields'] = {"Custom Field": "value"}
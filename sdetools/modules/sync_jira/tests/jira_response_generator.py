@@ -1,5 +1,6 @@
 import re
 
+from datetime import datetime, timedelta
 from urllib2 import HTTPError
 from sdetools.sdelib.testlib.response_generator import ResponseGenerator, RESPONSE_HEADERS
 from sdetools.extlib.SOAPpy.Types import structType, faultType
@@ -24,9 +25,11 @@ class JiraResponseGenerator(ResponseGenerator):
             '/rest/api/2/issue/createmeta': 'get_create_meta',
             '/rest/api/2/issuetype': 'get_issue_types',
             '/rest/api/2/search\?jql=project%%3D\'%s\'%%20AND%%20summary~.*' % self.project_key: 'get_issue',
+            '/rest/api/2/search\?jql=project%%3D\'%s\'%%20AND%%20labels.*' % self.project_key: 'get_issues_by_label',
             '/rest/api/2/issue/%s-\S.*/remotelink$' % self.project_key: 'post_remote_link',
             '/rest/api/2/issue$': 'post_issue',
             '/rest/api/2/issue/%s-[0-9]*$' % self.project_key: 'update_issue',
+            '/rest/api/2/issue/%s-[0-9]*\?fields=' % self.project_key: 'get_issue_by_key',
             '/rest/api/2/issue/%s-\S.*/transitions$' % self.project_key: 'update_status',
             'https://jira-server:5000/rpc/soap/jirasoapservice-v2': 'jira_soap_service'
         }
@@ -85,6 +88,15 @@ class JiraResponseGenerator(ResponseGenerator):
                 return response
             elif method_name == 'getIssuesFromJqlSearch':
                 flag = flags.get('get_issue')
+                label = re.search('(?<=labels=")[^"]*', args[3])
+                if label:
+                    if flag:
+                        self.raise_error('400')
+                    issues = [issue for issue in self.generator_get_all_resource('issue')
+                              if label.group(0) in issue['fields'].get('labels', []) and
+                              self._updated_since(issue, args[3])]
+                    return [self._to_soap_issue(issue) for issue in issues[:int(args[4]._data)]]
+
                 task_name = re.sub(r".*summary~", '', args[3])
                 headers, rest_response = self.get_issue('', flag, None, 'GET', task_name)
                 issues = rest_response.get('issues')
@@ -92,11 +104,14 @@ class JiraResponseGenerator(ResponseGenerator):
                 if not issues:
                     return []
                 else:
-                    issue = issues[0].get('fields')
-                    issue['status'] = issue['status']['id']
-                    issue['key'] = issues[0].get('key')
-
-                    return [structType(data=issue)]
+                    return [self._to_soap_issue(issues[0])]
+            elif method_name == 'getIssue':
+                flag = flags.get('get_issue_by_key')
+                task_number = args[3].split('-')[1]
+                if flag or not self.generator_resource_exists('issue', task_number):
+                    self.raise_error('404')
+                issue = self.generator_get_resource('issue', task_number)
+                return self._to_soap_issue(issue)
             elif method_name == 'createIssue':
                 flag = flags.get('post_issue')
                 headers, response = self.post_issue('', flag, args[3], 'GET')
@@ -104,7 +119,12 @@ class JiraResponseGenerator(ResponseGenerator):
             elif method_name == 'updateIssue':
                 flag = flags.get('update_issue') or flags.get('update_version')
                 if not flag:
-                    pass
+                    task_number = args[3].split('-')[1]
+                    for update in args[4]:
+                        if update['id'] == 'labels' and self.generator_resource_exists('issue', task_number):
+                            issue = self.generator_get_resource('issue', task_number, data_only=True)
+                            fields = dict(issue.get('fields') or {}, labels=update['values'])
+                            self.generator_update_resource('issue', task_number, {'fields': fields})
                 else:
                     self.raise_error('401')
             elif method_name == 'deleteIssue':
@@ -134,6 +154,26 @@ class JiraResponseGenerator(ResponseGenerator):
             # Return a faultType object instead
             raise faultType(err.code, err.msg)
 
+    @staticmethod
+    def _updated_since(issue, jql):
+        """ Checks a relative JQL condition like updated>='-90m' against the update time of the issue """
+        updated_since = re.search('updated>=[\'"]-(\d+)m', jql)
+        if not updated_since:
+            return True
+        updated = datetime.strptime(issue['fields']['updated'][:19], '%Y-%m-%dT%H:%M:%S')
+        return updated >= datetime.utcnow() - timedelta(minutes=int(updated_since.group(1)))
+
+    @staticmethod
+    def _to_soap_issue(rest_issue):
+        issue = rest_issue.get('fields')
+        issue['status'] = issue['status']['id']
+        issue['priority'] = issue['priority'].get('id')
+        issue['key'] = rest_issue.get('key')
+        if rest_issue.get('summary'):
+            issue['summary'] = rest_issue['summary']
+
+        return structType(data=issue)
+
     """
        Response functions 
     """
@@ -241,6 +281,37 @@ class JiraResponseGenerator(ResponseGenerator):
         else:
             self.raise_error('400')
 
+    def get_issue_by_key(self, target, flag, data, method):
+        if not flag:
+            task_number = re.search('%s-([0-9]+)' % self.project_key, target).group(1)
+            issue = self.generator_get_resource('issue', task_number)
+            if not issue:
+                self.raise_error(404, '{"errorMessages":["Issue Does Not Exist"],"errors":{}}')
+
+            return RESPONSE_HEADERS, issue
+        else:
+            self.raise_error('400')
+
+    def get_issues_by_label(self, target, flag, data, method):
+        if not flag:
+            params = self.get_url_parameters(target)
+            label = re.search("(?<=labels=')[^']*", params['jql'][0]).group(0)
+            start_at = int(params['startAt'][0])
+            max_results = int(params['maxResults'][0])
+
+            issues = [issue for issue in self.generator_get_all_resource('issue')
+                      if label in issue['fields'].get('labels', []) and self._updated_since(issue, params['jql'][0])]
+            response = {
+                'startAt': start_at,
+                'maxResults': max_results,
+                'total': len(issues),
+                'issues': issues[start_at:start_at + max_results]
+            }
+
+            return RESPONSE_HEADERS, response
+        else:
+            self.raise_error('400')
+
     def update_status(self, target, flag, data, method):
         if not flag and method == 'GET':
             response = {"expand": "transitions"}
@@ -258,8 +329,9 @@ class JiraResponseGenerator(ResponseGenerator):
             if not self.generator_get_resource('issue', task_number):
                 self.raise_error('404')
 
-            updated_status = {'fields': {'status': self.generate_status(int(transition_id) + 1)}}
-            self.generator_update_resource('issue', task_number, updated_status)
+            issue_fields = self.generator_get_resource('issue', task_number, data_only=True).get('fields', {})
+            issue_fields['status'] = self.generate_status(int(transition_id) + 1)
+            self.generator_update_resource('issue', task_number, {'fields': issue_fields})
 
             return RESPONSE_HEADERS, None
         else:
@@ -9,7 +9,7 @@ from sdetools.extlib.defusedxml import minidom
 from sdetools.sdelib.restclient import RESTBase
 from sdetools.sdelib.restclient import URLRequest, APIError
 from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector, PUBLIC_TASK_CONTENT
-from sdetools.alm_integration.alm_plugin_base import AlmException
+from sdetools.alm_integration.alm_plugin_base import AlmException, RE_TITLE_TASK_ID
 from sdetools.extlib import markdown
 
 from sdetools.sdelib import log_mgr
@@ -70,6 +70,8 @@ class MingleTask(AlmTask):
 
 class MingleConnector(AlmConnector):
     alm_name = 'Mingle'
+    # The card cache is built lazily and rebuilt when a card is added
+    alm_max_concurrency = 1
 
     def __init__(self, config, alm_plugin):
         """ Initializes connection to Mingle """
@@ -82,7 +84,9 @@ class MingleConnector(AlmConnector):
         config.opts.add('mingle_done_statuses', 'Statuses that signify a task is Done in Mingle',
             default='Ready for Testing,In Testing,Ready for Signoff,Accepted')
 
+        # card number -> card summary (see _parse_card), and task id -> card numbers
         self.cached_cards = None
+        self.card_index = None
         self.sync_titles_only = True
 
     def initialize(self):
@@ -105,6 +109,9 @@ class MingleConnector(AlmConnector):
     def alm_connect_project(self):
         """ Verifies that Mingle connection works """
         self.project_uri = 'projects/%s' % (self.alm_plugin.urlencode_str(self.config['alm_project']))
+        # Cards are cached for one sync
+        self.cached_cards = None
+        self.card_index = None
 
         #Check to make sure that we can do a simple API call
         try:
@@ -170,68 +177,111 @@ class MingleConnector(AlmConnector):
         else:
             raise AlmException('Could not find any element with the tag "%s"' % tag_name)
 
+    def _parse_card(self, card_item):
+        """ Extracts the fields needed for a MingleTask from a card element """
+        card = {
+            'number': self._get_value_of_element_with_tag(card_item, 'number'),
+            'name': self._get_value_of_element_with_tag(card_item, 'name'),
+            'modified_on': None,
+            'status': None,
+        }
+
+        if card_item.getElementsByTagName('modified_on'):
+            card['modified_on'] = self._get_value_of_element_with_tag(card_item, 'modified_on')
+        if card_item.getElementsByTagName('property'):
+            properties = card_item.getElementsByTagName('property')
+
+            for prop in properties:
+                if self._get_value_of_element_with_tag(prop, 'name') == 'Status':
+                    status_node = prop.getElementsByTagName('value').item(0).firstChild
+
+                    if status_node:
+                        card['status'] = status_node.nodeValue
+                    else:
+                        card['status'] = 'TODO'
+                    break
+        return card
+
+    def _cache_card(self, card):
+        if card['number'] not in self.cached_cards:
+            for task_id in RE_TITLE_TASK_ID.findall(card['name']):
+                self.card_index.setdefault(task_id, []).append(card['number'])
+        self.cached_cards[card['number']] = card
+
     def _cache_all_sde_mingle_cards(self):
+        """ Caches all cards in the project, one page at a time """
         self.cached_cards = {}
+        self.card_index = {}
 
-        try:
-            headers, result = self.alm_plugin.call_api('%s/cards.xml' % self.project_uri)
-        except APIError, err:
-            logger.error(err)
-            raise AlmException('Unable to get cards from Mingle')
+        page = 1
+        while True:
+            try:
+                headers, result = self.alm_plugin.call_api('%s/cards.xml' % self.project_uri, args={'page': page})
+            except APIError, err:
+                logger.error(err)
+                raise AlmException('Unable to get cards from Mingle')
 
-        if result:
-            for card_item in result.getElementsByTagName('card'):
-                card_name = self._get_value_of_element_with_tag(card_item, 'name')
-                card_num = self._get_value_of_element_with_tag(card_item, 'number')
-                self.cached_cards[card_num] = card_name
+            if not result:
+                break
+            card_items = result.getElementsByTagName('card')
+            new_cards = [self._parse_card(card_item) for card_item in card_items]
+            new_cards = [card for card in new_cards if card['number'] not in self.cached_cards]
+            # Stop at the last page (or if the server ignores paging)
+            if not new_cards:
+                break
+            for card in new_cards:
+                self._cache_card(card)
+            page += 1
+
+        logger.debug('Cached %d Mingle cards' % len(self.cached_cards))
 
     def _alm_get_task_by_identity(self, identity):
-        if not self.cached_cards:
+        if self.cached_cards is None:
             self._cache_all_sde_mingle_cards()
 
-        card_num = None
-        for key in self.cached_cards:
-            if self.cached_cards[key].find(identity) >= 0:
-                card_num = key
-                break
-
-        if card_num is None:
-            return None
+        for task_id in RE_TITLE_TASK_ID.findall(identity):
+            for card_num in self.card_index.get(task_id, []):
+                card = self.cached_cards[card_num]
+                if card['name'].find(identity) >= 0:
+                    return card
+        return None
 
-        try:
-            headers, result = self.alm_plugin.call_api('%s/cards/%s.xml' % (self.project_uri, card_num))
-            return result
-        except APIError:
-            raise AlmException('Could not find Mingle card with the card number %s' % card_num)
+    def alm_prefetch_tasks(self, tasks):
+        self._cache_all_sde_mingle_cards()
 
-    def alm_get_task(self, task):
-        task_id = self._extract_task_id(task['id'])
+    def _make_mingle_task(self, task_id, card):
+        return MingleTask(task_id, card['number'], card['status'], card['modified_on'],
+                          self.sde_plugin.config['mingle_done_statuses'])
 
-        card_item = self._alm_get_task_by_identity(task['alm_fixed_title'])
-        if card_item is None:
+    def alm_get_task_by_id(self, task, alm_id):
+        try:
+            headers, result = self.alm_plugin.call_api('%s/cards/%s.xml' % (self.project_uri, alm_id))
+        except APIError, err:
+            if getattr(err, 'code', None) == 404:
+                return None
+            raise AlmException('Unable to get card %s from Mingle because of %s' % (alm_id, err))
+        if not result:
             return None
 
-        card_num = self._get_value_of_element_with_tag(card_item, 'number')
-        modified_date = None
-        status = None
+        card = self._parse_card(result)
+        if card['name'].find(task['alm_fixed_title']) < 0:
+            return None
+        return self._make_mingle_task(self._extract_task_id(task['id']), card)
 
-        if card_item.getElementsByTagName('modified_on'):
-            modified_date = self._get_value_of_element_with_tag(card_item, 'modified_on')
-        if card_item.getElementsByTagName('property'):
-            properties = card_item.getElementsByTagName('property')
+    def alm_get_task(self, task):
+        task_id = self._extract_task_id(task['id'])
 
-            for prop in properties:
-                if self._get_value_of_element_with_tag(prop, 'name') == 'Status':
-                    status_node = prop.getElementsByTagName('value').item(0).firstChild
+        # Once the cards are cached, a lookup is free
+        if self.cached_cards is None:
+            mingle_task = self.alm_get_remembered_task(task)
+            if mingle_task:
+                return mingle_task
 
-                    if status_node:
-                        status = status_node.nodeValue
-                    else:
-                        status = 'TODO'
-                    break
+        card = self._alm_get_task_by_identity(task['alm_fixed_title'])
+        if card is None:
+            return None
 
-        return MingleTask(task_id, card_num, status, modified_date,
-                          self.sde_plugin.config['mingle_done_statuses'])
+        return self._make_mingle_task(task_id, card)
 
     def alm_add_task(self, task):
         task_id = self._extract_task_id(task['id'])
@@ -258,13 +308,19 @@ class MingleConnector(AlmConnector):
 
         # Mingle stores the new card URL in the location header
         card_re = re.search('%s/cards/(\d+).xml' % self.project_uri, headers['location'])
-        if card_re:
-            if not self.cached_cards:
-                self.cached_cards = {}
-            self.cached_cards[card_re.group(1)] = task['alm_full_title']
-        else:
+        if not card_re:
             raise AlmException('Alm task not added successfully for %s: could not find card number' % task['id'])
 
+        card_num = card_re.group(1)
+        try:
+            headers, result = self.alm_plugin.call_api('%s/cards/%s.xml' % (self.project_uri, card_num))
+        except APIError:
+            raise AlmException('Could not find Mingle card with the card number %s' % card_num)
+        if result:
+            if self.cached_cards is None:
+                self._cache_all_sde_mingle_cards()
+            self._cache_card(self._parse_card(result))
+
         #Return a unique identifier to this task in Mingle
         alm_task = self.alm_get_task(task)
         if not alm_task:
@@ -274,6 +330,8 @@ class MingleConnector(AlmConnector):
         if self.config['alm_standard_workflow'] and (task['status'] == 'DONE' or task['status'] == 'NA'):
             self.alm_update_task_status(alm_task, task['status'])
 
+        self._record_added_task(task, alm_task)
+
         return 'Project: %s, Card: %s' % (self.sde_plugin.config['alm_project'],
                                           alm_task.get_alm_id())
 
@@ -298,6 +356,11 @@ class MingleConnector(AlmConnector):
             raise AlmException('Unable to update task status to %s for card: %s in Mingle because of %s' %
                                (status, task.get_alm_id(), err))
 
+        if self.cached_cards and task.get_alm_id() in self.cached_cards:
+            card = self.cached_cards[task.get_alm_id()]
+            card['status'] = status_args['card[properties][][value]']
+            card['modified_on'] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
         logger.debug('Status changed to %s for task %s in Mingle' % (status, task.get_alm_id()))
 
     def alm_disconnect(self):
@@ -31,16 +31,36 @@ class TestMingleCase(AlmPluginTestBase, unittest.TestCase):
         self.connector.alm_add_task(test_task)
         cached_cards = self.connector.cached_cards
 
-        self.assertEqual(cached_cards, {alm_id: test_task['alm_full_title']})
+        self.assertEqual(cached_cards.keys(), [alm_id])
+        self.assertEqual(cached_cards[alm_id]['name'], test_task['alm_full_title'])
 
         self.connector._cache_all_sde_mingle_cards()
         cached_cards = self.connector.cached_cards
 
         self.assertNotNone(cached_cards)
         self.assertNotNone(cached_cards.get(alm_id))
-        self.assertEquals(cached_cards.get(alm_id), test_task['alm_full_title'])
+        self.assertEquals(cached_cards.get(alm_id)['name'], test_task['alm_full_title'])
         self.assertNotNone(self.connector.alm_get_task(test_task))
 
+    def test_mingle_card_pages(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for i in xrange(30):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_task = AlmConnector.add_alm_title(self.config, test_task)
+            self.connector.alm_add_task(test_task)
+            test_tasks.append(test_task)
+
+        self.connector.alm_prefetch_tasks(test_tasks)
+        self.assertEqual(len(self.connector.cached_cards), 30)
+
+        api_calls = self.count_api_calls()
+        for test_task in test_tasks:
+            alm_task = self.connector.alm_get_task(test_task)
+            self.assertEqual(alm_task.get_alm_id(), test_task['id'].split('T')[1])
+            self.assertEqual(alm_task.get_status(), 'TODO')
+        self.assertEqual(api_calls, [], 'Expected cached lookups, got calls: %s' % api_calls)
+
     def test_invalid_config_card_type(self):
         self.connector.config['mingle_card_type'] = 'INVALID-CARD-TYPE'
         exception_msg = ("The given mingle card type 'INVALID-CARD-TYPE' is not one of the valid card types: "
@@ -7,6 +7,8 @@ from sdetools.sdelib.commons import urlencode_str
 
 
 class MingleResponseGenerator(ResponseGenerator):
+    CARDS_PAGE_SIZE = 25
+
     def __init__(self, config, test_dir=None):
         resource_templates = ['card.xml']
         self.project_uri = '/org_name/api/v2/projects/%s' % urlencode_str(urlencode_str(config['alm_project']))
@@ -103,6 +105,10 @@ class MingleResponseGenerator(ResponseGenerator):
                         _mingle_tasks.append(task)
                 else:
                     _mingle_tasks = self.generator_get_all_resource('card')
+                    params = self.get_url_parameters(target)
+                    if 'page' in params:
+                        start = (int(params['page'][0]) - 1) * self.CARDS_PAGE_SIZE
+                        _mingle_tasks = _mingle_tasks[start:start + self.CARDS_PAGE_SIZE]
 
                 for task in _mingle_tasks:
                     cards.documentElement.appendChild(task.documentElement)
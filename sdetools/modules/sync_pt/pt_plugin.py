@@ -8,8 +8,8 @@ from types import ListType
 from sdetools.sdelib.commons import urlencode_str
 from sdetools.sdelib.restclient import RESTBase
 from sdetools.sdelib.restclient import URLRequest, APIError
-from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector, PUBLIC_TASK_CONTENT
-from sdetools.alm_integration.alm_plugin_base import AlmException
+from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector, AlmTaskIndex, PUBLIC_TASK_CONTENT
+from sdetools.alm_integration.alm_plugin_base import AlmException, SYNC_MARGIN_SECONDS
 
 from sdetools.sdelib import log_mgr
 logger = log_mgr.mods.add_mod(__name__)
@@ -19,6 +19,9 @@ PT_DEFAULT_PRIORITY_MAP = {
     '4-6': 'Medium',
     '1-3': 'Low',
 }
+PT_STORY_FIELDS = 'current_state,name,updated_at,id,estimate,story_type'
+# Largest page of stories returned by the PivotalTracker API
+PT_PAGE_SIZE = 500
 
 
 class PivotalTrackerAPI(RESTBase):
@@ -27,6 +30,7 @@ class PivotalTrackerAPI(RESTBase):
     def __init__(self, config):
         extra_conf_opts = [('alm_api_token', 'PivotalTracker API Token', '')]
         super(PivotalTrackerAPI, self).__init__('alm', 'PivotalTracker', config, 'services/v5', extra_conf_opts)
+        self.response_headers = {}
 
     def post_conf_init(self):
         if self._get_conf('api_token'):
@@ -37,6 +41,8 @@ class PivotalTrackerAPI(RESTBase):
         super(PivotalTrackerAPI, self).post_conf_init()
 
     def parse_response(self, result, headers):
+        # Keep the headers around for pagination (X-Tracker-Pagination-*)
+        self.response_headers = dict([(name.lower(), value) for name, value in headers.items()])
         if result == "":
             return "{}"
         else:
@@ -82,6 +88,8 @@ class PivotalTrackerTask(AlmTask):
 
 class PivotalTrackerConnector(AlmConnector):
     alm_name = 'PivotalTracker'
+    # The API keeps the headers of the last response for paging
+    alm_max_concurrency = 1
     PT_STORY_TYPE = 'pt_story_type'
     ALM_NEW_STATUS = 'pt_new_status'
     ALM_DONE_STATUSES = 'pt_done_statuses'
@@ -92,6 +100,7 @@ class PivotalTrackerConnector(AlmConnector):
     PT_VALID_NEW_STATUSES = ['unstarted', 'unscheduled', 'started']
     PT_DEFAULT_ESTIMATE = 'pt_default_estimate'
     default_priority_map = PT_DEFAULT_PRIORITY_MAP
+    feature_changed_tasks = True
 
     def __init__(self, config, alm_plugin):
         """ Initializes connection to PivotalTracker """
@@ -113,6 +122,9 @@ class PivotalTrackerConnector(AlmConnector):
         self.pt_epic_exist = None
         self.requires_estimate = ['feature']    # by default only features require an estimate
         self.pt_point_scale = []
+        self.story_index = None
+        self.pt_epics = {}
+        self.pt_release_marker_ids = {}
 
     def initialize(self):
         super(PivotalTrackerConnector, self).initialize()
@@ -140,6 +152,8 @@ class PivotalTrackerConnector(AlmConnector):
     def alm_connect_project(self):
         """ Verifies that the PivotalTracker project exists """
         self.project_uri = None
+        self.pt_epics = {}
+        self.pt_release_marker_ids = {}
 
         # Find the PivotalTracker project
         try:
@@ -205,6 +219,9 @@ class PivotalTrackerConnector(AlmConnector):
         except APIError, err:
             raise AlmException("Unable to delete task : %s" % err)
 
+        if self.story_index is not None:
+            self.story_index.invalidate_alm_id(task.get_alm_id())
+
     @staticmethod
     def _clean_title(text):
         """
@@ -212,16 +229,130 @@ class PivotalTrackerConnector(AlmConnector):
         """
         return text.replace('-', '.')
 
+    def _get_index_task(self, task):
+        """ Stories are created with cleaned titles, so they are indexed by the cleaned fixed title """
+        return {'id': task['id'], 'alm_fixed_title': self._clean_title(task['alm_fixed_title'])}
+
+    def _get_pagination_header(self, name):
+        value = self.alm_plugin.response_headers.get('x-tracker-pagination-%s' % name)
+        if value is None:
+            return None
+        return int(value)
+
+    def _get_labelled_stories(self, tasks, extra_filter=''):
+        """
+        Fetches the stories carrying the group label, a page at a time, and indexes them
+        by title. extra_filter is appended to the query string of every page
+        """
+        pt_group_label = self.config[self.PT_GROUP_LABEL]
+        story_index = AlmTaskIndex([self._get_index_task(task) for task in tasks])
+        offset = 0
+        while True:
+            target = ('%s/stories?with_label=%s&fields=%s&limit=%d&offset=%d%s' %
+                      (self.project_uri, urlencode_str(pt_group_label), PT_STORY_FIELDS, PT_PAGE_SIZE, offset,
+                       extra_filter))
+            try:
+                stories = self.alm_plugin.call_api(target)
+            except APIError, err:
+                raise AlmException('Unable to get stories from PivotalTracker because of %s' % err)
+
+            for story in stories:
+                story_index.add(story['name'], story, story['id'])
+
+            returned = self._get_pagination_header('returned')
+            if returned is None:
+                returned = len(stories)
+            offset += returned
+            total = self._get_pagination_header('total')
+            if total is None:
+                # Without pagination headers, a short page is the last one
+                has_more = returned == PT_PAGE_SIZE
+            else:
+                has_more = offset < total
+            if not returned or not has_more:
+                break
+
+        return story_index
+
+    def alm_get_changed_tasks(self, tasks, since):
+        if not self.config[self.PT_GROUP_LABEL]:
+            return None
+
+        since = datetime.utcfromtimestamp(since - SYNC_MARGIN_SECONDS).strftime('%Y-%m-%dT%H:%M:%SZ')
+        story_index = self._get_labelled_stories(tasks, '&updated_after=%s' % urlencode_str(since))
+        return [task for task in tasks if story_index.get(self._get_index_task(task))]
+
+    def alm_prefetch_tasks(self, tasks):
+        """
+        Fetches all stories carrying the group label and indexes them by title. Every
+        story added by the sync carries the group label
+        """
+        self.story_index = None
+        if not tasks or not self.config[self.PT_GROUP_LABEL]:
+            return
+
+        story_index = self._get_labelled_stories(tasks)
+        logger.debug('Prefetched %d PivotalTracker stories for %d tasks' % (len(story_index), len(tasks)))
+        self.story_index = story_index
+
+    def _make_pt_task(self, task_id, story):
+        updateable = story['story_type'] not in self.requires_estimate or story.get('estimate') is not None
+
+        return PivotalTrackerTask(task_id,
+                                  story['id'],
+                                  story['current_state'],
+                                  story['updated_at'],
+                                  self.config[self.ALM_DONE_STATUSES],
+                                  updateable)
+
+    def alm_get_task_by_id(self, task, alm_id):
+        task_id = self._extract_task_id(task['id'])
+        try:
+            story = self.alm_plugin.call_api('%s/stories/%s?fields=%s' % (self.project_uri, alm_id, PT_STORY_FIELDS))
+        except APIError, err:
+            if getattr(err, 'code', None) == 404:
+                return None
+            raise AlmException('Unable to get story from PivotalTracker for task %s' % task_id)
+
+        if self._clean_title(task['alm_fixed_title']) not in self._clean_title(story['name']):
+            return None
+        return self._make_pt_task(task_id, story)
+
     def alm_get_task(self, task):
         task_id = self._extract_task_id(task['id'])
         if not task_id:
             return None
 
+        if self.story_index is not None and self.story_index.covers(self._get_index_task(task)):
+            story = self.story_index.get(self._get_index_task(task))
+            if story:
+                logger.info('Found task: %s', task_id)
+                return self._make_pt_task(task_id, story)
+
+        # Stories whose label was removed are only found by their remembered id or title
+        pt_task = self.alm_get_remembered_task(task)
+        if pt_task:
+            logger.info('Found task: %s', task_id)
+            return pt_task
+
+        if self.story_index is not None and self.story_index.covers(self._get_index_task(task)):
+            # The index is complete, the title search is left to alm_search_task
+            return None
+        return self._search_task_by_title(task, task_id)
+
+    def alm_search_task(self, task):
+        task_id = self._extract_task_id(task['id'])
+        if not task_id or self.story_index is None or not self.story_index.covers(self._get_index_task(task)):
+            # alm_get_task already searched for it
+            return None
+        return self._search_task_by_title(task, task_id)
+
+    def _search_task_by_title(self, task, task_id):
         alm_identity = self._clean_title(task['alm_fixed_title'])
         try:
             # Fields parameter will filter response data to only contain story status, name, timestamp and id
-            target = ('%s/stories?filter="%s"&fields=current_state,name,updated_at,id,estimate,story_type' %
-                     (self.project_uri, urlencode_str(alm_identity)))
+            target = ('%s/stories?filter="%s"&fields=%s' %
+                     (self.project_uri, urlencode_str(alm_identity), PT_STORY_FIELDS))
             stories = self.alm_plugin.call_api(target)
         except APIError, err:
             logger.error(err)
@@ -237,16 +368,15 @@ class PivotalTrackerConnector(AlmConnector):
                            % (alm_identity, story['id']))
 
         logger.info('Found task: %s', task_id)
-        updateable = story['story_type'] not in self.requires_estimate or story.get('estimate') is not None
-
-        return PivotalTrackerTask(task_id,
-                                  story['id'],
-                                  story['current_state'],
-                                  story['updated_at'],
-                                  self.config[self.ALM_DONE_STATUSES],
-                                  updateable)
+        return self._make_pt_task(task_id, story)
 
     def pt_get_release_marker_id(self, release_name):
+        """ Release markers are resolved once per run """
+        if release_name not in self.pt_release_marker_ids:
+            self.pt_release_marker_ids[release_name] = self._pt_find_release_marker_id(release_name)
+        return self.pt_release_marker_ids[release_name]
+
+    def _pt_find_release_marker_id(self, release_name):
         try:
             release_markers = self.alm_plugin.call_api('%s/stories?filter=type:release,%s&fields=id' %
                                                        (self.project_uri, urlencode_str(release_name)))
@@ -270,6 +400,10 @@ class PivotalTrackerConnector(AlmConnector):
             return release_marker['id']
 
     def pt_get_epic(self, group_name):
+        """ Epics are looked up once per run """
+        if group_name in self.pt_epics:
+            return self.pt_epics[group_name]
+
         try:
             epic = self.alm_plugin.call_api('%s/epics?filter=%s&fields=id' %
                                             (self.project_uri, urlencode_str(group_name)))
@@ -277,6 +411,7 @@ class PivotalTrackerConnector(AlmConnector):
             raise AlmException('Unable to get epic %s from PivotalTracker because of %s'
                                % (group_name, err))
 
+        self.pt_epics[group_name] = epic
         return epic
 
     def pt_add_epic(self, group_name):
@@ -298,6 +433,7 @@ class PivotalTrackerConnector(AlmConnector):
         except APIError, err:
             raise AlmException('Unable to add epic %s to PivotalTracker because of %s'
                                % (group_name, err))
+        self.pt_epics.pop(group_name, None)
 
     def alm_add_task(self, task):
         pt_priority_label = self.translate_priority(task['priority'])
@@ -344,6 +480,9 @@ class PivotalTrackerConnector(AlmConnector):
             raise AlmException('Unable to add story %s to PivotalTracker because of %s'
                                % (task['id'], err))
 
+        if self.story_index is not None:
+            self.story_index.invalidate(self._get_index_task(task))
+
         if new_story.get('error'):
             raise AlmException('Unable to add story %s to PivotalTracker. Reason: %s - %s'
                                % (task['id'], new_story['code'], new_story['general_problem']))
@@ -361,6 +500,8 @@ class PivotalTrackerConnector(AlmConnector):
                 (task['status'] == 'DONE' or task['status'] == 'NA')):
             self.alm_update_task_status(alm_task, task['status'])
 
+        self._record_added_task(task, alm_task)
+
         return 'Project: %s, Story: %s' % (self.config['alm_project'], alm_task.get_alm_id())
 
     def alm_update_task_status(self, task, status):
@@ -391,6 +532,9 @@ class PivotalTrackerConnector(AlmConnector):
                                'for story %s in PivotalTracker because of %s' %
                                (status, task.get_alm_id(), err))
 
+        if self.story_index is not None:
+            self.story_index.invalidate_alm_id(task.get_alm_id())
+
         if result and result.get('error'):
             raise AlmException('Unable to update status to %s for story %s. Reason: %s - %s' %
                                (status, task['id'], result['code'], result['general_problem']))
@@ -1,10 +1,12 @@
 # NOTE: Before running ensure that the options are set properly in the
 #       configuration file
+import time
 import unittest
 
 from pt_response_generator import PivotalTrackerResponseGenerator
 from sdetools.alm_integration.alm_plugin_base import AlmConnector
 from sdetools.alm_integration.tests.alm_plugin_test_base import AlmPluginTestBase
+from sdetools.modules.sync_pt import pt_plugin
 from sdetools.modules.sync_pt.pt_plugin import PivotalTrackerConnector, PivotalTrackerAPI, AlmException
 
 
@@ -90,4 +92,78 @@ class TestPivotalTrackerCase(AlmPluginTestBase, unittest.TestCase):
 
         self.connector.alm_update_task_status(alm_task, 'DONE')
 
-        # If we do not auto-assign an estimate when updating an unestimated 'feature', this test will fail
\ No newline at end of file
+        # If we do not auto-assign an estimate when updating an unestimated 'feature', this test will fail
+
+    def test_api_exceptions_are_handled(self):
+        # A sync looks stories up in the story index, the per-task search is covered below
+        self.response_generator.rest_api_targets.pop('%s/stories\\?filter=(?!type:release).*' %
+                                                     self.response_generator.project_uri)
+        super(TestPivotalTrackerCase, self).test_api_exceptions_are_handled()
+
+    def test_search_exceptions_are_handled(self):
+        self.connector.alm_connect()
+        test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+        self.mock_alm_response.set_response_flags({'get_stories': 'fail'})
+        self.assertRaises(AlmException, self.connector.alm_get_task, test_task)
+
+    def test_prefetch_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for index in range(5):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        for test_task in test_tasks[:4]:
+            self.connector.alm_add_task(test_task)
+        self.response_generator.generator_update_resource('story', test_tasks[3]['id'].split('T')[1], {'labels': []})
+
+        api_calls = self.count_api_calls()
+
+        # Use two stories per page to exercise pagination
+        page_size = pt_plugin.PT_PAGE_SIZE
+        pt_plugin.PT_PAGE_SIZE = 2
+        try:
+            self.connector.alm_prefetch_tasks(test_tasks)
+        finally:
+            pt_plugin.PT_PAGE_SIZE = page_size
+        self.assertEqual(len(api_calls), 2, 'Expected two pages of stories, got calls: %s' % api_calls)
+
+        del api_calls[:]
+        for test_task in test_tasks[:3]:
+            self.assertEqual(self.connector.alm_get_task(test_task).get_alm_id(), test_task['id'].split('T')[1])
+        for test_task in test_tasks[3:]:
+            self.assertEqual(self.connector.alm_get_task(test_task), None)
+        self.assertEqual(api_calls, [], 'Expected lookups from the story index, got calls: %s' % api_calls)
+
+        # Stories missing from the index are searched by title before they are added
+        self.assertEqual(self.connector.alm_search_task(test_tasks[3]).get_alm_id(), test_tasks[3]['id'].split('T')[1])
+        self.assertEqual(self.connector.alm_search_task(test_tasks[4]), None)
+        self.assertEqual(len(api_calls), 2, 'Expected a search per task, got calls: %s' % api_calls)
+
+        # Status changes are looked up in PivotalTracker again
+        alm_task = self.connector.alm_get_task(test_tasks[0])
+        self.connector.alm_update_task_status(alm_task, 'DONE')
+        self.assertEqual(self.connector.alm_get_task(test_tasks[0]).get_status(), 'DONE')
+
+    def test_get_changed_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for index in range(3):
+            test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+            self.connector.alm_add_task(test_task)
+            test_tasks.append(test_task)
+        self.response_generator.generator_update_resource('story', test_tasks[1]['id'].split('T')[1],
+                                                          {'updated_at': '2013-10-02T17:18:48Z'})
+
+        changed_tasks = self.connector.alm_get_changed_tasks(test_tasks, time.time())
+        self.assertEqual([task['id'] for task in changed_tasks], [test_tasks[0]['id'], test_tasks[2]['id']])
+
+    def test_release_marker_and_epic_lookups_cached(self):
+        self.connector.alm_connect()
+        self.connector.config['alm_project_version'] = self.response_generator.release_marker_name
+
+        api_calls = self.count_api_calls()
+        for index in range(3):
+            test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+            self.connector.alm_add_task(test_task)
+        lookups = [target for target in api_calls if 'filter=' in target]
+        self.assertEqual(len(lookups), 2, 'Expected one epic and one release marker lookup, got: %s' % lookups)
@@ -17,6 +17,7 @@ class PivotalTrackerResponseGenerator(ResponseGenerator):
             '/services/v5/projects$': 'get_projects',
             '%s/stories\?filter=type:(?=release).*' % self.project_uri: 'get_release_marker',
             '%s/stories\?filter=(?!type:release).*' % self.project_uri: 'get_stories',
+            '%s/stories\?with_label=' % self.project_uri: 'get_labeled_stories',
             '%s/epics\?filter=(.*)&fields=id' % self.project_uri: 'get_epic',
             '%s/epics$' % self.project_uri: 'add_epic',
             '%s/stories$' % self.project_uri: 'add_story',
@@ -69,6 +70,30 @@ class PivotalTrackerResponseGenerator(ResponseGenerator):
         else:
             self.raise_error('401')
 
+    def get_labeled_stories(self, target, flag, data, method):
+        if not flag:
+            params = self.get_url_parameters(target)
+            label = params['with_label'][0]
+            limit = int(params['limit'][0])
+            offset = int(params['offset'][0])
+
+            stories = [story for story in self.generator_get_all_resource('story')
+                       if label in [story_label['name'] for story_label in story.get('labels', [])]]
+            if 'updated_after' in params:
+                stories = [story for story in stories if story['updated_at'] > params['updated_after'][0]]
+            stories.sort(key=lambda story: int(story['id']))
+            page = stories[offset:offset + limit]
+            headers = RESPONSE_HEADERS + [
+                ('X-Tracker-Pagination-Total', str(len(stories))),
+                ('X-Tracker-Pagination-Limit', str(limit)),
+                ('X-Tracker-Pagination-Offset', str(offset)),
+                ('X-Tracker-Pagination-Returned', str(len(page))),
+            ]
+
+            return headers, page
+        else:
+            self.raise_error('401')
+
     def get_release_marker(self, target, flag, data, method):
         if not flag:
             release_marker_name = re.search('(?<=type:release,).*(?=&fields)', target).group(0)
@@ -112,6 +137,7 @@ class PivotalTrackerResponseGenerator(ResponseGenerator):
                     self.raise_error('400', 'Expected an estimate')
                 data['id'] = story_id
                 data['project_id'] = self.project_id
+                data['updated_at'] = self.get_current_utc_timestamp()
                 self.generator_add_resource('story', story_id, data)
 
                 return RESPONSE_HEADERS, self.generate_resource_from_template('story', data)
@@ -131,13 +157,16 @@ class PivotalTrackerResponseGenerator(ResponseGenerator):
                             task.get('estimate') is None and data.get('estimate') is None:
                         self.raise_error('400', 'Expected an estimate')
 
-                    self.generator_update_resource('story', story_id, {'current_state': data['current_state']})
+                    self.generator_update_resource('story', story_id, {'current_state': data['current_state'],
+                                                                       'updated_at': self.get_current_utc_timestamp()})
                     task['current'] = data['current_state']
 
                     return RESPONSE_HEADERS, task
+                elif method == 'GET':
+                    return RESPONSE_HEADERS, self.generate_resource_from_template('story', task)
                 elif method == 'DELETE':
                     self.generator_remove_resource('story', story_id)
                     return RESPONSE_HEADERS, ''
-            self.raise_error('404')
+            self.raise_error(404)
         else:
             self.raise_error('401')
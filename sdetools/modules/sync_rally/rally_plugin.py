@@ -6,8 +6,8 @@ import re
 from datetime import datetime
 
 from sdetools.sdelib.restclient import RESTBase, APIError
-from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector
-from sdetools.alm_integration.alm_plugin_base import AlmException
+from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector, AlmTaskIndex
+from sdetools.alm_integration.alm_plugin_base import AlmException, SYNC_MARGIN_SECONDS
 from sdetools.extlib import markdown
 
 from sdetools.sdelib import log_mgr
@@ -17,6 +17,9 @@ API_VERSION = '1.39'
 
 MAX_CONTENT_SIZE = 30000
 
+# Largest page size allowed by the Rally web services API
+RALLY_PAGE_SIZE = 200
+
 RALLY_HEADERS = [
     ('X-RallyIntegrationName', 'SD Elements'),
     ('X-RallyIntegrationVendor', 'SD Elements'),
@@ -89,6 +92,7 @@ class RallyConnector(AlmConnector):
     """Connects SD Elements to Rally"""
     alm_name = 'Rally'
     feature_custom_lookup = True
+    feature_changed_tasks = True
 
     def __init__(self, config, alm_plugin):
         super(RallyConnector, self).__init__(config, alm_plugin)
@@ -109,6 +113,7 @@ class RallyConnector(AlmConnector):
         self.workspace_ref = None
         self.alm_parent_issue_ref = None
         self.tag_ref = None
+        self.artifact_index = None
         self.mark_down_converter = markdown.Markdown(safe_mode="escape")
 
     def initialize(self):
@@ -249,6 +254,40 @@ class RallyConnector(AlmConnector):
 
         self.tag_references[tag_name] = tag_result['CreateResult']['Object']['_ref']
 
+    def _setup_rally_labels(self, tag_names):
+        """ Looks up the references of several tags with a single query """
+        tag_names = [tag_name for tag_name in tag_names if tag_name not in self.tag_references]
+        if not tag_names:
+            return
+
+        query_args = {
+            'query': self._join_rally_query(['(Name = \"%s\")' % tag_name for tag_name in tag_names], 'OR'),
+            'workspace': self.workspace_ref,
+            'fetch': 'Name',
+            'pagesize': RALLY_PAGE_SIZE,
+        }
+        try:
+            tag_result = self.alm_plugin.call_api('tag.js', args=query_args)
+        except APIError, err:
+            raise AlmException('Unable to retrieve tag info from Rally. Reason: %s' % err)
+
+        for tag in tag_result['QueryResult']['Results']:
+            if tag['_refObjectName'] in tag_names and tag['_refObjectName'] not in self.tag_references:
+                self.tag_references[tag['_refObjectName']] = tag['_ref']
+
+        # Tags that do not exist yet are created one at a time
+        for tag_name in tag_names:
+            if tag_name not in self.tag_references:
+                self._setup_rally_label(tag_name)
+
+    @staticmethod
+    def _join_rally_query(conditions, operator):
+        """ Rally queries only allow two operands per operator: ((A OR B) OR C) """
+        query = conditions[0]
+        for condition in conditions[1:]:
+            query = '(%s %s %s)' % (query, operator, condition)
+        return query
+
     def alm_validate_configurations(self):
 
         # Retrieve the reference for the parent Story
@@ -340,6 +379,12 @@ class RallyConnector(AlmConnector):
         for tag in artifact_data['Tags']:
             if '_refObjectName' in tag and tag['_refObjectName'] in labels:
                 labels.remove(tag['_refObjectName'])
+            elif '_ref' in tag:
+                # Tags we added ourselves only carry their reference
+                for tag_name in labels:
+                    if self.tag_references.get(tag_name) == tag['_ref']:
+                        labels.remove(tag_name)
+                        break
 
         # The Rally artifact is assigned all tags
         if not labels:
@@ -366,11 +411,8 @@ class RallyConnector(AlmConnector):
             raise AlmException('Unable to update tag %s for artifact %s in Rally because of %s' %
                                (tag_name, artifact_data['FormattedID'], err))
 
-    def alm_get_task(self, task):
+    def _get_artifact_query(self, artifact_query):
         card_type_details = self.card_types[self.config['rally_card_type']]
-        task_id = self._extract_task_id(task['id'])
-
-        artifact_query = '(Name contains "%s")' % task['alm_fixed_title']
 
         if card_type_details['type'] == 'Task':
             artifact_query = '(%s and (WorkProduct.FormattedID = "%s"))' % (
@@ -379,16 +421,131 @@ class RallyConnector(AlmConnector):
         for field, value in self.config['alm_custom_lookup_fields'].items():
             artifact_query = '(%s and (%s = "%s"))' % (artifact_query, field, value)
 
-        task_data = self.rally_get_artifact(task_id, '%s' % artifact_query, card_type_details['type'],
-                                            card_type_details['type'], card_type_details['api'])
+        return artifact_query
+
+    def _query_artifacts(self, tasks, artifact_query):
+        """
+        Fetches the artifacts matching artifact_query in pages of RALLY_PAGE_SIZE, with
+        the fields needed for synchronization folded into the query results, and
+        indexes them by task
+        """
+        card_type_details = self.card_types[self.config['rally_card_type']]
+        query_args = {
+            'query': self._get_artifact_query(artifact_query),
+            'workspace': self.workspace_ref,
+            'project': self.project_ref,
+            'fetch': 'FormattedID,Name,Tags,LastUpdateDate,%s' % card_type_details['field_state'],
+            'pagesize': RALLY_PAGE_SIZE,
+        }
+
+        artifact_index = AlmTaskIndex(tasks)
+        start = 1
+        while True:
+            query_args['start'] = start
+            try:
+                result = self.alm_plugin.call_api('%s.js' % card_type_details['api'], args=query_args)
+            except APIError, err:
+                raise AlmException('Unable to get %s artifacts from Rally. Reason: %s' %
+                                   (card_type_details['type'], str(err)))
+
+            artifacts = result['QueryResult']['Results']
+            for artifact in artifacts:
+                artifact_index.add(artifact['Name'], artifact, artifact['FormattedID'])
+
+            start += len(artifacts)
+            if not artifacts or start > result['QueryResult']['TotalResultCount']:
+                break
+
+        return artifact_index
+
+    def alm_get_changed_tasks(self, tasks, since):
+        since = datetime.utcfromtimestamp(since - SYNC_MARGIN_SECONDS).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        artifact_index = self._query_artifacts(tasks, '((Tags.Name = "%s") and (LastUpdateDate > "%s"))' %
+                                                      (self.config['alm_issue_label'], since))
+        return [task for task in tasks if artifact_index.get(task)]
+
+    def alm_prefetch_tasks(self, tasks):
+        """
+        Fetches every artifact of the project tagged with alm_issue_label. Every
+        artifact added or found by the sync carries the label
+        """
+        self.artifact_index = None
+        if not tasks:
+            return
+
+        artifact_index = self._query_artifacts(tasks, '(Tags.Name = "%s")' % self.config['alm_issue_label'])
+
+        # Resolve the tags the artifacts will need in one go
+        tag_names = set([self.config['alm_issue_label']])
+        for task in tasks:
+            tag_names.update(task['tags'])
+        self._setup_rally_labels(sorted(tag_names))
+
+        logger.debug('Prefetched %d Rally artifacts for %d tasks' % (len(artifact_index), len(tasks)))
+        self.artifact_index = artifact_index
+
+    def alm_get_task_by_id(self, task, alm_id):
+        """ Fetches the artifact with the FormattedID alm_id in one query, with the fields needed for synchronization """
+        card_type_details = self.card_types[self.config['rally_card_type']]
+        query_args = {
+            'query': self._get_artifact_query('(FormattedID = "%s")' % alm_id),
+            'workspace': self.workspace_ref,
+            'project': self.project_ref,
+            'fetch': 'FormattedID,Name,Tags,LastUpdateDate,%s' % card_type_details['field_state'],
+        }
+        try:
+            result = self.alm_plugin.call_api('%s.js' % card_type_details['api'], args=query_args)
+        except APIError, err:
+            raise AlmException('Unable to get %s %s from Rally. Reason: %s' %
+                               (card_type_details['type'], alm_id, str(err)))
+
+        for task_data in result['QueryResult']['Results']:
+            if task_data['FormattedID'] == alm_id and task['alm_fixed_title'] in task_data['Name']:
+                return self._make_rally_task(task, task_data)
+        return None
+
+    def alm_get_task(self, task):
+        task_data = None
+        if self.artifact_index is not None and self.artifact_index.covers(task):
+            task_data = self.artifact_index.get(task)
+        if not task_data:
+            # Artifacts whose label was removed are only found by their remembered reference or name
+            rally_task = self.alm_get_remembered_task(task)
+            if rally_task:
+                return rally_task
+
+            if self.artifact_index is not None and self.artifact_index.covers(task):
+                # The index is complete, the name search is left to alm_search_task
+                return None
+            return self._search_task_by_name(task)
+
+        return self._make_rally_task(task, task_data)
+
+    def alm_search_task(self, task):
+        if self.artifact_index is None or not self.artifact_index.covers(task):
+            # alm_get_task already searched for it
+            return None
+        return self._search_task_by_name(task)
+
+    def _search_task_by_name(self, task):
+        card_type_details = self.card_types[self.config['rally_card_type']]
+        artifact_query = self._get_artifact_query('(Name contains "%s")' % task['alm_fixed_title'])
+        task_data = self.rally_get_artifact(self._extract_task_id(task['id']), '%s' % artifact_query,
+                                            card_type_details['type'], card_type_details['type'],
+                                            card_type_details['api'])
         if not task_data:
             return task_data
 
+        return self._make_rally_task(task, task_data)
+
+    def _make_rally_task(self, task, task_data):
+        card_type_details = self.card_types[self.config['rally_card_type']]
+
         # Make sure the artifact has all the applicable labels
         tags = [self.config['alm_issue_label']] + task['tags']
         self._apply_labels_if_needed(tags, task_data)
 
-        return RallyTask(task_id,
+        return RallyTask(self._extract_task_id(task['id']),
                          task_data['FormattedID'],
                          self._split_ref_link(task_data['_ref']),
                          task_data[card_type_details['field_state']],
@@ -434,6 +591,9 @@ class RallyConnector(AlmConnector):
 
         logger.debug('Task %s added to Rally Project', task['id'])
 
+        if self.artifact_index is not None:
+            self.artifact_index.invalidate(task)
+
         if result['CreateResult']['Errors']:
             raise AlmException('Unable to add task to Rally %s. Reason: %s' %
                                (task['id'], str(result['CreateResult']['Errors'])[:200]))
@@ -449,6 +609,8 @@ class RallyConnector(AlmConnector):
                 (task['status'] == 'DONE' or task['status'] == 'NA')):
             self.alm_update_task_status(alm_task, task['status'])
 
+        self._record_added_task(task, alm_task)
+
         return 'Project: %s, %s: %s; URL: %s' % (
             self.config['alm_project'],
             card_type_details['name'],
@@ -462,6 +624,9 @@ class RallyConnector(AlmConnector):
         except APIError, err:
             raise AlmException("Unable to delete task: %s" % err)
 
+        if self.artifact_index is not None:
+            self.artifact_index.invalidate_alm_id(task.get_alm_id())
+
     def alm_update_task_status(self, task, status):
         if not task:
             logger.debug('Status synchronization disabled')
@@ -489,6 +654,9 @@ class RallyConnector(AlmConnector):
             raise AlmException('Unable to update task status to %s for artifact %s in Rally because of %s' %
                                (status, task.get_alm_id(), err))
 
+        if self.artifact_index is not None:
+            self.artifact_index.invalidate_alm_id(task.get_alm_id())
+
         logger.debug('Status changed to %s for task %s in Rally' % (status, task.get_alm_id()))
 
     def alm_disconnect(self):
@@ -1,9 +1,12 @@
 # NOTE: Before running ensure that the options are set properly in the
 #       configuration file
+import time
 import unittest
 
 from rally_response_generator import RallyResponseGenerator, RallyCustomFieldResponseGenerator
 from sdetools.alm_integration.tests.alm_plugin_test_base import AlmPluginTestBase
+from sdetools.alm_integration.alm_plugin_base import AlmConnector
+from sdetools.modules.sync_rally import rally_plugin
 from sdetools.modules.sync_rally.rally_plugin import RallyConnector, RallyAPIBase, AlmException
 
 
@@ -64,6 +67,63 @@ class TestRallyCase(AlmPluginTestBase, unittest.TestCase):
         self.config['alm_custom_fields'] = {"Package": "Package Value"}
         self.test_update_task_status_to_done()
 
+    def test_prefetch_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for index in range(5):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        for test_task in test_tasks[:3]:
+            self.connector.alm_add_task(test_task)
+        self.remove_card_tags(test_tasks[2])
+
+        # Use two artifacts per page to exercise paging
+        page_size = rally_plugin.RALLY_PAGE_SIZE
+        rally_plugin.RALLY_PAGE_SIZE = 2
+        try:
+            self.connector.alm_prefetch_tasks(test_tasks)
+        finally:
+            rally_plugin.RALLY_PAGE_SIZE = page_size
+
+        api_calls = self.count_api_calls()
+        for test_task in test_tasks[:2]:
+            self.assertEqual(self.connector.alm_get_task(test_task).get_alm_id(), test_task['id'].split('T')[1])
+        for test_task in test_tasks[2:]:
+            self.assertEqual(self.connector.alm_get_task(test_task), None)
+        self.assertEqual(api_calls, [], 'Expected lookups from the prefetched artifacts, got calls: %s' % api_calls)
+
+        # Artifacts missing from the prefetch are searched by name before they are added
+        self.assertEqual(self.connector.alm_search_task(test_tasks[2]).get_alm_id(), test_tasks[2]['id'].split('T')[1])
+        for test_task in test_tasks[3:]:
+            self.assertEqual(self.connector.alm_search_task(test_task), None)
+        self.assertTrue(api_calls, 'Expected searches for the missing artifacts')
+
+        # Status changes are looked up in Rally again
+        alm_task = self.connector.alm_get_task(test_tasks[0])
+        self.connector.alm_update_task_status(alm_task, 'DONE')
+        self.assertEqual(self.connector.alm_get_task(test_tasks[0]).get_status(), 'DONE')
+
+    def test_get_changed_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for index in range(3):
+            test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+            self.connector.alm_add_task(test_task)
+            test_tasks.append(test_task)
+        task_number = test_tasks[1]['id'].split('T')[1]
+        card = self.response_generator.generator_get_resource('card', task_number)
+        card['HierarchicalRequirement']['LastUpdateDate'] = '2013-10-02T20:27:27.682Z'
+        self.response_generator.generator_update_resource('card', task_number, card)
+
+        changed_tasks = self.connector.alm_get_changed_tasks(test_tasks, time.time())
+        self.assertEqual([task['id'] for task in changed_tasks], [test_tasks[0]['id'], test_tasks[2]['id']])
+
+    def remove_card_tags(self, test_task):
+        task_number = test_task['id'].split('T')[1]
+        card = self.response_generator.generator_get_resource('card', task_number)
+        card['HierarchicalRequirement']['Tags'] = []
+        self.response_generator.generator_update_resource('card', task_number, card)
+
     def test_alm_priority_map(self):
         # Custom priority maps are unsupported in this integration
         pass
\ No newline at end of file
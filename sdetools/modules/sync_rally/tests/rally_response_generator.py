@@ -1,4 +1,5 @@
 import re
+from datetime import datetime
 
 from sdetools.sdelib.testlib.response_generator import ResponseGenerator, RESPONSE_HEADERS
 
@@ -83,6 +84,8 @@ class RallyResponseGenerator(ResponseGenerator):
     def get_requirements(self, target, flag, data, method):
         if not flag:
             params = self.get_url_parameters(target)
+            if 'fetch' in params:
+                return RESPONSE_HEADERS, self._get_requirement_page(params)
             task_number = self.extract_task_number_from_title(params['query'][0])
             task = self.generator_get_resource('card', task_number)
             requirements = self.get_json_from_file('hierarchical_requirements')
@@ -114,6 +117,7 @@ class RallyResponseGenerator(ResponseGenerator):
                 return RESPONSE_HEADERS, task
             elif method == 'POST':
                 task['HierarchicalRequirement'].update(data['HierarchicalRequirement'])
+                task['HierarchicalRequirement']['LastUpdateDate'] = self._get_last_update_date()
                 self.generator_update_resource('card', task_number, task)
 
                 return RESPONSE_HEADERS, data
@@ -131,6 +135,7 @@ class RallyResponseGenerator(ResponseGenerator):
             if self.generator_get_resource('card', task_number) is None:
                 data_h_reqs['FormattedID'] = task_number
                 data_h_reqs['_refObjectName'] = data_h_reqs['Name']
+                data_h_reqs['LastUpdateDate'] = self._get_last_update_date()
                 self.generator_add_resource('card', task_number, data)
 
                 return RESPONSE_HEADERS, self.get_json_from_file('create_result')
@@ -139,7 +144,41 @@ class RallyResponseGenerator(ResponseGenerator):
         else:
             self.raise_error('401')
 
+    def _get_requirement_page(self, params):
+        """ Returns a page of the fetched cards, or the card with the queried FormattedID; cards without tags lack the issue label """
+        start = int(params.get('start', ['1'])[0])
+        page_size = int(params.get('pagesize', ['20'])[0])
+        fields = params['fetch'][0].split(',')
+
+        formatted_id = re.search('FormattedID = "([^"]*)"', params['query'][0])
+        tag_query = 'Tags.Name = ' in params['query'][0]
+        updated_since = re.search('LastUpdateDate > "([^"]*)"', params['query'][0])
+
+        cards = []
+        for task_number in sorted(self.resources['card']['resources'].keys(), key=int):
+            task = self.generator_get_resource('card', task_number)['HierarchicalRequirement']
+            if formatted_id and task.get('FormattedID') != formatted_id.group(1):
+                continue
+            if tag_query and not task.get('Tags'):
+                continue
+            if updated_since and task.get('LastUpdateDate') <= updated_since.group(1):
+                continue
+            card = dict([(field, task.get(field)) for field in fields])
+            card['_ref'] = re.sub('[0-9]+(?=\.js$)', task_number, task['_ref'])
+            cards.append(card)
+
+        response = self._generate_query_result()
+        response['QueryResult']['TotalResultCount'] = len(cards)
+        response['QueryResult']['StartIndex'] = start
+        response['QueryResult']['PageSize'] = page_size
+        response['QueryResult']['Results'] = cards[start - 1:start - 1 + page_size]
+        return response
+
     # Generator Functions
+    @staticmethod
+    def _get_last_update_date():
+        return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
     def _generate_query_result(self):
         return self.get_json_from_file('queryresult')
 
@@ -1,6 +1,7 @@
 # Copyright SDElements Inc
 # Extensible two way integration with Rational Team Concert
 
+import os
 import re
 import urllib
 import json
@@ -9,7 +10,7 @@ from datetime import datetime
 from sdetools.sdelib.commons import urlencode_str
 from sdetools.sdelib.restclient import RESTBase
 from sdetools.sdelib.restclient import URLRequest, APIError
-from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector
+from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector, AlmTaskIndex
 from sdetools.alm_integration.alm_plugin_base import AlmException
 from sdetools.extlib import markdown
 
@@ -33,6 +34,11 @@ RATIONAL_HTML_CONVERT = [
     ('</code></pre>', '</pre></span>'),
 ]
 
+# Work item properties needed to synchronize, returned inline by queries
+WORK_ITEM_SELECT = 'dcterms:identifier,oslc_cm:status,dcterms:modified,dcterms:title'
+WORK_ITEM_PAGE_SIZE = 100
+WORK_ITEM_RESOURCE = 'resource/itemName/com.ibm.team.workitem.WorkItem'
+
 OSLC_CM_SERVICE_PROVIDER ='http://open-services.net/xmlns/cm/1.0/cmServiceProviders'
 AUTH_MSG = 'x-com-ibm-team-repository-web-auth-msg'
 MSG_FAIL = 'authfailed'
@@ -157,6 +163,7 @@ class RationalConnector(AlmConnector):
         self.creation_url = None
         self.cm_service_provider_target = None
         self.COOKIE_JSESSIONID = None
+        self.work_item_index = None
         self.mark_down_converter = markdown.Markdown(safe_mode="escape")
 
     def initialize(self):
@@ -327,6 +334,87 @@ class RationalConnector(AlmConnector):
     def alm_validate_configurations(self):
         pass
 
+    def _get_target(self, url):
+        return url.replace(self.alm_plugin.base_uri + '/', '')
+
+    def _get_work_item_query(self, title_prefix, page_size):
+        """ Query target for the work items whose title starts with title_prefix """
+        return '%s/workitems?oslc.where=dcterms:title="%s*"&oslc.select=%s&oslc.pageSize=%d' % (
+               self.query_url, urlencode_str(title_prefix), WORK_ITEM_SELECT, page_size)
+
+    def _query_work_items(self, title_prefix):
+        """ Returns the work items whose title starts with title_prefix, following every result page """
+        target = self._get_work_item_query(title_prefix, WORK_ITEM_PAGE_SIZE)
+        work_items = []
+        while target:
+            result = self._call_api(target)
+            if result['oslc:responseInfo']['oslc:totalCount'] == 0:
+                break
+            work_items.extend(result['oslc:results'])
+
+            next_page = result['oslc:responseInfo'].get('oslc:nextPage')
+            if next_page:
+                target = self._get_target(next_page['rdf:resource'])
+            else:
+                target = None
+        return work_items
+
+    def _make_rational_task(self, task_id, work_item):
+        return RationalTask(task_id,
+                            work_item.get('rdf:about') or work_item['rdf:resource'],
+                            work_item['dcterms:identifier'],
+                            work_item['oslc_cm:status'],
+                            work_item['dcterms:modified'],
+                            self.config[self.ALM_DONE_STATUSES])
+
+    def alm_prefetch_tasks(self, tasks):
+        """
+        Fetches all work items titled like the tasks being synchronized, with their
+        properties selected inline, using the common prefix of the fixed titles
+        """
+        self.work_item_index = None
+        if not tasks:
+            return
+
+        title_prefix = os.path.commonprefix([task['alm_fixed_title'] for task in tasks])
+        task_id = '%s:' % self._extract_task_id(tasks[0]['id'])
+        if tasks[0]['alm_fixed_title'].startswith(task_id) and len(title_prefix) < len(task_id):
+            # Titles starting with different task ids only share a prefix such as "T",
+            # which would match most work items of the project
+            logger.debug('Task titles share no prefix to query, looking up each task instead')
+            return
+
+        try:
+            work_items = self._query_work_items(title_prefix)
+        except APIError, err:
+            logger.error(err)
+            raise AlmException('Unable to get work items from Rational')
+
+        work_item_index = AlmTaskIndex(tasks)
+        for work_item in work_items:
+            if 'dcterms:title' not in work_item:
+                logger.warning('Rational did not return the selected work item properties, '
+                               'looking up each task instead')
+                return
+            work_item_index.add(work_item['dcterms:title'], work_item, work_item['dcterms:identifier'])
+
+        logger.debug('Prefetched %d Rational work items for %d tasks' % (len(work_item_index), len(tasks)))
+        self.work_item_index = work_item_index
+
+    def alm_get_task_by_id(self, task, alm_id):
+        task_id = self._extract_task_id(task['id'])
+        try:
+            work_item = self._call_api('%s/%s?oslc.properties=%s' % (WORK_ITEM_RESOURCE, alm_id, WORK_ITEM_SELECT))
+        except APIError, err:
+            if getattr(err, 'code', None) in [404, 410]:
+                return None
+            logger.error(err)
+            raise AlmException('Unable to get task %s from Rational' % task_id)
+
+        if not work_item.get('dcterms:title', '').startswith(task['alm_fixed_title']):
+            return None
+        return self._make_rational_task(task_id, work_item)
+
     def alm_get_task(self, task):
         """Returns a RationalTask object that has the same ID as the given task"""
 
@@ -334,10 +422,21 @@ class RationalConnector(AlmConnector):
         if not task_id:
             return None
 
+        if self.work_item_index is not None and self.work_item_index.covers(task):
+            work_item = self.work_item_index.get(task)
+            if not work_item:
+                return None
+            logger.info('Found task: %s', task_id)
+            return self._make_rational_task(task_id, work_item)
+
+        rational_task = self.alm_get_remembered_task(task)
+        if rational_task:
+            logger.info('Found task: %s', task_id)
+            return rational_task
+
         try:
-            # Fields parameter will filter response data to only contain story status, name, timestamp and id
-            work_items = self._call_api('%s/workitems?oslc.where=dcterms:title="%s*"' % (
-                                        self.query_url, urlencode_str(task['alm_fixed_title'])))
+            # The selected properties are returned with the results
+            work_items = self._call_api(self._get_work_item_query(task['alm_fixed_title'], 1))
         except APIError, err:
             logger.error(err)
             raise AlmException('Unable to get task %s from Rational' % task_id)
@@ -345,21 +444,17 @@ class RationalConnector(AlmConnector):
         if work_items['oslc:responseInfo']['oslc:totalCount'] == 0:
             return None
 
-        work_item_url = work_items['oslc:results'][0]['rdf:resource']
-        work_item_target = work_item_url.replace(self.alm_plugin.base_uri+'/', '')
-        try:
-            work_item = self._call_api(work_item_target)
-        except APIError, err:
-            logger.error(err)
-            raise AlmException('Unable to get task %s from Rational' % task_id)
+        work_item = work_items['oslc:results'][0]
+        if 'dcterms:identifier' not in work_item:
+            # Older servers ignore oslc.select and only return the work item reference
+            try:
+                work_item = self._call_api(self._get_target(work_item['rdf:resource']))
+            except APIError, err:
+                logger.error(err)
+                raise AlmException('Unable to get task %s from Rational' % task_id)
 
         logger.info('Found task: %s', task_id)
-        return RationalTask(task_id,
-                                  work_item_url,
-                                  work_item['dcterms:identifier'],
-                                  work_item['oslc_cm:status'],
-                                  work_item['dcterms:modified'],
-                                  self.config[self.ALM_DONE_STATUSES])
+        return self._make_rational_task(task_id, work_item)
 
     def alm_add_task(self, task):
         """Adds a task with the specified status if provided, otherwise status is set to new"""
@@ -391,7 +486,11 @@ class RationalConnector(AlmConnector):
             raise AlmException('Unable to add task %s to Rational because of %s'
                                % (task['id'], err))
 
+        if self.work_item_index is not None:
+            self.work_item_index.invalidate(task)
+
         alm_task = self.alm_get_task(task)
+        self._record_added_task(task, alm_task)
 
         return 'Project: %s; Task: %s; URL: %s' % (
                self.config['alm_project'], alm_task.get_alm_id(), alm_task.get_alm_url()
@@ -405,6 +504,9 @@ class RationalConnector(AlmConnector):
         except APIError, err:
             raise AlmException('Unable to delete task %s in Rational because of %s' % (task.get_alm_id(), err))
 
+        if self.work_item_index is not None:
+            self.work_item_index.invalidate_alm_id(task.get_alm_id())
+
         logger.debug('Task %s deleted in Rational' % task.get_alm_id())
 
     def alm_update_task_status(self, task, status):
@@ -3,8 +3,9 @@
 import unittest
 
 from rational_response_generator import RationalResponseGenerator
-from sdetools.alm_integration.alm_plugin_base import AlmConnector
+from sdetools.alm_integration.alm_plugin_base import AlmConnector, AlmException
 from sdetools.alm_integration.tests.alm_plugin_test_base import AlmPluginTestBase
+from sdetools.modules.sync_rational import rational_plugin
 from sdetools.modules.sync_rational.rational_plugin import RationalConnector, RationalAPI
 
 
@@ -60,3 +61,65 @@ class TestRationalCase(AlmPluginTestBase, unittest.TestCase):
         self.assertEqual(test_task['id'][test_task['id'].find('T'):], alm_task.get_task_id(), 'Files don\'t match, mismatch: %s - %s' % (test_task['id'][test_task['id'].find('T'):], alm_task.get_task_id()))
         self.assertEqual(test_task['status'], alm_task.get_status(), 'Files don\'t match, mismatch: %s - %s' % (test_task['status'], alm_task.get_status()))
 
+    def test_api_exceptions_are_handled(self):
+        # Work item properties are selected inline, so a sync only reads work items through queries
+        self.response_generator.rest_api_targets.pop('.*/resource/itemName/com.ibm.team.workitem.WorkItem/\\d*')
+        super(TestRationalCase, self).test_api_exceptions_are_handled()
+
+    def test_remove_task_exceptions_are_handled(self):
+        self.connector.alm_connect()
+        test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+        self.connector.alm_add_task(test_task)
+        alm_task = self.connector.alm_get_task(test_task)
+        self.mock_alm_response.set_response_flags({'update_workitem': 'fail'})
+        self.assertRaises(AlmException, self.connector.alm_remove_task, alm_task)
+
+    def test_prefetch_tasks(self):
+        self.connector.alm_connect()
+        self.config['alm_context'] = 'SDE'
+        self.config['alm_title_format'] = '[${context}] ${task_id} ${title}'
+        test_tasks = []
+        for index in range(5):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        for index, test_task in enumerate(test_tasks[:3]):
+            identifier = str(20000 + index)
+            self.response_generator.generator_add_resource('workitem', identifier, resource_data={
+                'rdf:about': 'https://jazz.net/sandbox02-ccm/resource/itemName/com.ibm.team.workitem.WorkItem/%s' %
+                             identifier,
+                'dcterms:identifier': identifier,
+                'dcterms:title': test_task['alm_full_title'],
+                'oslc_cm:status': 'New',
+                'dcterms:modified': '2014-01-31T16:26:45.607Z',
+            })
+
+        api_calls = self.count_api_calls()
+
+        # Use two work items per page to exercise paging
+        page_size = rational_plugin.WORK_ITEM_PAGE_SIZE
+        rational_plugin.WORK_ITEM_PAGE_SIZE = 2
+        try:
+            self.connector.alm_prefetch_tasks(test_tasks)
+        finally:
+            rational_plugin.WORK_ITEM_PAGE_SIZE = page_size
+        self.assertEqual(len(api_calls), 2, 'Expected two pages of work items, got calls: %s' % api_calls)
+
+        del api_calls[:]
+        for index, test_task in enumerate(test_tasks[:3]):
+            self.assertEqual(self.connector.alm_get_task(test_task).get_alm_id(), str(20000 + index))
+        for test_task in test_tasks[3:]:
+            self.assertEqual(self.connector.alm_get_task(test_task), None)
+        self.assertEqual(api_calls, [], 'Expected lookups from the prefetched work items, got calls: %s' % api_calls)
+
+        # Without the index, a lookup is a single query with the properties selected inline
+        self.connector.work_item_index = None
+        self.assertEqual(self.connector.alm_get_task(test_tasks[0]).get_alm_id(), '20000')
+        self.assertEqual(len(api_calls), 1, 'Expected a single query, got calls: %s' % api_calls)
+
+        # Titles that only share the start of their task ids are looked up one at a time
+        self.config['alm_title_format'] = '${task_id} ${title}'
+        test_tasks = [AlmConnector.add_alm_title(self.config, test_task) for test_task in test_tasks]
+        del api_calls[:]
+        self.connector.alm_prefetch_tasks(test_tasks)
+        self.assertEqual(self.connector.work_item_index, None)
+        self.assertEqual(api_calls, [], 'Expected no prefetch, got calls: %s' % api_calls)
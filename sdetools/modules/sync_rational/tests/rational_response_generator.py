@@ -90,6 +90,9 @@ class RationalResponseGenerator(ResponseGenerator):
 
     def get_count(self, target, flag, data, method):
         if not flag:
+            params = self.get_url_parameters(target)
+            if 'oslc.select' in params:
+                return RESPONSE_HEADERS, self._get_selected_workitems(target, params)
             count = len(self.generator_get_all_resource('workitem'))
             res = self.generator_get_all_resource('count')[0]
             res['oslc:responseInfo']['oslc:totalCount'] = count
@@ -97,11 +100,39 @@ class RationalResponseGenerator(ResponseGenerator):
         else:
             self.raise_error('404')
 
+    def _get_selected_workitems(self, target, params):
+        """ Returns a page of the work items matching a title prefix, with the selected properties inline """
+        title_prefix = params['oslc.where'][0].split('=', 1)[1].strip('"').rstrip('*')
+        properties = params['oslc.select'][0].split(',')
+        page_size = int(params['oslc.pageSize'][0])
+        start_index = int(params.get('_startIndex', ['0'])[0])
+
+        workitems = [workitem for workitem in self.generator_get_all_resource('workitem')
+                     if workitem['dcterms:title'].startswith(title_prefix)]
+        workitems.sort(key=lambda workitem: int(workitem['dcterms:identifier']))
+        results = []
+        for workitem in workitems[start_index:start_index + page_size]:
+            result = {'rdf:about': workitem['rdf:about']}
+            for name in properties:
+                result[name] = workitem[name]
+            results.append(result)
+
+        res = self.generator_get_all_resource('count')[0]
+        res['oslc:results'] = results
+        res['oslc:responseInfo']['oslc:totalCount'] = len(workitems)
+        if start_index + page_size < len(workitems):
+            next_page = 'https://%s%s&_startIndex=%d' % (self.alm_server, target.split('&_startIndex=')[0],
+                                                        start_index + page_size)
+            res['oslc:responseInfo']['oslc:nextPage'] = {'rdf:resource': next_page}
+        return res
+
     def update_workitem(self, target, flag, data, method):
         if not flag:
-            task_id = target.rsplit('/', 1)[1]
+            task_id = target.split('?', 1)[0].rsplit('/', 1)[1]
             if method == 'GET':
                 res = self.generator_get_resource('workitem', str(task_id))
+                if res is None:
+                    self.raise_error(404)
             elif method == 'DELETE':
                 self.generator_remove_resource('workitem', task_id)
                 res = ''
@@ -112,6 +143,11 @@ class RationalResponseGenerator(ResponseGenerator):
     def post_workitem(self, target, flag, data, method):
         if not flag:
             res = self.generate_resource_from_template('workitem', data)
+            # Identify each work item by its task number
+            task_number = self.extract_task_number_from_title(res['dcterms:title'])
+            if task_number:
+                res['dcterms:identifier'] = task_number
+                res['rdf:about'] = res['rdf:about'].rsplit('/', 1)[0] + '/' + task_number
             self.generator_add_resource('workitem', res['dcterms:identifier'], resource_data=res)
             return RESPONSE_HEADERS, res
         else:
@@ -1,12 +1,16 @@
 # NOTE: Before running ensure that the options are set properly in the
 #       configuration file
+import time
 import unittest
+import xmlrpclib
 
 from mock import patch
 from functools import partial
 from trac_response_generator import TracResponseGenerator
 from sdetools.sdelib.testlib.mock_response import MOCK_ALM_RESPONSE
 from sdetools.alm_integration.tests.alm_plugin_test_base import AlmPluginTestBase
+from sdetools.alm_integration.alm_plugin_base import AlmConnector
+from sdetools.sdelib.commons import UsageError
 from sdetools.modules.sync_trac.trac_plugin import TracConnector, TracXMLRPCAPI
 PATH_TO_ALM_REST_API = 'sdetools.modules.sync_trac.trac_plugin'
 
@@ -51,6 +55,71 @@ class TestTracCase(AlmPluginTestBase, unittest.TestCase):
 
         self.assertEqual(result_alm_id, alm_id, 'Expected alm_id %s, got %s' % (alm_id, result_alm_id))
 
+    def test_prefetch_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for index in range(5):
+            test_task = self.mock_sde_response.generate_sde_task()
+            test_tasks.append(AlmConnector.add_alm_title(self.config, test_task))
+        for test_task in test_tasks[:3]:
+            self.connector.alm_add_task(test_task)
+
+        proxy_calls = []
+        get_proxy_response = self.response_generator.get_proxy_response
+
+        def counting_get_proxy_response(args):
+            proxy_calls.append(args[0])
+            return get_proxy_response(args)
+
+        self.response_generator.get_proxy_response = counting_get_proxy_response
+
+        # Two tasks per multicall to exercise batching
+        self.connector.config['alm_batch_size'] = 2
+        self.connector.alm_prefetch_tasks(test_tasks)
+        self.assertEqual(proxy_calls.count('system.multicall'), 5)
+        self.assertEqual(proxy_calls.count('ticket.query'), 5)
+        self.assertEqual(proxy_calls.count('ticket.get'), 3)
+
+        proxy_calls[:] = []
+        for test_task in test_tasks[:3]:
+            alm_id = test_task['id'].split('T')[1]
+            self.assertEqual(self.connector.alm_get_task(test_task).get_alm_id(), alm_id)
+        for test_task in test_tasks[3:]:
+            self.assertEqual(self.connector.alm_get_task(test_task), None)
+        self.assertEqual(proxy_calls, [], 'Expected lookups from the prefetched tickets, got calls: %s' % proxy_calls)
+
+        # Status changes are looked up in Trac again
+        alm_task = self.connector.alm_get_task(test_tasks[0])
+        self.connector.alm_update_task_status(alm_task, 'DONE')
+        self.assertEqual(self.connector.alm_get_task(test_tasks[0]).get_status(), 'DONE')
+
+    def test_prefetch_tasks_call_faults(self):
+        self.connector.alm_connect()
+        test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+        self.connector.alm_add_task(test_task)
+
+        self.connector.alm_plugin.multicall = lambda calls, batch_size: [xmlrpclib.Fault(1, 'Error')] * len(calls)
+        self.connector.alm_prefetch_tasks([test_task])
+        self.assertFalse(self.connector.ticket_index.covers(test_task))
+        self.assertNotNone(self.connector.alm_get_task(test_task))
+
+    def test_get_changed_tasks(self):
+        self.connector.alm_connect()
+        test_tasks = []
+        for index in range(3):
+            test_task = AlmConnector.add_alm_title(self.config, self.mock_sde_response.generate_sde_task())
+            self.connector.alm_add_task(test_task)
+            test_tasks.append(test_task)
+        self.response_generator.generator_update_resource('ticket', test_tasks[1]['id'].split('T')[1],
+                                                          {'changetime': '2013-10-02T20:27:27Z'})
+
+        changed_tasks = self.connector.alm_get_changed_tasks(test_tasks, time.time())
+        self.assertEqual([task['id'] for task in changed_tasks], [test_tasks[0]['id'], test_tasks[2]['id']])
+
+    def test_invalid_batch_size(self):
+        self.config['alm_batch_size'] = '0'
+        self.assertRaises(UsageError, self.connector.initialize)
+
     def test_api_exceptions_are_handled(self):
         pass
 
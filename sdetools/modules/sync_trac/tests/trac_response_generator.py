@@ -1,3 +1,4 @@
+from datetime import datetime
 from urllib2 import HTTPError
 from xmlrpclib import Fault
 
@@ -14,11 +15,13 @@ class TracResponseGenerator(ResponseGenerator):
         resource_templates = ['ticket.xml']
         rest_api_targets = {
             'system\.getAPIVersion': 'get_api_version',
+            'system\.multicall': 'multicall',
             'ticket\.get$': 'get_ticket_by_id',
             'ticket\.query': 'query_ticket',
             'ticket\.create': 'create_ticket',
             'ticket\.update': 'update_ticket',
             'ticket\.getActions': 'get_ticket_actions',
+            'ticket\.getRecentChanges': 'get_recent_changes',
         }
         super(TracResponseGenerator, self).__init__(rest_api_targets, resource_templates, test_dir)
 
@@ -44,6 +47,8 @@ class TracResponseGenerator(ResponseGenerator):
         if len(args) > 2:
             data = args[2:]
 
+        # Kept for the calls bundled in a multicall
+        self.proxy_flags = flags
         success_code, headers, response = super(TracResponseGenerator, self).get_response(target, flags, data, None)
 
         return response
@@ -57,9 +62,27 @@ class TracResponseGenerator(ResponseGenerator):
         else:
             self.raise_error('404')
 
+    def multicall(self, target, flag, data, method):
+        if not flag:
+            if data:
+                results = []
+                for call in data[0]:
+                    try:
+                        response = self.get_proxy_response((call['methodName'], self.proxy_flags) +
+                                                           tuple(call['params']))
+                        results.append([response])
+                    except Fault as err:
+                        results.append({'faultCode': err.faultCode, 'faultString': err.faultString})
+                return RESPONSE_HEADERS, results
+            self.raise_error('405')
+        else:
+            self.raise_error('404')
+
     def get_ticket_by_id(self, target, flag, data, method):
         if not flag:
             if data:
+                if not self.generator_resource_exists('ticket', str(data[0])):
+                    self.raise_error('404')
                 return RESPONSE_HEADERS, self.generator_get_resource('ticket', data[0])
             self.raise_error('405')
         else:
@@ -89,8 +112,9 @@ class TracResponseGenerator(ResponseGenerator):
                     self.generator_add_resource('ticket', task_number, {
                         'id': task_number,
                         'title': task_title,
-                        'milestone': None,
-                        'status': data[2]['status']
+                        'milestone': data[2].get('milestone'),
+                        'status': data[2]['status'],
+                        'changetime': self.get_current_utc_timestamp()
                     })
                     return RESPONSE_HEADERS, task_number
 
@@ -116,6 +140,7 @@ class TracResponseGenerator(ResponseGenerator):
                         if new_status:
                             update_values['status'] = new_status
                     if update_values:
+                        update_values['changetime'] = self.get_current_utc_timestamp()
                         self.generator_update_resource('ticket', task_number, update_values)
 
                     return RESPONSE_HEADERS, self.generator_get_resource('ticket', task_number)
@@ -139,12 +164,24 @@ class TracResponseGenerator(ResponseGenerator):
         else:
             self.raise_error('401')
 
+    def get_recent_changes(self, target, flag, data, method):
+        if not flag:
+            if data:
+                since = datetime.strptime(data[0].value, '%Y%m%dT%H:%M:%S')
+                tickets = self.resources['ticket']['resources'].values()
+                return RESPONSE_HEADERS, [ticket['id'] for ticket in tickets
+                                          if datetime.strptime(ticket['changetime'], '%Y-%m-%dT%H:%M:%SZ') >= since]
+            self.raise_error('405')
+        else:
+            self.raise_error('401')
+
     def generate_resource_from_template(self, resource_type, resource_data):
         self._check_resource_type_exists(resource_type)
         task_attrs = {
             "status": resource_data['status'],
-            "changetime": '2013-10-02T20:27:27Z',
-            "milestone": resource_data['milestone']
+            "changetime": resource_data.get('changetime', '2013-10-02T20:27:27Z'),
+            "milestone": resource_data['milestone'],
+            "summary": resource_data['title']
         }
 
         return [resource_data['id'], '2013-10-02T20:27:27Z', '2013-10-02T20:27:27Z', task_attrs]
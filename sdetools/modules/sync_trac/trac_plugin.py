@@ -7,8 +7,8 @@ from datetime import datetime
 
 from sdetools.sdelib.commons import UsageError, json, urlencode_str
 from sdetools.sdelib.restclient import RESTBase
-from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector
-from sdetools.alm_integration.alm_plugin_base import AlmException
+from sdetools.alm_integration.alm_plugin_base import AlmTask, AlmConnector, AlmTaskIndex
+from sdetools.alm_integration.alm_plugin_base import AlmException, SYNC_MARGIN_SECONDS
 
 from sdetools.sdelib import log_mgr
 logger = log_mgr.mods.add_mod(__name__)
@@ -34,6 +34,27 @@ class TracXMLRPCAPI(RESTBase):
             self.post_conf_init()
             self.proxy = xmlrpclib.ServerProxy(self.base_uri)
 
+    def multicall(self, calls, batch_size):
+        """
+        Runs a list of (method_name, args) calls through system.multicall, sending
+        at most batch_size calls per round-trip. Returns the results in call order;
+        a call that failed on its own is returned as its xmlrpclib.Fault.
+        """
+        results = []
+        for start in range(0, len(calls), batch_size):
+            batch = calls[start:start + batch_size]
+            multicall = xmlrpclib.MultiCall(self.proxy)
+            for method_name, args in batch:
+                getattr(multicall, method_name)(*args)
+
+            batch_results = multicall()
+            for index in range(len(batch)):
+                try:
+                    results.append(batch_results[index])
+                except xmlrpclib.Fault, err:
+                    results.append(err)
+        return results
+
 
 class TracTask(AlmTask):
     """ Representation of a task in Trac"""
@@ -70,6 +91,9 @@ class TracTask(AlmTask):
 
 class TracConnector(AlmConnector):
     alm_name = 'Trac'
+    # xmlrpclib.ServerProxy can not be shared between threads
+    alm_max_concurrency = 1
+    feature_changed_tasks = True
 
     def __init__(self, config, alm_plugin):
         """ Initializes connection to Trac """
@@ -83,6 +107,9 @@ class TracConnector(AlmConnector):
             default='Ready for Analysis')
         config.opts.add('alm_done_statuses', 'Statuses that signify a task is Done in Trac',
             default='closed')
+        config.opts.add('alm_batch_size', 'Number of Trac lookups to send in one XML-RPC multicall',
+            default='50')
+        self.ticket_index = None
 
     def initialize(self):
         super(TracConnector, self).initialize()
@@ -93,6 +120,13 @@ class TracConnector(AlmConnector):
         if not self.config['alm_done_statuses']:
             raise UsageError('Missing alm_done_statuses in configuration')
 
+        try:
+            self.config['alm_batch_size'] = int(self.config['alm_batch_size'])
+        except (TypeError, ValueError):
+            raise UsageError('Incorrect alm_batch_size specified in configuration. Valid values are > 0')
+        if self.config['alm_batch_size'] < 1:
+            raise UsageError('Incorrect alm_batch_size specified in configuration. Valid values are > 0')
+
         for action_type in ['alm_close_transition', 'alm_reopen_transition']:
             action_to_take = self.config[action_type]
 
@@ -144,23 +178,118 @@ class TracConnector(AlmConnector):
             logger.warning('More than one task matched search ...')
         return tasks[0]
 
-    def _get_trac_task_by_id(self, sde_id, alm_id):
-        trac_task = self.alm_plugin.proxy.ticket.get(alm_id)
+    def _make_trac_task(self, sde_id, alm_id, trac_task):
         return TracTask(sde_id, alm_id, trac_task[3]['status'], trac_task[3]['changetime'],
                           self.config['alm_done_statuses'], trac_task[3]['milestone'])
 
+    def _get_trac_task_by_id(self, sde_id, alm_id):
+        trac_task = self.alm_plugin.proxy.ticket.get(alm_id)
+        return self._make_trac_task(sde_id, alm_id, trac_task)
+
+    def alm_get_task_by_id(self, task, alm_id):
+        try:
+            trac_task = self.alm_plugin.proxy.ticket.get(alm_id)
+        except xmlrpclib.Fault:
+            # Trac reports a deleted ticket as a fault
+            return None
+
+        if not trac_task[3].get('summary', '').startswith(task['alm_fixed_title']):
+            return None
+        return self._make_trac_task(self._extract_task_id(task['id']), alm_id, trac_task)
+
+    def alm_get_changed_tasks(self, tasks, since):
+        """
+        Fetches the tickets changed since the last sync with one batched multicall
+        and matches them to the tasks by summary
+        """
+        since = xmlrpclib.DateTime(datetime.utcfromtimestamp(since - SYNC_MARGIN_SECONDS))
+        try:
+            alm_ids = self.alm_plugin.proxy.ticket.getRecentChanges(since)
+            if not alm_ids:
+                return []
+            ticket_results = self.alm_plugin.multicall([('ticket.get', (alm_id,)) for alm_id in alm_ids],
+                                                       self.config['alm_batch_size'])
+        except (xmlrpclib.ProtocolError, xmlrpclib.Fault), err:
+            logger.warning('Unable to get the changed Trac tickets: %s' % err)
+            return None
+
+        ticket_index = AlmTaskIndex(tasks)
+        for alm_id, trac_task in zip(alm_ids, ticket_results):
+            if isinstance(trac_task, xmlrpclib.Fault):
+                # The ticket may have been deleted since it changed
+                logger.debug('Batched get failed for ticket %s: %s' % (alm_id, trac_task))
+                continue
+            ticket_index.add(trac_task[3].get('summary', ''), trac_task, alm_id)
+
+        return [task for task in tasks if ticket_index.get(task)]
+
+    def alm_prefetch_tasks(self, tasks):
+        """
+        Looks up the tickets of all tasks with batched multicalls: one round-trip
+        per alm_batch_size queries, then one per alm_batch_size ticket gets.
+        Tasks whose call failed are left out of the index and looked up one by one.
+        """
+        self.ticket_index = None
+        if not tasks:
+            return
+
+        batch_size = self.config['alm_batch_size']
+        # The colon is needed, otherwise for "T6" we match on "T6" and "T68"
+        queries = [('ticket.query', ('summary^=%s' % task['alm_fixed_title'],)) for task in tasks]
+        try:
+            query_results = self.alm_plugin.multicall(queries, batch_size)
+        except (xmlrpclib.ProtocolError, xmlrpclib.Fault), err:
+            logger.warning('Unable to batch Trac lookups, falling back to a lookup per task: %s' % err)
+            return
+
+        ticket_index = AlmTaskIndex(tasks)
+        found_tasks = []
+        for task, task_list in zip(tasks, query_results):
+            if isinstance(task_list, xmlrpclib.Fault):
+                logger.debug('Batched query failed for %s: %s' % (task['id'], task_list))
+                ticket_index.invalidate(task)
+            elif task_list:
+                found_tasks.append((task, self._vet_alm_tasks(task_list)))
+
+        gets = [('ticket.get', (alm_id,)) for task, alm_id in found_tasks]
+        try:
+            ticket_results = self.alm_plugin.multicall(gets, batch_size)
+        except (xmlrpclib.ProtocolError, xmlrpclib.Fault), err:
+            logger.warning('Unable to batch Trac lookups, falling back to a lookup per task: %s' % err)
+            return
+
+        for (task, alm_id), trac_task in zip(found_tasks, ticket_results):
+            if isinstance(trac_task, xmlrpclib.Fault):
+                logger.debug('Batched get failed for %s: %s' % (task['id'], trac_task))
+                ticket_index.invalidate(task)
+            else:
+                ticket_index.add(task['alm_fixed_title'], (alm_id, trac_task), alm_id)
+
+        logger.debug('Prefetched %d Trac tickets for %d tasks' % (len(ticket_index), len(tasks)))
+        self.ticket_index = ticket_index
+
     def alm_get_task(self, task):
         sde_id = self._extract_task_id(task['id'])
 
-        # The colon is needed, otherwise for "T6" we match on "T6" and "T68"
-        qstr = 'summary^=%s' % task['alm_fixed_title']
-        task_list = self.alm_plugin.proxy.ticket.query(qstr)
-        if not task_list:
-            return None
+        if self.ticket_index is not None and self.ticket_index.covers(task):
+            indexed_ticket = self.ticket_index.get(task)
+            if not indexed_ticket:
+                return None
+            alm_id, trac_task = indexed_ticket
+            trac_ticket = self._make_trac_task(sde_id, alm_id, trac_task)
+        else:
+            trac_ticket = self.alm_get_remembered_task(task)
+
+        if trac_ticket is None:
+            # The colon is needed, otherwise for "T6" we match on "T6" and "T68"
+            qstr = 'summary^=%s' % task['alm_fixed_title']
+            task_list = self.alm_plugin.proxy.ticket.query(qstr)
+            if not task_list:
+                return None
 
-        alm_id = self._vet_alm_tasks(task_list)
+            alm_id = self._vet_alm_tasks(task_list)
 
-        trac_ticket = self._get_trac_task_by_id(sde_id, alm_id)
+            trac_ticket = self._get_trac_task_by_id(sde_id, alm_id)
 
         # Option A - Re-use the same ticket across milestones
         if trac_ticket.get_milestone() != self.config['alm_project']:
@@ -184,11 +313,16 @@ class TracConnector(AlmConnector):
             raise AlmException('Alm task not added sucessfully. Please '
                                'check ALM-specific settings in config file')
 
+        if self.ticket_index is not None:
+            self.ticket_index.invalidate(task)
+
         alm_task = self._get_trac_task_by_id(sde_id, alm_id)
 
         if (self.config['alm_standard_workflow'] and
                 (task['status'] == 'DONE' or task['status'] == 'NA')):
             self.alm_update_task_status(alm_task, task['status'])
+
+        self._record_added_task(task, alm_task)
         return 'Milestone: %s, Ticket: %s' % (self.config['alm_project'], alm_id)
 
     def alm_update_task_milestone(self, task, milestone):
@@ -199,6 +333,8 @@ class TracConnector(AlmConnector):
         }
 
         task_list = self.alm_plugin.proxy.ticket.update(task.get_alm_id(), comment, update_args)
+        if self.ticket_index is not None:
+            self.ticket_index.invalidate_alm_id(task.get_alm_id())
         if not task_list:
             logger.error('Update failed for %s' % task.task_id)
             return None
@@ -244,6 +380,8 @@ class TracConnector(AlmConnector):
         update_args.update(action_args)
 
         task_list = self.alm_plugin.proxy.ticket.update(task.get_alm_id(), comment, update_args)
+        if self.ticket_index is not None:
+            self.ticket_index.invalidate_alm_id(task.get_alm_id())
         if not task_list:
             logger.error('Update failed for %s' % task.task_id)
             return None
@@ -1,10 +1,12 @@
 __all__ = [
     'log_mgr',
     'restclient',
+    'http_cache',
     'sdeapi', 
     'commons', 
     'conf_mgr',
     'mod_mgr',
     'content', 
     'interactive_plugin', 
+    'scan_cache',
     'scanner']
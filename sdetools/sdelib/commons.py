@@ -1,8 +1,9 @@
-__all__ = ['json', 'abc', 'argparse', 'Error', 'show_error', 'get_password', 'urlencode_str']
+__all__ = ['json', 'abc', 'argparse', 'Error', 'show_error', 'get_password', 'urlencode_str', 'atomic_write']
 
 import sys
 import os
 import urllib
+import tempfile
 
 import getpass
 
@@ -73,6 +74,28 @@ def urlencode_str(inp):
     return urllib.urlencode({'a':inp})[2:]
 
 
+def atomic_write(path, data):
+    """
+    Writes data to path through a temporary file in the same directory, so that
+    readers never see a partly written file. Raises IOError or OSError on failure
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        fp = os.fdopen(fd, 'wb')
+        try:
+            fp.write(data)
+        finally:
+            fp.close()
+        if os.name == 'nt' and os.path.exists(path):
+            # Windows does not allow renaming over an existing file
+            os.remove(path)
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 def get_directory_of_current_module(self):
     file_path = sys.modules[self.__module__].__file__
     file_directory = os.path.dirname(file_path)
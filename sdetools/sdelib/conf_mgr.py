@@ -128,6 +128,7 @@ class Config(object):
             'args': None,
             'proxy_auth': '',
             'cert_loc': '',
+            'no_cache': False,
         }
 
     def __init__(self, cmd_name, sub_cmd_name, command_list, args, ret_chn, call_src, call_options={}):
@@ -246,7 +247,7 @@ class Config(object):
                     return False, 'Config file not found.'
 
         config_keys = ['log_level', 'debug_mods', 'application', 'project', 
-            'authmode', 'args', 'proxy_auth', 'cert_loc']
+            'authmode', 'args', 'proxy_auth', 'cert_loc', 'no_cache']
 
         for name, optlist in self.custom_options:
             for item in optlist:
@@ -298,6 +299,8 @@ class Config(object):
             default='', type='string',
             help = "Comma-separated list of modules to debug, e.g. sdetools.sdelib.sdeapi)")
         parser.add_option('-s', '--cert_loc', metavar='FILE_PATH', help='Custom certificate bundle', default='')
+        parser.add_option('--no-cache', dest='no_cache', default=False, action='store_true',
+            help = "Do NOT use cached API responses or lint results")
 
         for group_name, optslist in self.custom_options:
             group = optparse.OptionGroup(parser, group_name)
@@ -373,6 +376,8 @@ class Config(object):
             self.fix_proxy_env()
         if opts.cert_loc:
             self['cert_loc'] = opts.cert_loc
+        if opts.no_cache:
+            self['no_cache'] = True
 
         for group_name, optlist in self.custom_options:
             for item in optlist:
@@ -1,15 +1,150 @@
 import re
 
+# Required conditions that a file can be checked against without reading it
+INDEXED_CONTEXT_TYPES = ['file-name', 'file-type']
+# Context conditions that search the content of a file
+PATTERN_CONTEXT_TYPES = ['regex', 'import']
+# The re module supports at most 99 groups in a pattern
+MAX_PATTERN_GROUPS = 99
+# Patterns that can not be combined: numbered or named group references and named groups
+UNCOMBINABLE_PATTERN_RE = re.compile(r'\\[1-9]|\(\?P|\(\?\(')
+
+
+class PatternMatcher(object):
+    """
+    Finds the first match of each of a number of compiled patterns in a text.
+
+    The patterns are combined into alternations of named groups, so that a text
+    is searched once for all of them. A match of the combined pattern tells
+    which pattern matched at that position. A pattern that matches only where
+    another one matched first (at the same position or overlapping) is found
+    by matching it at the positions covered by the combined matches, since the
+    combined pattern has already failed everywhere else.
+    """
+
+    def __init__(self, regexes):
+        self.regexes = set(regexes)
+        self.combined = []
+        self.separate = []
+
+        alternatives = []
+        group_regexes = {}
+        group_count = 0
+        for regex in regexes:
+            # Inline flags would apply to every combined pattern
+            if regex.flags or UNCOMBINABLE_PATTERN_RE.search(regex.pattern):
+                self.separate.append(regex)
+                continue
+            if group_count + regex.groups + 1 > MAX_PATTERN_GROUPS:
+                self._add_combined(alternatives, group_regexes)
+                alternatives = []
+                group_regexes = {}
+                group_count = 0
+            group_name = 'p%d' % len(group_regexes)
+            alternatives.append('(?P<%s>%s)' % (group_name, regex.pattern))
+            group_regexes[group_name] = regex
+            group_count += regex.groups + 1
+        if alternatives:
+            self._add_combined(alternatives, group_regexes)
+
+    def _add_combined(self, alternatives, group_regexes):
+        self.combined.append((re.compile('|'.join(alternatives)), group_regexes))
+
+    def search(self, text):
+        """ Returns the span of the first match of each pattern found in text, keyed by pattern """
+        spans = {}
+        for regex in self.separate:
+            match = regex.search(text)
+            if match:
+                spans[regex] = match.span()
+
+        for combined, group_regexes in self.combined:
+            matches = [(match.start(), match.end(), match.lastgroup) for match in combined.finditer(text)]
+            if not matches:
+                continue
+            for group_name, regex in group_regexes.items():
+                for start, end, match_group_name in matches:
+                    if match_group_name == group_name:
+                        spans[regex] = (start, end)
+                        break
+                    match = None
+                    for pos in xrange(start, max(end, start + 1)):
+                        match = regex.match(text, pos)
+                        if match:
+                            break
+                    if match:
+                        spans[regex] = match.span()
+                        break
+        return spans
+
+
 class Content:
+    """
+    The tasks and how-tos of a project, with their context rule sets.
+
+    Rule sets are indexed by the file name or file type they require, if any,
+    so that a file is only checked against the rule sets that can match it.
+    """
     def __init__(self, connector):
         self.content = {}
         self.ctxrules = []
         self.connector = connector
+        self._reset_ctxrule_index()
+
+    def _reset_ctxrule_index(self):
+        self.ctxrule_index = dict([(ctx_type, {}) for ctx_type in INDEXED_CONTEXT_TYPES])
+        # Rule sets that can match any file
+        self.residual_ctxrules = []
+        self.candidate_ctxrules = {}
+        self.pattern_matchers = {}
+
+    def _index_ctxrule(self, ctxrule_id, ctx_item):
+        for ctx_type in INDEXED_CONTEXT_TYPES:
+            for ctx in ctx_item['required']:
+                if ctx['type'] == ctx_type:
+                    self.ctxrule_index[ctx_type].setdefault(ctx['value'], []).append(ctxrule_id)
+                    return
+        self.residual_ctxrules.append(ctxrule_id)
+
+    def _get_candidate_key(self, file_name, file_type):
+        if file_name not in self.ctxrule_index['file-name']:
+            file_name = None
+        return file_name, file_type
+
+    def get_candidate_ctxrules(self, file_name, file_type):
+        """ Returns the rule sets that may match a file with file_name and file_type, in import order """
+        candidate_key = self._get_candidate_key(file_name, file_type)
+        if candidate_key not in self.candidate_ctxrules:
+            ctxrule_ids = (self.ctxrule_index['file-name'].get(file_name, []) +
+                           self.ctxrule_index['file-type'].get(file_type, []) +
+                           self.residual_ctxrules)
+            ctxrule_ids.sort()
+            self.candidate_ctxrules[candidate_key] = [self.ctxrules[ctxrule_id] for ctxrule_id in ctxrule_ids]
+        return self.candidate_ctxrules[candidate_key]
+
+    def get_pattern_matcher(self, file_name, file_type):
+        """ Returns a PatternMatcher for the patterns required by the candidate rule sets of a file """
+        candidate_key = self._get_candidate_key(file_name, file_type)
+        if candidate_key not in self.pattern_matchers:
+            regexes = []
+            for ctxset in self.get_candidate_ctxrules(file_name, file_type):
+                for ctx in ctxset['required']:
+                    if ctx['type'] in PATTERN_CONTEXT_TYPES and ctx['regex'] not in regexes:
+                        regexes.append(ctx['regex'])
+            self.pattern_matchers[candidate_key] = PatternMatcher(regexes)
+        return self.pattern_matchers[candidate_key]
+
+    def __getstate__(self):
+        # The connector is not needed to scan files and can not be sent to another process
+        state = self.__dict__.copy()
+        state['connector'] = None
+        return state
 
     def import_context_rules(self, ctx_rules, refid):
         for ctx_item in ctx_rules:
             self.content[refid]['ctxrules'].append(len(self.ctxrules))
             ctx_item['ref'] = refid
+            self._index_ctxrule(len(self.ctxrules), ctx_item)
             self.ctxrules.append(ctx_item)
             for stype in ['required', 'excluded']:
                 for ctx in ctx_item[stype]:
@@ -24,6 +159,7 @@ class Content:
     def import_task_list(self, task_list):
         self.content = {}
         self.ctxrules = []
+        self._reset_ctxrule_index()
         for task in task_list:
             tid = task['id'].rsplit('-', 1)[-1]
             self.content[tid] = {'title':task['title'], 'ctxrules':[], 'type':'task', 'howtos':[]}
@@ -0,0 +1,183 @@
+"""
+On-disk cache of API responses.
+
+GET responses that carry an ETag or Last-Modified validator are stored with
+their validators, so that the next request for the same resource can be made
+conditional (If-None-Match/If-Modified-Since) and a 304 Not Modified answer
+served from the cache. Reference data that rarely changes can also be served
+without contacting the server at all for a configurable time to live.
+
+An entry is keyed by the request URL and headers, which include the
+credentials, so responses are never shared between users. The cache is
+bounded in number of entries and total size, and the least recently used
+entries are evicted first.
+"""
+import os
+import time
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from sdetools.sdelib.commons import json, atomic_write
+
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+CACHE_FILE_EXT = '.resp'
+DEFAULT_CACHE_DIR = os.path.join('~', '.sdetools_cache', 'http')
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+
+
+class CachedResponse(object):
+    """ A response body with its headers and the time it was last validated """
+
+    def __init__(self, body, headers, validated_at):
+        self.body = body
+        self.headers = headers
+        self.validated_at = validated_at
+
+    def _get_header(self, name):
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return None
+
+    def is_fresh(self, ttl):
+        return ttl > 0 and time.time() - self.validated_at < ttl
+
+    def get_validators(self):
+        """ Returns the headers that make a request for this response conditional """
+        validators = []
+        etag = self._get_header('etag')
+        if etag:
+            validators.append(('If-None-Match', etag))
+        last_modified = self._get_header('last-modified')
+        if last_modified:
+            validators.append(('If-Modified-Since', last_modified))
+        return validators
+
+    def to_json(self):
+        # Bodies and headers are bytes; latin-1 maps each byte to one code point, so they round-trip
+        return {
+            'body': self.body.decode('latin-1'),
+            'headers': dict([(name.decode('latin-1'), value.decode('latin-1'))
+                             for name, value in self.headers.items()]),
+            'validated_at': self.validated_at,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        headers = dict([(name.encode('latin-1'), value.encode('latin-1'))
+                        for name, value in data['headers'].items()])
+        return cls(data['body'].encode('latin-1'), headers, data['validated_at'])
+
+
+class ResponseCache(object):
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(url, headers):
+        request_key = '%s\n%s' % (url, '\n'.join(['%s: %s' % (name.lower(), value)
+                                                  for name, value in sorted(headers)]))
+        return sha1(request_key).hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_EXT)
+
+    def get(self, key):
+        """ Returns the CachedResponse stored for key, or None """
+        path = self._get_path(key)
+        try:
+            fp = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                entry = json.load(fp)
+                if entry['version'] != CACHE_VERSION or entry['key'] != key:
+                    return None
+                response = CachedResponse.from_json(entry['response'])
+            except Exception, e:
+                logger.debug('Ignoring unreadable cached response %s: %s' % (path, e))
+                return None
+        finally:
+            fp.close()
+
+        try:
+            # The modification time of an entry tracks when it was last used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return response
+
+    def put(self, key, body, headers, ttl=0):
+        """
+        Stores a response if it can be validated later or is to be served for a
+        time to live. Returns True if the response was stored.
+        """
+        response = CachedResponse(body, headers, time.time())
+        if not response.get_validators() and ttl <= 0:
+            return False
+        return self._write(key, response)
+
+    def revalidate(self, key, response):
+        """ Records that the server confirmed the cached response is still current """
+        response.validated_at = time.time()
+        return self._write(key, response)
+
+    def _write(self, key, response):
+        path = self._get_path(key)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                # Responses may hold sensitive project data
+                os.makedirs(self.cache_dir, 0700)
+            atomic_write(path, json.dumps({
+                'version': CACHE_VERSION,
+                'key': key,
+                'response': response.to_json(),
+            }))
+        except (IOError, OSError), e:
+            logger.warning('Unable to write cached response %s: %s' % (path, e))
+            return False
+
+        self._evict()
+        return True
+
+    def _evict(self):
+        """ Removes the least recently used entries until the cache is within its bounds """
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(CACHE_FILE_EXT):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        entries.sort()
+        while entries and (len(entries) > self.max_entries or total_size > self.max_size):
+            mtime, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            logger.debug('Evicted cached response %s' % path)
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(CACHE_FILE_EXT):
+                os.remove(os.path.join(self.cache_dir, file_name))
@@ -68,8 +68,16 @@ class RESTBase(object):
     - api_token: We use the _pass and allow customizing the API Token header name
     - session: Used mainly for SD Elements session
     - cookie: A cookie jar is added and cookies will be maintained
+
+    Connections are kept alive and reused between calls unless keep_alive is
+    set to False (see get_connection_stats for pool diagnostics).
+
+    GET calls made with a cache_ttl are served from response_cache, if one is
+    set, as long as the server reports them unchanged (see http_cache).
     """
     URLRequest = URLRequest
+    keep_alive = True
+    response_cache = None
 
     APIError = APIError
     APIHTTPError = APIHTTPError
@@ -143,7 +151,8 @@ class RESTBase(object):
         self.opener = http_req.get_opener(
             self._get_conf('method'),
             self._get_conf('server'),
-            debuglevel=urllib_debuglevel)
+            debuglevel=urllib_debuglevel,
+            keep_alive=self.keep_alive)
         self.config[self._get_conf_name('server')] = self.opener.server
 
         self.session_info = None
@@ -155,6 +164,16 @@ class RESTBase(object):
 
         self._post_init_done = True
 
+    def get_connection_stats(self):
+        """
+        Returns the keep-alive pool counters (hits, misses, evictions, idle),
+        or None if connections are not pooled
+        """
+        pool = getattr(self.opener, 'connection_pool', None)
+        if pool is None:
+            return None
+        return pool.get_stats()
+
     def encode_post_args(self, args):
         return json.dumps(args)
 
@@ -186,7 +205,7 @@ class RESTBase(object):
         """
         return [self.api_token_header_name, self._get_conf('pass')]
 
-    def call_api(self, target, method=URLRequest.GET, args=None, call_headers={}, auth_mode=None):
+    def call_api(self, target, method=URLRequest.GET, args=None, call_headers={}, auth_mode=None, cache_ttl=None):
         """
         Internal method used to call a RESTFul API
 
@@ -195,6 +214,9 @@ class RESTBase(object):
         method -  HTTP Verb, specified by the URLRequest class. Default
                   is GET
         args - Data for arguments
+        cache_ttl - Seconds for which a cached response of a GET call is used
+                    without asking the server, or 0 to always revalidate it.
+                    Default is None (the response is not cached)
 
         """
         if not self.opener:
@@ -247,6 +269,18 @@ class RESTBase(object):
         for item, val in self.get_custom_headers(target, method):
             req.add_header(item, val)
 
+        cache_key = None
+        cached_response = None
+        if method == URLRequest.GET and cache_ttl is not None and self.response_cache is not None:
+            cache_key = self.response_cache.get_key(req_url, self._get_cache_key_headers(req, auth_mode))
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                if cached_response.is_fresh(cache_ttl):
+                    logger.debug(' + Using cached response')
+                    return self.parse_response(cached_response.body, cached_response.headers)
+                for item, val in cached_response.get_validators():
+                    req.add_header(item, val)
+
         call_success = True
         try:
             handle = self.opener.open(req)
@@ -261,6 +295,11 @@ class RESTBase(object):
         if not call_success:
             if not hasattr(handle, 'code'):
                 raise ServerError('Invalid server or server unreachable: %s' % (self.server))
+            if handle.code == 304 and cached_response is not None:
+                handle.close()
+                logger.debug(' + Not modified, using cached response')
+                self.response_cache.revalidate(cache_key, cached_response)
+                return self.parse_response(cached_response.body, cached_response.headers)
             try:
                 err_msg = handle.read()
                 logger.info('Error calling %s API. Raw error: %s' % (self.conf_name, repr(err_msg)[:200]))
@@ -282,9 +321,23 @@ class RESTBase(object):
                 break
             result += res_buf
         handle.close()
-        result = self.parse_response(result, dict(handle.headers))
+        headers = dict(handle.headers)
+        parsed_result = self.parse_response(result, headers)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, result, headers, cache_ttl)
 
-        return result
+        return parsed_result
+
+    def _get_cache_key_headers(self, req, auth_mode):
+        """
+        Returns the request headers that identify a cached response. The session
+        cookie changes with every session, so a session is identified by its user
+        """
+        headers = req.header_items()
+        if auth_mode == 'session':
+            headers = [(name, value) for name, value in headers if name.lower() != 'cookie']
+            headers.append(('X-Session-User', self._get_conf('user')))
+        return headers
 
     def start_session(self):
         """
@@ -0,0 +1,139 @@
+"""
+Lint results kept between scans.
+
+Linting the same tree again mostly finds the same files unchanged. The
+matches found in each file are stored with the size, modification time and
+content hash of the file, so an unchanged file reuses them without being
+evaluated again. A file whose modification time changed but whose content did
+not is recognized by its hash.
+
+The results are stored in a file per set of scan targets, together with a
+fingerprint of the context rule sets and scan settings they were found with,
+and are ignored if that has changed.
+"""
+import os
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from sdetools.sdelib.commons import json, atomic_write
+from sdetools.sdelib import log_mgr
+logger = log_mgr.mods.add_mod(__name__)
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join('~', '.sdetools_cache', 'lint')
+
+# Context fields that affect which files a rule set matches and the reasons given
+CONTEXT_FINGERPRINT_FIELDS = ['type', 'value', 'regex_val']
+
+
+def get_cache_path(cache_dir, targets):
+    """ Returns the cache file in cache_dir for the scan of targets """
+    cache_key = '|'.join([os.path.abspath(target) for target in targets])
+    return os.path.join(os.path.expanduser(cache_dir), '%s.cache' % sha1(cache_key).hexdigest())
+
+
+def get_content_fingerprint(content, settings):
+    """ Returns a fingerprint of the context rule sets in content and the scan settings """
+    ctxrules = []
+    for ctxset in content.ctxrules:
+        ctxrule = [ctxset['ref']]
+        for stype in ['required', 'excluded']:
+            ctxrule.append([[ctx.get(field) for field in CONTEXT_FINGERPRINT_FIELDS] for ctx in ctxset[stype]])
+        ctxrules.append(ctxrule)
+    refs = [(ref, content.get_task_by_ref(ref)) for ref in sorted(content.content)]
+    return sha1(repr((CACHE_VERSION, ctxrules, refs, sorted(settings.items())))).hexdigest()
+
+
+def get_content_hash(text):
+    return sha1(text).hexdigest()
+
+
+class FileRecord(object):
+    """ The matches found in a file, with the size, modification time and hash of its content """
+
+    def __init__(self, size, mtime, content_hash, match_list):
+        self.size = size
+        self.mtime = mtime
+        self.content_hash = content_hash
+        self.match_list = match_list
+
+    def to_json(self):
+        # Reasons quote lines of the file as bytes; latin-1 maps each byte to one code point
+        return {
+            'size': self.size,
+            'mtime': self.mtime,
+            'content_hash': self.content_hash,
+            'match_list': dict([(ref, [reason.decode('latin-1') for reason in reasons])
+                                for ref, reasons in self.match_list.items()]),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        match_list = dict([(ref, [reason.encode('latin-1') for reason in reasons])
+                           for ref, reasons in data['match_list'].items()])
+        return cls(data['size'], data['mtime'], data['content_hash'], match_list)
+
+
+class ScanCache(object):
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.files = {}
+
+    def load(self):
+        """
+        Reads the cached results from disk. A missing, unreadable or outdated
+        cache leaves it empty, so that every file is scanned.
+        """
+        try:
+            fp = open(self.path, 'rb')
+        except IOError:
+            return False
+        try:
+            try:
+                cached = json.load(fp)
+                if cached['version'] != CACHE_VERSION or cached['fingerprint'] != self.fingerprint:
+                    logger.info('Lint cache %s does not match the current content, ignoring it' % self.path)
+                    return False
+                self.files = dict([(file_path.encode('latin-1'), FileRecord.from_json(record))
+                                   for file_path, record in cached['files'].items()])
+            except Exception, e:
+                logger.debug('Ignoring unreadable lint cache %s: %s' % (self.path, e))
+                return False
+        finally:
+            fp.close()
+        return True
+
+    def get_file(self, file_path):
+        return self.files.get(os.path.abspath(file_path))
+
+    def set_file(self, file_path, record):
+        self.files[os.path.abspath(file_path)] = record
+
+    def save(self, file_paths=None):
+        """
+        Writes the cached results of the files in file_paths, or of every file
+        if not given. Returns False if they could not be written.
+        """
+        if file_paths is not None:
+            file_paths = set([os.path.abspath(file_path) for file_path in file_paths])
+            self.files = dict((file_path, record) for file_path, record in self.files.items()
+                              if file_path in file_paths)
+        cache_dir = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(cache_dir):
+                # Results include lines of the scanned files
+                os.makedirs(cache_dir, 0700)
+            atomic_write(self.path, json.dumps({
+                'version': CACHE_VERSION,
+                'fingerprint': self.fingerprint,
+                'files': dict([(file_path.decode('latin-1'), record.to_json())
+                               for file_path, record in self.files.items()]),
+            }))
+        except (IOError, OSError), e:
+            logger.warning('Unable to write lint cache %s: %s' % (self.path, e))
+            return False
+        return True
@@ -1,77 +1,210 @@
 import re
 import os
+import mmap
+import subprocess
+import bisect
+from array import array
+
+try:
+    import multiprocessing
+except ImportError:
+    # Python 2.5 and prior can only scan files one at a time
+    multiprocessing = None
 
 from commons import UsageError
 
+import log_mgr
+import scan_cache
+logger = log_mgr.mods.add_mod(__name__)
+
 LINE_SEP_RE = re.compile('\n')
 SHOW_LINES = 1
+# Number of bytes scanned from the start of each file by default
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+# Number of files handed to a scan_workers process at a time
+SCAN_CHUNK_SIZE = 32
 TEXT_CHARS = ''.join(map(chr, [7,8,9,10,12,13,27] + range(0x20, 0x100)))
 
 is_binary_string = lambda bytes: bool(bytes.translate(None, TEXT_CHARS))
 
+# The settings, compiled content and lint cache of a scan_workers process
+_worker_settings = None
+_worker_content = None
+_worker_scan_cache = None
+
+
+def _init_scan_worker(settings, content, file_cache):
+    """ The content is handed to each scan_workers process once, rather than with every file """
+    global _worker_settings, _worker_content, _worker_scan_cache
+    _worker_settings = settings
+    _worker_content = content
+    _worker_scan_cache = file_cache
+
+
+def _scan_file(config, content, file_path, file_cache):
+    file_scanner = FileScanner(config, content, file_path, file_cache)
+    match_list = file_scanner.find_matches()
+    return file_path, match_list, file_scanner.ctxrules_evaluated, file_scanner.file_record
+
+
+def _scan_file_worker(file_path):
+    """ Scans a single file in a scan_workers process """
+    return _scan_file(_worker_settings, _worker_content, file_path, _worker_scan_cache)
+
+
+def print_scan_banner(file_path):
+    print "=== Scanning: %s ===" % (file_path.ljust(35))
+
+
+def print_file_matches(content, file_path, match_list):
+    if not match_list:
+        return
+    print "====================================================="
+    print "Tasks for file %s:" % (file_path)
+    for item in match_list:
+        print "  %s" % (content.content[item]['title'])
+        print "  Reasons: %s" % (match_list[item][0])
+        print
+
+
 class FileScanner:
-    def __init__(self, config, content, file_path):
+    def __init__(self, config, content, file_path, file_cache=None):
         self.config = config
         self.content = content
         self.file_path = file_path
+        self.file_cache = file_cache
+        # The state and matches of the file to store in file_cache
+        self.file_record = None
         self.file_name = os.path.basename(self.file_path)
         self.file_type = os.path.splitext(self.file_name)[1].lstrip('.')
         self.match_list = {}
         self.fval = None
-        self.line_info = []
+        self.mapped_file = None
+        # Offsets of the line separators, computed once a pattern is found
+        self.line_ends = None
+        self.pattern_spans = None
+        self.ctxrules_evaluated = 0
 
     def load_file(self):
+        """ Maps the first scan_max_file_size bytes of the file into memory """
         try:
-            fp = open(self.file_path, 'r')
+            fp = open(self.file_path, 'rb')
         except:
             return False
 
-        # Scans the first 1 Megabyte
-        self.fval = fp.read(1024*1024)
+        try:
+            try:
+                size = min(os.fstat(fp.fileno()).st_size, int(self.config['scan_max_file_size']))
+                if size:
+                    self.mapped_file = mmap.mmap(fp.fileno(), size, access=mmap.ACCESS_READ)
+                    self.fval = self.mapped_file
+                else:
+                    # Empty files can not be mapped
+                    self.fval = ''
+            except (EnvironmentError, ValueError):
+                return False
+        finally:
+            fp.close()
+
         # Check first 1K to see if file is binary
         self.is_binary = is_binary_string(self.fval[:1024])
+        return True
+
+    def close(self):
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+            self.mapped_file = None
+        self.fval = None
 
-        line_start_pos = 0
-        line_number = 1
-        for x in LINE_SEP_RE.finditer(self.fval):
-            self.line_info.append((line_start_pos, x.start(), line_number))
-            line_start_pos = x.end()
-            line_number += 1
+    def _get_line_ends(self):
+        if self.line_ends is None:
+            self.line_ends = array('l', (x.start() for x in LINE_SEP_RE.finditer(self.fval)))
+        return self.line_ends
 
-        fp.close()
-        return True
+    def _get_line(self, line_number):
+        """ Returns the text of a line (numbered from 1) ended by a line separator """
+        line_ends = self._get_line_ends()
+        if line_number == 1:
+            line_start = 0
+        else:
+            line_start = line_ends[line_number-2] + 1
+        return self.fval[line_start:line_ends[line_number-1]]
 
     def locate_regex(self, regex):
-        match = regex.search(self.fval)
-        if not match:
+        matcher = self.content.get_pattern_matcher(self.file_name, self.file_type)
+        if regex in matcher.regexes:
+            if self.pattern_spans is None:
+                # The patterns of every candidate rule set are searched for at once
+                self.pattern_spans = matcher.search(self.fval)
+            span = self.pattern_spans.get(regex)
+        else:
+            match = regex.search(self.fval)
+            span = match and match.span()
+        if not span:
             return None
-        if not self.line_info:
+        line_ends = self._get_line_ends()
+        line_count = len(line_ends)
+        if not line_count:
             return None
 
-        pattern_start, pattern_end = match.span()
+        pattern_start, pattern_end = span
+        # The first line that ends at or after the start of the match
         start_line = 1
-        end_line = len(self.line_info)
-        for start_pos, end_pos, line_number in self.line_info:
-            if end_pos >= pattern_start:
-                start_line = max(line_number-SHOW_LINES, 1)
-                break
-        for start_pos, end_pos, line_number in reversed(self.line_info):
-            if start_pos <= pattern_end:
-                end_line = min(line_number+SHOW_LINES+1, len(self.line_info))
-                break
+        first_line_index = bisect.bisect_left(line_ends, pattern_start)
+        if first_line_index < line_count:
+            start_line = max(first_line_index+1-SHOW_LINES, 1)
+        # The last line that starts at or before the end of the match
+        last_line = min(bisect.bisect_left(line_ends, pattern_end) + 1, line_count)
+        end_line = min(last_line+SHOW_LINES+1, line_count)
+
         ret = []
-        #print start_line, end_line, pattern_start, pattern_end
-        for start_pos, end_pos, line_number in self.line_info[start_line-1:end_line-1]:
-            ret.append((line_number, self.fval[start_pos:end_pos]))
+        for line_number in xrange(start_line, end_line):
+            ret.append((line_number, self._get_line(line_number)))
         return ret
 
-    def scan(self):
+    def find_matches(self):
+        """ Returns the reasons for matching each task, keyed by task """
+        ctxsets = self.content.get_candidate_ctxrules(self.file_name, self.file_type)
+        if not ctxsets:
+            # No need to read a file that no rule set can match
+            return self.match_list
+
+        if self.file_cache is not None:
+            try:
+                file_stat = os.stat(self.file_path)
+            except OSError:
+                return self.match_list
+            cached_record = self.file_cache.get_file(self.file_path)
+            if cached_record and (cached_record.size, cached_record.mtime) == (file_stat.st_size, file_stat.st_mtime):
+                # Unchanged since it was last scanned
+                return cached_record.match_list
+
         if self.fval is None:
             stat = self.load_file()
             if not stat:
-                return None
+                return self.match_list
+
+        try:
+            if self.file_cache is None:
+                self._match_ctxrules(ctxsets)
+            else:
+                self._match_cached_ctxrules(ctxsets, file_stat, cached_record)
+        finally:
+            self.close()
+        return self.match_list
 
-        for ctxset in self.content.ctxrules:
+    def _match_cached_ctxrules(self, ctxsets, file_stat, cached_record):
+        """ Reuses the cached matches if the content of the file is unchanged, or finds them again """
+        content_hash = scan_cache.get_content_hash(self.fval)
+        if cached_record and (cached_record.size, cached_record.content_hash) == (file_stat.st_size, content_hash):
+            self.match_list = cached_record.match_list
+        else:
+            self._match_ctxrules(ctxsets)
+        self.file_record = scan_cache.FileRecord(file_stat.st_size, file_stat.st_mtime, content_hash, self.match_list)
+
+    def _match_ctxrules(self, ctxsets):
+        self.ctxrules_evaluated = len(ctxsets)
+        for ctxset in ctxsets:
             matched_file = True
             matched_reason = []
             for ctx in ctxset['required']:
@@ -122,20 +255,22 @@ class FileScanner:
                 if task_ref not in self.match_list:
                     self.match_list[task_ref] = []
                 self.match_list[task_ref].append(' AND '.join(matched_reason))
-        if self.match_list:
-            print "====================================================="
-            print "Tasks for file %s:" % (self.file_path)
-            for item in self.match_list:
-                print "  %s" % (self.content.content[item]['title'])
-                print "  Reasons: %s" % (self.match_list[item][0])
-                print
 
-        return
+    def scan(self):
+        print_file_matches(self.content, self.file_path, self.find_matches())
 
 class Scanner:
     def __init__(self, config):
         self.config = config
         self.content = None
+        config.opts.add('scan_workers', 'Number of files to scan in parallel processes', default='1')
+        config.opts.add('scan_max_file_size', 'Maximum number of bytes scanned from the start of each file',
+                        default=str(DEFAULT_MAX_FILE_SIZE))
+        config.opts.add('scan_cache_dir', 'Directory for lint results kept between scans (empty to disable the cache)',
+                        default=scan_cache.DEFAULT_CACHE_DIR)
+        config.opts.add('changed_since', 'Only scan the files changed since this git commit, branch or tag',
+                        meta_var='GIT_REF')
+        self.changed_files = None
 
     def set_targets(self, targets):
         """
@@ -160,24 +295,147 @@ class Scanner:
         file_scanner = FileScanner(self.config, self.content, file_path)
         file_scanner.scan()
 
-    def scan(self):
-        if self.content is None:
-            raise UsageError('Missing content: Set content before using scanner.')
-        file_paths = []
+    def _run_git(self, work_dir, git_args):
+        try:
+            proc = subprocess.Popen(['git'] + git_args, cwd=work_dir, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        except OSError, e:
+            raise UsageError('Unable to run git to find the changed files: %s' % e)
+        output, error = proc.communicate()
+        if proc.returncode:
+            raise UsageError('Unable to find the files changed since %s: %s' %
+                             (self.config['changed_since'], error.strip()))
+        return output
+
+    def get_changed_files(self):
+        """
+        Returns the real paths of the files in the git work trees of the targets
+        that changed since the changed_since commit, including untracked files.
+        """
+        changed_files = set()
+        for target in self.targets:
+            work_dir = target
+            if not os.path.isdir(work_dir):
+                work_dir = os.path.dirname(os.path.abspath(target))
+            top_dir = self._run_git(work_dir, ['rev-parse', '--show-toplevel']).splitlines()[0]
+            # NUL separated names are not quoted, so names with any characters come through as they are
+            file_names = (self._run_git(top_dir, ['-c', 'core.quotepath=off', 'diff', '--name-only', '-z',
+                                                  self.config['changed_since'], '--']) +
+                          self._run_git(top_dir, ['ls-files', '-z', '--others', '--exclude-standard']))
+            for file_name in file_names.split('\0'):
+                if file_name:
+                    changed_files.add(os.path.realpath(os.path.join(top_dir, file_name)))
+        return changed_files
+
+    def iter_file_paths(self):
+        """ Yields the files to scan as they are found, in name order within each directory """
+        for file_path in self._iter_target_paths():
+            if self.changed_files is None or os.path.realpath(file_path) in self.changed_files:
+                yield file_path
+
+    def _iter_target_paths(self):
         for target in self.targets:
             if not os.path.isdir(target):
-                file_paths.append(target)
+                yield target
                 continue
             for (dirpath, dirnames, filenames) in os.walk(target):
                 if self.config['skip_hidden']:
                     for dirname in reversed(dirnames):
                         if dirname.startswith('.'):
                             dirnames.remove(dirname)
-                for file_name in filenames:
-                    file_path = os.path.join(dirpath, file_name)
-                    file_paths.append(file_path)
+                dirnames.sort()
+                for file_name in sorted(filenames):
+                    yield os.path.join(dirpath, file_name)
+
+    def _get_scan_workers(self):
+        try:
+            scan_workers = int(self.config['scan_workers'])
+        except (TypeError, ValueError):
+            raise UsageError('Incorrect scan_workers specified in configuration. Valid values are > 0')
+        if scan_workers < 1:
+            raise UsageError('Incorrect scan_workers specified in configuration. Valid values are > 0')
+        if scan_workers > 1 and multiprocessing is None:
+            logger.warning('Parallel scanning is not available. Scanning files one at a time')
+            scan_workers = 1
+        return scan_workers
+
+    def _check_max_file_size(self):
+        try:
+            max_file_size = int(self.config['scan_max_file_size'])
+        except (TypeError, ValueError):
+            raise UsageError('Incorrect scan_max_file_size specified in configuration. Valid values are > 0')
+        if max_file_size < 1:
+            raise UsageError('Incorrect scan_max_file_size specified in configuration. Valid values are > 0')
 
+    def get_scan_cache(self):
+        """ Returns the lint results kept from the last scan of the targets, or None if disabled """
+        self.config.process_boolean_config('no_cache')
+        if self.config['no_cache'] or not self.config['scan_cache_dir']:
+            return None
+        fingerprint = scan_cache.get_content_fingerprint(self.content, {
+            'scan_max_file_size': int(self.config['scan_max_file_size']),
+            'show_lines': SHOW_LINES,
+        })
+        file_cache = scan_cache.ScanCache(scan_cache.get_cache_path(self.config['scan_cache_dir'], self.targets),
+                                          fingerprint)
+        file_cache.load()
+        return file_cache
+
+    def _scan_files(self, file_paths, file_cache):
         for file_path in file_paths:
-            print "=== Scanning: %s ===" % (file_path.ljust(35))
-            file_scanner = FileScanner(self.config, self.content, file_path)
-            file_scanner.scan()
+            print_scan_banner(file_path)
+            yield _scan_file(self.config, self.content, file_path, file_cache)
+
+    def _scan_files_in_pool(self, file_paths, scan_workers, file_cache):
+        """
+        Scans the files with a pool of scan_workers processes as they are found.
+        The results come back in the same order as the files.
+        """
+        logger.info('Scanning with %d workers' % scan_workers)
+        pool = multiprocessing.Pool(scan_workers, _init_scan_worker,
+                                    (self.config.settings.copy(), self.content, file_cache))
+        try:
+            for result in pool.imap(_scan_file_worker, file_paths, SCAN_CHUNK_SIZE):
+                # The workers scan ahead, so the banner can only come with the result
+                print_scan_banner(result[0])
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def scan(self):
+        if self.content is None:
+            raise UsageError('Missing content: Set content before using scanner.')
+
+        scan_workers = self._get_scan_workers()
+        self._check_max_file_size()
+        if self.config['changed_since']:
+            self.changed_files = self.get_changed_files()
+        else:
+            self.changed_files = None
+        file_cache = self.get_scan_cache()
+
+        if scan_workers > 1:
+            results = self._scan_files_in_pool(self.iter_file_paths(), scan_workers, file_cache)
+        else:
+            results = self._scan_files(self.iter_file_paths(), file_cache)
+
+        file_paths = []
+        ctxrules_evaluated = 0
+        for file_path, match_list, file_ctxrules_evaluated, file_record in results:
+            print_file_matches(self.content, file_path, match_list)
+            file_paths.append(file_path)
+            ctxrules_evaluated += file_ctxrules_evaluated
+            if file_record is not None:
+                file_cache.set_file(file_path, file_record)
+
+        logger.debug('Evaluated %d context rule sets for %d files (%d without the rule set index)' %
+                     (ctxrules_evaluated, len(file_paths), len(file_paths) * len(self.content.ctxrules)))
+
+        if file_cache is not None:
+            if self.changed_files is None:
+                # Results of the files that are no longer found are dropped
+                file_cache.save(file_paths)
+            else:
+                file_cache.save()
@@ -1,5 +1,6 @@
 from commons import UsageError, json
 import restclient
+import http_cache
 
 import logging
 logger = logging.getLogger(__name__)
@@ -21,9 +22,20 @@ class ExtAPI(restclient.RESTBase):
     """
 
     def __init__(self, config):
-        extra_conf_opts = [('sde_api_token', 'SDE API Token', '')]
+        extra_conf_opts = [
+            ('sde_api_token', 'SDE API Token', ''),
+            ('sde_cache_dir', 'Directory for cached SD Elements API responses (empty to disable the cache)',
+                http_cache.DEFAULT_CACHE_DIR),
+            ('sde_cache_ttl', 'Seconds for which cached phases and task statuses are used without '
+                'checking with SD Elements', '0'),
+            ('sde_cache_max_entries', 'Maximum number of cached SD Elements API responses',
+                str(http_cache.DEFAULT_MAX_ENTRIES)),
+            ('sde_cache_max_size', 'Maximum size of the cached SD Elements API responses (in MB)',
+                str(http_cache.DEFAULT_MAX_SIZE / (1024 * 1024))),
+        ]
         super(ExtAPI, self).__init__('sde', 'SD Elements', config, 'api', extra_conf_opts)
         self.connected = False
+        self.reference_cache_ttl = 0
 
     def post_conf_init(self):
         if self._get_conf('api_token'):
@@ -35,6 +47,26 @@ class ExtAPI(restclient.RESTBase):
             self.set_auth_mode('api_token')
 
         super(ExtAPI, self).post_conf_init()
+        self._setup_response_cache()
+
+    def _setup_response_cache(self):
+        """
+        Applications, projects and tasks are cached and revalidated on every
+        read. Phases and task statuses rarely change and are used for
+        sde_cache_ttl seconds before they are revalidated.
+        """
+        self.config.process_boolean_config('no_cache')
+        if self.config['no_cache'] or not self._get_conf('cache_dir'):
+            self.response_cache = None
+            return
+
+        try:
+            self.reference_cache_ttl = int(self._get_conf('cache_ttl'))
+            max_entries = int(self._get_conf('cache_max_entries'))
+            max_size = int(self._get_conf('cache_max_size')) * 1024 * 1024
+        except ValueError, err:
+            raise UsageError('Invalid SD Elements cache configuration: %s' % err)
+        self.response_cache = http_cache.ResponseCache(self._get_conf('cache_dir'), max_entries, max_size)
 
     def connect(self):
         if self.config['authmode'] == 'session':
@@ -55,7 +87,7 @@ class ExtAPI(restclient.RESTBase):
             name -> application name to be searched for
         """
         result = self.call_api('applications', args=filters,
-                call_headers=_encode_options(options))
+                call_headers=_encode_options(options), cache_ttl=0)
         return result['applications']
 
     def create_application(self, name):
@@ -72,7 +104,7 @@ class ExtAPI(restclient.RESTBase):
         args = {'application': application}
         args.update(filters)
         result = self.call_api('projects', args=args,
-                call_headers=_encode_options(options))
+                call_headers=_encode_options(options), cache_ttl=0)
         return result['projects']
 
     def get_tasks(self, project, options={}, **filters):
@@ -81,7 +113,7 @@ class ExtAPI(restclient.RESTBase):
         """
         args = {'project': project}
         args.update(filters)
-        result = self.call_api('tasks', args=args, call_headers=_encode_options(options))
+        result = self.call_api('tasks', args=args, call_headers=_encode_options(options), cache_ttl=0)
         return result['tasks']
 
     def get_task(self, task, options={}, **filters):
@@ -161,13 +193,15 @@ class ExtAPI(restclient.RESTBase):
         """
         Get all statuses for an organization
         """
-        return self.call_api('taskstatuses', args=filters, call_headers=_encode_options(options))
+        return self.call_api('taskstatuses', args=filters, call_headers=_encode_options(options),
+                cache_ttl=self.reference_cache_ttl)
 
     def get_phases(self, options={}, **filters):
         """
         Get all phases for an organization
         """
-        return self.call_api('phases', args=filters, call_headers=_encode_options(options))
+        return self.call_api('phases', args=filters, call_headers=_encode_options(options),
+                cache_ttl=self.reference_cache_ttl)
 
 APIBase = ExtAPI
 
@@ -45,11 +45,13 @@ class MockRequest(object):
 
 class MockOpener(object):
     """ Mock http_req.get_opener """
-    def __init__(self, method, server, proxy, debuglevel):
+    def __init__(self, method, server, proxy, debuglevel, keep_alive=False):
         self.method = method
         self.server = server
         self.proxy = proxy
         self.debuglevel = debuglevel
+        self.keep_alive = keep_alive
+        self.connection_pool = None
         self.handles = {'cookiehandle': None, 'handles': []}
 
     def add_handler(self, handle):
@@ -74,8 +76,8 @@ class MockResponse(object):
         self.call_api_patch.start()
 
     @staticmethod
-    def mock_get_opener(method, server, proxy=None, debuglevel=0):
-        return MockOpener(method, server, proxy, debuglevel)
+    def mock_get_opener(method, server, proxy=None, debuglevel=0, keep_alive=False):
+        return MockOpener(method, server, proxy, debuglevel, keep_alive)
 
     def set_response_flags(self, _response_flags):
         if type(_response_flags) == dict:
@@ -276,6 +276,10 @@ class ResponseGenerator(object):
     def get_current_timestamp():
         return datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
 
+    @staticmethod
+    def get_current_utc_timestamp():
+        return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
     @staticmethod
     def is_data_valid(data, fields=None):
         """Check if the data param of a URL request contains the fields in fields"""
@@ -0,0 +1,202 @@
+import errno
+import socket
+import httplib
+import urllib2
+import unittest
+import threading
+import StringIO
+import BaseHTTPServer
+
+from sdetools.extlib import http_req
+# Bound at import, as other tests patch http_req.get_opener
+from sdetools.extlib.http_req import get_opener
+
+
+class FakeResponse(object):
+    def __init__(self):
+        self.status = 200
+        self.reason = 'OK'
+        self.msg = httplib.HTTPMessage(StringIO.StringIO(''))
+        self.will_close = False
+
+    def read(self):
+        return '{}'
+
+
+class FakeConnection(object):
+    """ Records the methods of the requests sent on it, failing them with the errors in errors """
+    instances = []
+
+    def __init__(self, host, timeout=None):
+        self.host = host
+        self.methods = []
+        self.errors = []
+        self.closed = False
+        FakeConnection.instances.append(self)
+
+    def set_debuglevel(self, level):
+        pass
+
+    def request(self, method, selector, data, headers):
+        self.methods.append(method)
+
+    def getresponse(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        return FakeResponse()
+
+    def close(self):
+        self.closed = True
+
+
+class RecordingRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    client_ports = []
+
+    def do_GET(self):
+        RecordingRequestHandler.client_ports.append(self.client_address[1])
+        body = '{}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ClosingRequestHandler(RecordingRequestHandler):
+    """ Closes the connection after a GET without telling the client, as an idle timeout does """
+
+    def do_GET(self):
+        RecordingRequestHandler.do_GET(self)
+        self.close_connection = 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        RecordingRequestHandler.do_GET(self)
+
+
+class ClosingHTTPServer(BaseHTTPServer.HTTPServer):
+    def __init__(self, *args):
+        BaseHTTPServer.HTTPServer.__init__(self, *args)
+        self.connection_closed = threading.Event()
+
+    def shutdown_request(self, request):
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+        self.connection_closed.set()
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_eviction(self):
+        pool = http_req.ConnectionPool(max_size=1)
+        first_conn = FakeConnection('example.com')
+        second_conn = FakeConnection('example.com')
+        pool.put('example.com', first_conn)
+        pool.put('example.com', second_conn)
+        self.assertTrue(second_conn.closed)
+
+        self.assertEqual(pool.get('example.com'), first_conn)
+        self.assertEqual(pool.get('example.com'), None)
+        self.assertEqual(pool.get_stats(), {'hits': 1, 'misses': 1, 'evictions': 1, 'idle': 0})
+
+    def test_idle_timeout(self):
+        pool = http_req.ConnectionPool(idle_timeout=-1)
+        conn = FakeConnection('example.com')
+        pool.put('example.com', conn)
+        self.assertEqual(pool.get('example.com'), None)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.get_stats()['evictions'], 1)
+
+
+class TestKeepAliveHandler(unittest.TestCase):
+
+    def setUp(self):
+        FakeConnection.instances = []
+        self.handler = http_req.KeepAliveHTTPHandler()
+
+    def open(self, data=None):
+        req = urllib2.Request('http://example.com/api/tasks', data)
+        req.timeout = 10
+        return self.handler.do_keep_alive_open(FakeConnection, req)
+
+    def test_reuse(self):
+        for i in xrange(3):
+            self.assertEqual(self.open().read(), '{}')
+        self.assertEqual(len(FakeConnection.instances), 1)
+        self.assertEqual(FakeConnection.instances[0].methods, ['GET', 'GET', 'GET'])
+        self.assertEqual(self.handler.connection_pool.get_stats()['hits'], 2)
+
+    def test_stale_connection_retry(self):
+        self.open()
+        stale_conn = FakeConnection.instances[0]
+        stale_conn.errors = [httplib.BadStatusLine('')]
+        self.assertEqual(self.open().read(), '{}')
+        self.assertTrue(stale_conn.closed)
+
+        reset_conn = FakeConnection.instances[1]
+        reset_conn.errors = [socket.error(errno.ECONNRESET, 'Connection reset by peer')]
+        self.assertEqual(self.open().read(), '{}')
+        self.assertEqual(len(FakeConnection.instances), 3)
+        self.assertEqual(FakeConnection.instances[2].methods, ['GET'])
+
+    def test_no_retry(self):
+        self.open()
+        pooled_conn = FakeConnection.instances[0]
+
+        # The server may already have received a POST
+        pooled_conn.errors = [httplib.BadStatusLine('')]
+        self.assertRaises(httplib.BadStatusLine, self.open, 'title=T1')
+        self.assertEqual(pooled_conn.methods, ['GET', 'POST'])
+        self.assertEqual(len(FakeConnection.instances), 1)
+
+        # A timeout does not show the connection was stale
+        self.open()
+        pooled_conn = FakeConnection.instances[1]
+        pooled_conn.errors = [socket.timeout('timed out')]
+        self.assertRaises(urllib2.URLError, self.open)
+        self.assertEqual(len(FakeConnection.instances), 2)
+
+    def test_get_opener(self):
+        RecordingRequestHandler.client_ports = []
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), RecordingRequestHandler)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.setDaemon(True)
+        server_thread.start()
+        try:
+            url = 'http://127.0.0.1:%d/api/tasks' % server.server_port
+            opener = get_opener('http', url, keep_alive=True)
+            self.assertEqual(opener.open(url).read(), '{}')
+            self.assertEqual(opener.open(url).read(), '{}')
+            opener.connection_pool.close_all()
+
+            self.assertEqual(len(RecordingRequestHandler.client_ports), 2)
+            self.assertEqual(len(set(RecordingRequestHandler.client_ports)), 1)
+            self.assertEqual(opener.connection_pool.get_stats()['hits'], 1)
+
+            self.assertEqual(get_opener('http', url).connection_pool, None)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_dropped_connection(self):
+        RecordingRequestHandler.client_ports = []
+        server = ClosingHTTPServer(('127.0.0.1', 0), ClosingRequestHandler)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.setDaemon(True)
+        server_thread.start()
+        try:
+            url = 'http://127.0.0.1:%d/api/tasks' % server.server_port
+            opener = get_opener('http', url, keep_alive=True)
+            self.assertEqual(opener.open(url).read(), '{}')
+            server.connection_closed.wait(5)
+
+            # A POST is not retried, so the closed connection must not be used
+            self.assertEqual(opener.open(url, 'title=T1').read(), '{}')
+            self.assertEqual(len(set(RecordingRequestHandler.client_ports)), 2)
+            self.assertEqual(opener.connection_pool.get_stats()['evictions'], 1)
+            opener.connection_pool.close_all()
+        finally:
+            server.shutdown()
+            server.server_close()
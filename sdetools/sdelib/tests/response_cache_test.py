@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+import urllib2
+import StringIO
+
+from mock import patch
+
+from sdetools.sdelib import http_cache, sdeapi
+from sdetools.sdelib.conf_mgr import Config
+from sdetools.sdelib.mod_mgr import ReturnChannel, load_modules
+
+
+class StubResponse(object):
+    def __init__(self, body, headers):
+        self.body = body
+        self.headers = headers
+
+    def read(self):
+        body = self.body
+        self.body = ''
+        return body
+
+    def close(self):
+        pass
+
+
+class StubOpener(object):
+    """ Answers every request with the same resource, honouring If-None-Match """
+
+    def __init__(self, method, server, proxy=None, debuglevel=0, keep_alive=False):
+        self.server = server
+        self.etag = '"v1"'
+        self.body = '{"phases": [{"id": "requirements"}]}'
+        self.requests = []
+
+    def open(self, req):
+        request_headers = dict(req.header_items())
+        self.requests.append(request_headers)
+        if request_headers.get('If-none-match') == self.etag:
+            raise urllib2.HTTPError(req.get_full_url(), 304, 'Not Modified', {}, StringIO.StringIO(''))
+        return StubResponse(self.body, {'etag': self.etag})
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.config = Config('help', '', load_modules(), [], ReturnChannel(lambda obj: None, {}), 'shell')
+        self.api = sdeapi.ExtAPI(self.config)
+        self.config.import_custom_options()
+        self.config['sde_api_token'] = 'token@sdelements.com'
+        self.config['sde_cache_dir'] = self.cache_dir
+        self.opener_patch = patch('sdetools.extlib.http_req.get_opener', StubOpener)
+        self.opener_patch.start()
+
+    def tearDown(self):
+        self.opener_patch.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_conditional_requests(self):
+        self.assertEqual(self.api.get_phases(), {'phases': [{'id': 'requirements'}]})
+        self.assertEqual(self.api.get_phases(), {'phases': [{'id': 'requirements'}]})
+
+        requests = self.api.opener.requests
+        self.assertEqual(len(requests), 2)
+        self.assertFalse('If-none-match' in requests[0])
+        self.assertEqual(requests[1]['If-none-match'], '"v1"')
+
+        # A changed resource replaces the cached one
+        self.api.opener.etag = '"v2"'
+        self.api.opener.body = '{"phases": []}'
+        self.assertEqual(self.api.get_phases(), {'phases': []})
+        self.assertEqual(self.api.get_phases(), {'phases': []})
+        self.assertEqual(self.api.opener.requests[-1]['If-none-match'], '"v2"')
+
+    def test_reference_data_ttl(self):
+        self.config['sde_cache_ttl'] = '60'
+        self.api.get_phases()
+        self.api.get_phases()
+        self.assertEqual(len(self.api.opener.requests), 1)
+
+        # Tasks are always revalidated
+        self.api.opener.body = '{"tasks": []}'
+        self.api.get_tasks(1)
+        self.api.get_tasks(1)
+        self.assertEqual(len(self.api.opener.requests), 3)
+
+    def _start_session(self, user, token):
+        self.api.post_conf_init()
+        self.config['sde_user'] = user
+        self.api.session_info = {'session-cookie-name': 'sessionid', 'session-token': token}
+        self.api._auth_mode = 'session'
+
+    def test_session_cache_key(self):
+        self.config['sde_cache_ttl'] = '60'
+        self._start_session('user@sdelements.com', 'session1')
+        self.api.get_phases()
+
+        # A new session of the same user uses the cached response
+        self._start_session('user@sdelements.com', 'session2')
+        self.api.get_phases()
+        self.assertEqual(len(self.api.opener.requests), 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        self._start_session('other@sdelements.com', 'session3')
+        self.api.get_phases()
+        self.assertEqual(len(self.api.opener.requests), 2)
+
+    def test_no_cache(self):
+        self.config['no_cache'] = True
+        self.api.get_phases()
+        self.api.get_phases()
+
+        self.assertEqual(self.api.response_cache, None)
+        self.assertFalse('If-none-match' in self.api.opener.requests[1])
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_lru_eviction(self):
+        cache = http_cache.ResponseCache(self.cache_dir, max_entries=2)
+        for key in ['a', 'b']:
+            self.assertTrue(cache.put(key, key, {'ETag': key}))
+        os.utime(cache._get_path('a'), (1000, 1000))
+        os.utime(cache._get_path('b'), (2000, 2000))
+
+        self.assertEqual(cache.get('a').body, 'a')
+        cache.put('c', 'c', {'ETag': 'c'})
+
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a').body, 'a')
+        self.assertEqual(cache.get('c').body, 'c')
+
+        # Any body is stored as it was received
+        body = '{"title": "\xc3\xa9"}\xff'
+        cache.put('e', body, {'ETag': '"e"'})
+        self.assertEqual(cache.get('e').body, body)
+        self.assertEqual(cache.get('e').headers, {'ETag': '"e"'})
+
+        # Responses that cannot be validated are only kept for a time to live
+        self.assertFalse(cache.put('d', 'd', {}))
+        self.assertTrue(cache.put('d', 'd', {}, ttl=60))
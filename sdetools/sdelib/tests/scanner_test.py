@@ -0,0 +1,264 @@
+import os
+import re
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+import StringIO
+import subprocess
+
+from mock import patch
+
+from sdetools.sdelib.commons import UsageError
+from sdetools.sdelib.conf_mgr import Config
+from sdetools.sdelib.content import Content, PatternMatcher
+from sdetools.sdelib.mod_mgr import ReturnChannel, load_modules
+from sdetools.sdelib.scanner import Scanner, FileScanner
+
+TASK_LIST = [
+    {
+        'id': '1-T1',
+        'title': 'T1: Avoid eval',
+        'contextrulesets': [{'required': [{'type': 'file-type', 'value': 'py'},
+                                          {'type': 'regex', 'value': 'eval\\('}],
+                             'excluded': []}],
+        'implementations': [],
+    },
+    {
+        'id': '1-T2',
+        'title': 'T2: Protect settings',
+        'contextrulesets': [{'required': [{'type': 'file-name', 'value': 'settings.py'}],
+                             'excluded': []}],
+        'implementations': [
+            {
+                'id': 'I1',
+                'title': 'I1: Django',
+                'contextrulesets': [{'required': [{'type': 'import', 'value': 'django.*'}],
+                                     'excluded': [{'type': 'file-type', 'value': 'txt'}]}],
+            },
+        ],
+    },
+]
+
+FILES = {
+    'app/settings.py': 'DEBUG = True\n',
+    'app/views.py': 'import django.http\n\ndef view(request):\n    return eval(request.body)\n\n\ndef index():\n    pass\n',
+    'app/notes.txt': 'import django.http\neval(x)\n',
+    'lib/util.py': 'def add(a, b):\n    return a + b\n',
+    '.hidden/secret.py': 'eval(x)\n',
+}
+
+
+class TestScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp()
+        for file_path, text in FILES.items():
+            file_path = os.path.join(self.target_dir, file_path)
+            if not os.path.isdir(os.path.dirname(file_path)):
+                os.makedirs(os.path.dirname(file_path))
+            fp = open(file_path, 'w')
+            fp.write(text)
+            fp.close()
+
+        self.config = Config('help', '', load_modules(), [], ReturnChannel(lambda obj: None, {}), 'shell')
+        self.scanner = Scanner(self.config)
+        self.config.import_custom_options()
+        self.config['scan_cache_dir'] = ''
+        self.content = Content(None)
+        self.content.import_task_list(TASK_LIST)
+        self.scanner.set_content(self.content)
+        self.scanner.set_targets([self.target_dir])
+
+    def tearDown(self):
+        shutil.rmtree(self.target_dir)
+
+    def get_matches(self, file_path):
+        return FileScanner(self.config, self.content, os.path.join(self.target_dir, file_path)).find_matches()
+
+    def scan_output(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            self.scanner.scan()
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_find_matches(self):
+        self.assertEqual(sorted(self.get_matches('app/views.py').keys()), ['T1', 'T2'])
+        self.assertEqual(self.get_matches('app/settings.py').keys(), ['T2'])
+        self.assertEqual(self.get_matches('app/notes.txt'), {})
+        self.assertEqual(self.get_matches('lib/util.py'), {})
+        self.assertEqual(self.get_matches('missing.py'), {})
+
+        reason = self.get_matches('app/views.py')['T1'][0]
+        self.assertTrue(reason.startswith("File Type is py AND Pattern 'eval\\(' found below:"))
+        self.assertTrue(reason.endswith('      3: def view(request):\n      4:     return eval(request.body)\n      5: '))
+
+    def test_ctxrule_index(self):
+        def get_candidate_refs(file_name, file_type):
+            return [ctxset['ref'] for ctxset in self.content.get_candidate_ctxrules(file_name, file_type)]
+
+        self.assertEqual(get_candidate_refs('views.py', 'py'), ['T1', 'I1'])
+        self.assertEqual(get_candidate_refs('settings.py', 'py'), ['T1', 'T2', 'I1'])
+        self.assertEqual(get_candidate_refs('notes.txt', 'txt'), ['I1'])
+
+        file_scanner = FileScanner(self.config, self.content, os.path.join(self.target_dir, 'app/views.py'))
+        indexed_matches = file_scanner.find_matches()
+        self.assertEqual(file_scanner.ctxrules_evaluated, 2)
+
+        # Checking every rule set finds the same matches
+        self.content.get_candidate_ctxrules = lambda file_name, file_type: self.content.ctxrules
+        self.assertEqual(self.get_matches('app/views.py'), indexed_matches)
+
+    def test_locate_regex(self):
+        file_scanner = FileScanner(self.config, self.content, os.path.join(self.target_dir, 'app/views.py'))
+        file_scanner.load_file()
+        self.assertEqual(file_scanner.locate_regex(re.compile('import')), [(1, 'import django.http'), (2, '')])
+        self.assertEqual(file_scanner.locate_regex(re.compile('eval')),
+                         [(3, 'def view(request):'), (4, '    return eval(request.body)'), (5, '')])
+        self.assertEqual(file_scanner.locate_regex(re.compile('view.*\n.*eval')),
+                         [(2, ''), (3, 'def view(request):'), (4, '    return eval(request.body)'), (5, '')])
+        self.assertEqual(file_scanner.locate_regex(re.compile('pass\n')),
+                         [(7, 'def index():')])
+        self.assertEqual(file_scanner.locate_regex(re.compile('missing')), None)
+        file_scanner.close()
+
+    def test_max_file_size(self):
+        # Only the import on the first line of the file is scanned
+        self.config['scan_max_file_size'] = '20'
+        self.assertEqual(self.get_matches('app/views.py').keys(), ['T2'])
+        self.assertEqual(self.get_matches('app/settings.py').keys(), ['T2'])
+
+        self.config['scan_max_file_size'] = '0'
+        self.assertRaises(UsageError, self.scanner.scan)
+
+    def test_file_order(self):
+        scanned_files = [os.path.relpath(file_path, self.target_dir) for file_path in self.scanner.iter_file_paths()]
+        self.assertEqual(scanned_files, ['app/notes.txt', 'app/settings.py', 'app/views.py', 'lib/util.py'])
+
+    def test_scan_banner(self):
+        # The serial scan names each file before scanning it
+        last_lines = []
+
+        def find_matches(file_scanner):
+            last_lines.append(sys.stdout.getvalue().splitlines()[-1])
+            return {}
+
+        find_matches_patch = patch.object(FileScanner, 'find_matches', find_matches)
+        find_matches_patch.start()
+        try:
+            self.scan_output()
+        finally:
+            find_matches_patch.stop()
+        self.assertEqual(len(last_lines), 4)
+        self.assertTrue(last_lines[0].startswith('=== Scanning: %s' % os.path.join(self.target_dir, 'app', 'notes.txt')))
+
+    def write_file(self, file_path, text):
+        fp = open(os.path.join(self.target_dir, file_path), 'w')
+        fp.write(text)
+        fp.close()
+
+    def test_scan_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.config['scan_cache_dir'] = cache_dir
+
+        first_output = self.scan_output()
+        cached_files = [os.path.relpath(file_path, self.target_dir)
+                        for file_path in self.scanner.get_scan_cache().files]
+        self.assertEqual(sorted(cached_files), ['app/notes.txt', 'app/settings.py', 'app/views.py', 'lib/util.py'])
+
+        # Unchanged files reuse the matches found in the first scan
+        match_patch = patch.object(FileScanner, '_match_ctxrules')
+        match_ctxrules = match_patch.start()
+        try:
+            self.assertEqual(self.scan_output(), first_output)
+        finally:
+            match_patch.stop()
+        self.assertFalse(match_ctxrules.called)
+
+        # Only the content of a file whose modification time changed is checked
+        views_path = os.path.join(self.target_dir, 'app', 'views.py')
+        os.utime(views_path, (1000, 1000))
+        file_scanner = FileScanner(self.config, self.content, views_path, self.scanner.get_scan_cache())
+        self.assertEqual(sorted(file_scanner.find_matches().keys()), ['T1', 'T2'])
+        self.assertEqual(file_scanner.ctxrules_evaluated, 0)
+        self.assertEqual(file_scanner.file_record.mtime, 1000)
+
+        self.write_file('app/views.py', 'import django.http\n\n')
+        self.assertEqual(self.get_matches('app/views.py').keys(), ['T2'])
+        self.assertFalse('T1' in self.scan_output())
+
+        # Other context rule sets or scan settings invalidate the cache
+        self.config['scan_max_file_size'] = '20'
+        self.assertEqual(self.scanner.get_scan_cache().files, {})
+        self.config['no_cache'] = True
+        self.assertEqual(self.scanner.get_scan_cache(), None)
+
+    def test_changed_since(self):
+        def git(*git_args):
+            proc = subprocess.Popen(('git',) + git_args, cwd=self.target_dir,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            proc.communicate()
+            self.assertEqual(proc.returncode, 0)
+
+        git('init', '-q')
+        git('add', 'app')
+        git('-c', 'user.name=sdetools', '-c', 'user.email=sdetools@sdelements.com', 'commit', '-q', '-m', 'app')
+        self.write_file('app/views.py', 'eval(x)\n')
+        # git quotes names like this one unless asked not to
+        self.write_file('lib/caf\xc3\xa9.py', 'eval(x)\n')
+
+        self.config['changed_since'] = 'HEAD'
+        output = self.scan_output()
+        scanned_files = [line for line in output.splitlines() if line.startswith('=== Scanning:')]
+        self.assertEqual(len(scanned_files), 3)
+        self.assertTrue(os.path.join('app', 'views.py') in scanned_files[0])
+        self.assertTrue(os.path.join('lib', 'caf\xc3\xa9.py') in scanned_files[1])
+        self.assertTrue(os.path.join('lib', 'util.py') in scanned_files[2])
+
+        self.config['changed_since'] = 'missing-ref'
+        self.assertRaises(UsageError, self.scanner.scan)
+
+    def test_parallel_scan(self):
+        serial_output = self.scan_output()
+
+        self.config['scan_workers'] = '3'
+        self.assertEqual(self.scan_output(), serial_output)
+        self.assertTrue('Tasks for file %s' % os.path.join(self.target_dir, 'app', 'views.py') in serial_output)
+
+        self.config['scan_workers'] = '0'
+        self.assertRaises(UsageError, self.scanner.scan)
+
+
+class TestPatternMatcher(unittest.TestCase):
+
+    def assertSameSpans(self, regexes, text):
+        expected = {}
+        for regex in regexes:
+            match = regex.search(text)
+            if match:
+                expected[regex] = match.span()
+        self.assertEqual(PatternMatcher(regexes).search(text), expected)
+
+    def test_overlapping_patterns(self):
+        regexes = [re.compile(pattern) for pattern in
+                   ['import\\s+(os|sys)', 'os', 'eval\\(', 'val', 'x*', '^import', 'sys$', '(\\w)\\1',
+                    '(?i)EVAL', '(?P<name>md5)']]
+        self.assertSameSpans(regexes, 'import os\nx = eval(y)\nimport sys')
+        self.assertSameSpans(regexes, 'hello')
+        self.assertSameSpans(regexes, '')
+
+        random.seed(0)
+        for i in xrange(200):
+            text = ''.join([random.choice('imports vxe(l\n') for j in xrange(40)])
+            self.assertSameSpans(regexes, text)
+
+    def test_many_patterns(self):
+        regexes = [re.compile('(a)%d' % number) for number in xrange(120)]
+        matcher = PatternMatcher(regexes)
+        self.assertEqual(len(matcher.combined), 3)
+        self.assertSameSpans(regexes, ' '.join(['a%d' % number for number in xrange(0, 120, 7)]))